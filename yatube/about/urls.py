@@ -1,10 +1,19 @@
 from django.urls import path
 
+from core.cache_control import STATIC, cache_policy
 from . import views
 
 app_name = 'about'
 
 urlpatterns = [
-    path('author/', views.AboutAuthorView.as_view(), name='author'),
-    path('tech/', views.AboutTechView.as_view(), name='tech'),
+    path(
+        'author/',
+        cache_policy(STATIC)(views.AboutAuthorView.as_view()),
+        name='author'
+    ),
+    path(
+        'tech/',
+        cache_policy(STATIC)(views.AboutTechView.as_view()),
+        name='tech'
+    ),
 ]
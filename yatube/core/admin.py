@@ -0,0 +1,32 @@
+from django.contrib import admin
+
+from .models import Blob, Task
+
+
+class TaskAdmin(admin.ModelAdmin):
+    """Класс для просмотра очереди фоновых задач в админке."""
+
+    list_display = (
+        'pk',
+        'name',
+        'status',
+        'attempts',
+        'run_at',
+        'created',
+    )
+    list_filter = ('status', 'name')
+    search_fields = ('key',)
+    empty_value_display = '-пусто-'
+
+
+admin.site.register(Task, TaskAdmin)
+
+
+class BlobAdmin(admin.ModelAdmin):
+    """Класс для просмотра ссылок на файлы изображений в админке."""
+
+    list_display = ('name', 'refs')
+    search_fields = ('name',)
+
+
+admin.site.register(Blob, BlobAdmin)
@@ -0,0 +1,93 @@
+"""Аутентификация без запросов к базе в установившемся режиме.
+
+`AuthenticationMiddleware` берет пользователя сессии из LRU-кэша в памяти
+процесса вместо запроса к `auth_user` на каждый запрос. Кэш хранит
+пользователя вместе с его версией из общего кэша `USER_CACHE`:
+сохранение пользователя (смена или сброс пароля через `users.urls`,
+правка в админке, вход) меняет версию, и все процессы перечитывают его
+из базы при следующем запросе. Хэш сессии сверяется с паролем, как в
+`django.contrib.auth`, так что старые сессии после смены пароля перестают
+действовать.
+
+Без общего кэша (`REDIS_LOCATION` не задан) версии негде хранить так,
+чтобы их видели все процессы, поэтому `USER_CACHE` пуст и пользователь
+читается из базы на каждый запрос.
+"""
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import (
+    BACKEND_SESSION_KEY, HASH_SESSION_KEY, _get_user_session_key, load_backend
+)
+from django.contrib.auth.middleware import (
+    AuthenticationMiddleware as BaseAuthenticationMiddleware
+)
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+VERSION_KEY = 'core:user:{}'
+
+# Значения LocMemCache хранятся в pickle, поэтому каждый запрос получает
+# свою копию пользователя и не видит изменений из других потоков.
+_users = LocMemCache('core-users', {
+    'TIMEOUT': settings.USER_CACHE_TIMEOUT,
+    'OPTIONS': {'MAX_ENTRIES': settings.USER_CACHE_SIZE},
+})
+
+
+def invalidate_user(user_id):
+    """Заставляет все процессы перечитать пользователя из базы."""
+    _users.delete(user_id)
+    if settings.USER_CACHE:
+        caches[settings.USER_CACHE].set(
+            VERSION_KEY.format(user_id), uuid.uuid4().hex,
+            settings.USER_CACHE_TIMEOUT,
+        )
+
+
+def get_cached_user(backend, user_id):
+    if not settings.USER_CACHE:
+        return backend.get_user(user_id)
+    # Версия читается до базы: если пользователя сохранят, пока он
+    # загружается, запись с устаревшей версией не пройдет проверку.
+    version = caches[settings.USER_CACHE].get(VERSION_KEY.format(user_id))
+    entry = _users.get(user_id)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    user = backend.get_user(user_id)
+    if user is not None:
+        _users.set(user_id, (version, user))
+
+    return user
+
+
+def get_user(request):
+    """То же, что `django.contrib.auth.get_user`, но через кэш."""
+    try:
+        user_id = _get_user_session_key(request)
+        backend_path = request.session[BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return AnonymousUser()
+    user = get_cached_user(load_backend(backend_path), user_id)
+    if user is None:
+        return AnonymousUser()
+    session_hash = request.session.get(HASH_SESSION_KEY)
+    if not (session_hash and constant_time_compare(
+        session_hash, user.get_session_auth_hash()
+    )):
+        request.session.flush()
+        return AnonymousUser()
+
+    return user
+
+
+class AuthenticationMiddleware(BaseAuthenticationMiddleware):
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_user(request))
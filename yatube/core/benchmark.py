@@ -0,0 +1,658 @@
+"""Нагрузочный прогон всех страниц приложений posts, users и about.
+
+Каждый маршрут запрашивается анонимно и от имени пользователя через
+тестовый клиент Django и через настоящий WSGI-сервер. Для маршрута
+считаются p50 и p99 времени ответа, число запросов к базе и пик памяти,
+выделенной на один запрос. Результаты сравниваются с сохраненным
+JSON-базисом, чтобы замедления находились до выкладки.
+
+`render_benchmark` отдельно замеряет отрисовку шаблонов лент с разным
+числом постов при чтении шаблонов с диска и из кэша загрузчика, а
+`upload_benchmark` — время и пик резидентной памяти процесса при
+загрузке фотографий разного размера. `image_bytes_benchmark` считает
+байты изображений одной страницы ленты для экранов разной ширины: с
+одной миниатюрой для всех и с вариантами из srcset, которые выбрал бы
+браузер.
+"""
+import json
+import math
+import os
+import resource
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import timedelta
+from http.client import HTTPConnection
+from http.cookies import SimpleCookie
+from io import BytesIO
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.contrib.auth.models import AnonymousUser
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.paginator import Page, Paginator
+from django.db import connection
+from django.template.backends.django import DjangoTemplates
+from django.test import Client, RequestFactory, override_settings
+from django.test.client import encode_multipart
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils.encoding import force_bytes
+from django.utils import timezone
+from django.utils.http import urlsafe_base64_encode
+
+from PIL import Image
+
+from core.models import Task
+from core.templatetags.images import FALLBACK_TYPES, variant_type
+from posts.constants import POSTS_ON_PAGE
+from posts.models import AuthorStats, Group, Post
+from posts.thumbnails import attach_image_variants, generate_thumbnail
+
+User = get_user_model()
+
+NAMESPACES = ('posts', 'users', 'about')
+# После этих маршрутов сессия пользователя закрыта и нужен новый вход.
+SESSION_ENDING_ROUTES = ('users:logout',)
+MODES = ('anonymous', 'user')
+TOLERANCE = 0.25
+SLACK_MS = 1.0
+RENDER_SIZES = (10, 50, 100)
+FEED_TEMPLATES = (
+    'posts/follow.html', 'posts/group_list.html', 'posts/profile.html'
+)
+UPLOAD_SIZES = (2, 12, 48)
+UPLOAD_USER = 'benchmark_uploader'
+BOUNDARY = 'BenchmarkBoundary'
+MEGABYTE = 1024 * 1024
+IMAGES_USER = 'benchmark_images'
+# Ширина экрана в CSS-пикселях и плотность пикселей.
+VIEWPORTS = ((360, 1), (360, 2), (414, 3), (768, 2), (1440, 1))
+# Ширина изображения в ленте, как в sizes шаблона post_card.html.
+CARD_WIDTH = 960
+CARD_LOOP = (
+    '{%% load inline_include %%}{%% for post in page_obj %%}'
+    '{%% %s "posts/includes/post_card.html" %%}{%% endfor %%}'
+)
+
+
+class Route:
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+
+    def __repr__(self):
+        return f'<Route {self.name} {self.path}>'
+
+
+def get_fixtures():
+    """Выбирает из базы объекты, на которых строятся адреса маршрутов."""
+    reader = User.objects.order_by('-stats__following_count', 'pk').first()
+    author = User.objects.order_by('-stats__followers_count', 'pk').first()
+    post = Post.objects.order_by('-comments_count', '-pk').first()
+    grouped = Post.objects.exclude(group=None).select_related('group').first()
+    if None in (reader, author, post, grouped):
+        raise ValueError(
+            'Для прогона нужны пользователи и посты в группах: '
+            'выполните manage.py seed_benchmark'
+        )
+
+    return {
+        'reader': reader,
+        'kwargs': {
+            'post_id': post.pk,
+            'slug': grouped.group.slug,
+            'username': author.username,
+            'uidb64': urlsafe_base64_encode(force_bytes(reader.pk)),
+            'token': default_token_generator.make_token(reader),
+        },
+    }
+
+
+def collect_routes(kwargs, namespaces=NAMESPACES):
+    """Строит адреса всех именованных маршрутов из указанных пространств."""
+    routes = []
+    for resolver in get_resolver().url_patterns:
+        if not isinstance(resolver, URLResolver):
+            continue
+        if resolver.namespace not in namespaces:
+            continue
+        for pattern in resolver.url_patterns:
+            if not pattern.name:
+                continue
+            name = f'{resolver.namespace}:{pattern.name}'
+            arguments = {
+                key: kwargs[key] for key in pattern.pattern.converters
+            }
+            routes.append(Route(name, reverse(name, kwargs=arguments)))
+
+    return routes
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = math.ceil(fraction * len(ordered)) - 1
+
+    return ordered[min(max(index, 0), len(ordered) - 1)]
+
+
+def body_size(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+
+    return len(response.content)
+
+
+class QueryCounter:
+    """Обертка `execute_wrapper`, считающая запросы к базе."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+
+        return execute(sql, params, many, context)
+
+
+class ClientTransport:
+    """Запросы через тестовый клиент Django в этом же потоке."""
+
+    name = 'client'
+
+    def __init__(self, user=None):
+        self.user = user
+        self.client = Client()
+        self.login()
+
+    def login(self):
+        if self.user is not None:
+            self.client.force_login(self.user)
+
+    def request(self, path, counter):
+        with connection.execute_wrapper(counter):
+            response = self.client.get(path)
+
+            return response.status_code, body_size(response)
+
+    def post(self, path, body, content_type):
+        return self.client.generic(
+            'POST', path, body, content_type
+        ).status_code
+
+    def csrf_token(self, path):
+        # Тестовый клиент не проверяет CSRF.
+        return ''
+
+    def close(self):
+        pass
+
+
+class QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CountingApplication:
+    """WSGI-приложение, считающее запросы к базе в потоке сервера."""
+
+    def __init__(self, application):
+        self.application = application
+        self.counter = None
+
+    def __call__(self, environ, start_response):
+        if self.counter is None:
+            return self.application(environ, start_response)
+        with connection.execute_wrapper(self.counter):
+            return self.application(environ, start_response)
+
+
+class WsgiTransport:
+    """Запросы по HTTP к WSGI-серверу, запущенному в фоновом потоке."""
+
+    name = 'wsgi'
+
+    def __init__(self, user=None):
+        self.user = user
+        self.application = CountingApplication(WSGIHandler())
+        self.server = make_server(
+            '127.0.0.1', 0, self.application, handler_class=QuietHandler
+        )
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.cookie = None
+        self.login()
+
+    def login(self):
+        if self.user is not None:
+            client = Client()
+            client.force_login(self.user)
+            name = settings.SESSION_COOKIE_NAME
+            self.cookie = f'{name}={client.cookies[name].value}'
+
+    def send(self, method, path, body=None, headers=None):
+        host, port = self.server.server_address[:2]
+        http = HTTPConnection(host, port, timeout=30)
+        headers = dict(headers or {})
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        try:
+            http.request(method, path, body=body, headers=headers)
+            response = http.getresponse()
+
+            return response, response.read()
+        finally:
+            http.close()
+
+    def request(self, path, counter):
+        self.application.counter = counter
+        try:
+            response, content = self.send('GET', path)
+
+            return response.status, len(content)
+        finally:
+            self.application.counter = None
+
+    def post(self, path, body, content_type):
+        response, _ = self.send(
+            'POST', path, body, {'Content-Type': content_type}
+        )
+
+        return response.status
+
+    def csrf_token(self, path):
+        """Получает CSRF-cookie со страницы формы и возвращает токен."""
+        response, _ = self.send('GET', path)
+        cookies = SimpleCookie()
+        for header in response.msg.get_all('Set-Cookie') or ():
+            cookies.load(header)
+        token = cookies[settings.CSRF_COOKIE_NAME].value
+        cookie = f'{settings.CSRF_COOKIE_NAME}={token}'
+        self.cookie = f'{self.cookie}; {cookie}' if self.cookie else cookie
+
+        return token
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+TRANSPORTS = {
+    transport.name: transport for transport in (ClientTransport, WsgiTransport)
+}
+
+
+def measure(transport, route, requests):
+    """Запрашивает маршрут `requests` раз и возвращает сводку замеров."""
+
+    def request(counter):
+        try:
+            return transport.request(route.path, counter)
+        finally:
+            if route.name in SESSION_ENDING_ROUTES:
+                transport.login()
+
+    # Первый запрос прогревает кэши и не учитывается.
+    request(QueryCounter())
+    timings, queries = [], []
+    for _ in range(requests):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        status, size = request(counter)
+        timings.append((time.perf_counter() - started) * 1000)
+        queries.append(counter.count)
+    # Память замеряется отдельным запросом: трассировка замедляет
+    # выполнение и не должна попадать в замеры времени.
+    tracemalloc.start()
+    try:
+        request(QueryCounter())
+        allocated = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'status': status,
+        'bytes': size,
+        'p50_ms': round(percentile(timings, 0.5), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'queries': max(queries),
+        'allocated_bytes': allocated,
+    }
+
+
+def run_suite(transports=tuple(TRANSPORTS), requests=20, only=None,
+              log=None):
+    """Прогоняет все маршруты и возвращает замеры по ключу
+    `<транспорт> <режим> <маршрут>`."""
+    fixtures = get_fixtures()
+    routes = collect_routes(fixtures['kwargs'])
+    if only:
+        routes = [route for route in routes if only in route.name]
+    results = {}
+    for transport_name in transports:
+        for mode in MODES:
+            user = fixtures['reader'] if mode == 'user' else None
+            transport = TRANSPORTS[transport_name](user)
+            try:
+                for route in routes:
+                    key = f'{transport_name} {mode} {route.name}'
+                    results[key] = measure(transport, route, requests)
+                    if log:
+                        log(key, results[key])
+            finally:
+                transport.close()
+
+    return results
+
+
+def load_baseline(path):
+    try:
+        with open(path, encoding='utf-8') as baseline:
+            return json.load(baseline)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(path, results):
+    with open(path, 'w', encoding='utf-8') as baseline:
+        json.dump(results, baseline, indent=2, sort_keys=True)
+        baseline.write('\n')
+
+
+def compare(results, baseline, tolerance=TOLERANCE, slack_ms=SLACK_MS):
+    """Возвращает описания замедлений относительно базиса.
+
+    Число запросов и код ответа должны совпадать точно, время и память
+    могут вырасти не больше чем на `tolerance`.
+    """
+    regressions = []
+    for key, current in sorted(results.items()):
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if current['status'] != base['status']:
+            regressions.append(
+                f'{key}: код ответа {base["status"]} -> {current["status"]}'
+            )
+        if current['queries'] > base['queries']:
+            regressions.append(
+                f'{key}: запросов {base["queries"]} -> {current["queries"]}'
+            )
+        if current['p99_ms'] > base['p99_ms'] * (1 + tolerance) + slack_ms:
+            regressions.append(
+                f'{key}: p99 {base["p99_ms"]} -> {current["p99_ms"]} мс'
+            )
+        limit = base['allocated_bytes'] * (1 + tolerance)
+        if current['allocated_bytes'] > limit:
+            regressions.append(
+                f'{key}: память {base["allocated_bytes"]} -> '
+                f'{current["allocated_bytes"]} байт'
+            )
+
+    return regressions
+
+
+def make_feed_posts(count):
+    """Несохраненные посты с автором и группой для отрисовки ленты."""
+    group = Group(pk=1, title='Группа', slug='group', description='Описание')
+    now = timezone.now()
+
+    return [
+        Post(
+            pk=number,
+            text=f'Текст поста {number}\nвторая строка',
+            author=User(pk=number, username=f'author_{number}'),
+            group=group if number % 2 else None,
+            pub_date=now - timedelta(minutes=number),
+        ) for number in range(1, count + 1)
+    ]
+
+
+def make_template_backend(cached):
+    """Движок шаблонов с настройками проекта и выбранным загрузчиком."""
+    params = dict(settings.TEMPLATES[0])
+    params.pop('BACKEND')
+    options = dict(params.get('OPTIONS', {}))
+    loaders = [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]
+    if cached:
+        loaders = [('django.template.loaders.cached.Loader', loaders)]
+    options['loaders'] = loaders
+    params.update(
+        NAME=f'benchmark-{cached}', APP_DIRS=False, OPTIONS=options
+    )
+
+    return DjangoTemplates(params)
+
+
+def median_render(get_template, context, request, repeat):
+    """Медиана времени отрисовки; шаблон ищется заново, как в render()."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        get_template().render(context, request)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    return round(statistics.median(timings), 3)
+
+
+def render_benchmark(sizes=RENDER_SIZES, templates=FEED_TEMPLATES,
+                     repeat=20):
+    """Возвращает медиану времени отрисовки (мс) по шаблону, режиму
+    загрузчика и числу постов на странице.
+
+    Цикл по карточкам постов дополнительно сравнивается в вариантах
+    `{% include %}` и `{% inline_include %}`.
+    """
+    request = RequestFactory().get('/')
+    request.user = AnonymousUser()
+    backends = {
+        'disk': make_template_backend(cached=False),
+        'cached': make_template_backend(cached=True),
+    }
+    results = {}
+    for size in sizes:
+        posts = make_feed_posts(size)
+        page = Page(posts, 1, Paginator(posts, size))
+        author = posts[0].author
+        author.stats = AuthorStats(user=author, posts_count=size)
+        context = {
+            'page_obj': page,
+            'author': author,
+            'group': posts[-1].group or posts[0].group,
+        }
+        for mode, backend in backends.items():
+            for name in templates:
+                results[f'{name} {mode} {size}'] = median_render(
+                    lambda: backend.get_template(name),
+                    context, request, repeat,
+                )
+        for tag in ('include', 'inline_include'):
+            loop = backends['cached'].from_string(CARD_LOOP % tag)
+            results[f'post_card {tag} {size}'] = median_render(
+                lambda: loop, context, request, repeat
+            )
+
+    return results
+
+
+def current_rss():
+    """Резидентная память процесса в байтах."""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+    except OSError:
+        # Без /proc доступен только пик за все время жизни процесса.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+class RssSampler:
+    """Следит за резидентной памятью процесса из фонового потока.
+
+    После выхода из блока `peak` — наибольший прирост памяти
+    относительно его начала.
+    """
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.peak = 0
+
+    def __enter__(self):
+        self.start = self.highest = current_rss()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+
+        return self
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            self.highest = max(self.highest, current_rss())
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+        self.peak = max(self.highest, current_rss()) - self.start
+
+
+def make_photo(megapixels):
+    """JPEG 4:3 из шума: сжимается так же плохо, как фотография."""
+    width = round(math.sqrt(megapixels * 10 ** 6 * 4 / 3))
+    height = round(width * 3 / 4)
+    output = BytesIO()
+    Image.effect_noise((width, height), 64).convert('RGB').save(
+        output, format='JPEG', quality=75
+    )
+
+    return output.getvalue()
+
+
+def upload_benchmark(sizes=UPLOAD_SIZES, transport='wsgi', log=None):
+    """Загружает фотографии в форму поста и возвращает по размеру в
+    мегапикселях код ответа, размер файла, время и пик RSS.
+
+    Миниатюры не строятся: в работе их делает воркер. Созданные посты и
+    пользователь удаляются после прогона.
+    """
+    user = User.objects.get_or_create(username=UPLOAD_USER)[0]
+    client = TRANSPORTS[transport](user)
+    path = reverse('posts:post_create')
+    content_type = f'multipart/form-data; boundary={BOUNDARY}'
+    results = {}
+    try:
+        token = client.csrf_token(path)
+        with override_settings(TASKS_EAGER=False):
+            for megapixels in sizes:
+                photo = make_photo(megapixels)
+                body = encode_multipart(BOUNDARY, {
+                    'text': f'Фотография {megapixels} Мп',
+                    'csrfmiddlewaretoken': token,
+                    'image': SimpleUploadedFile(
+                        'photo.jpg', photo, 'image/jpeg'
+                    ),
+                })
+                with RssSampler() as sampler:
+                    started = time.perf_counter()
+                    status = client.post(path, body, content_type)
+                    elapsed = (time.perf_counter() - started) * 1000
+                key = f'{megapixels:g} Мп'
+                results[key] = {
+                    'status': status,
+                    'bytes': len(photo),
+                    'ms': round(elapsed, 3),
+                    'peak_rss_bytes': sampler.peak,
+                }
+                if log:
+                    log(key, results[key])
+    finally:
+        client.close()
+        for post in Post.objects.filter(author=user):
+            Task.objects.filter(key__in=(
+                f'fan_out:{post.pk}', f'thumbnail:{post.pk}:{post.image.name}'
+            )).delete()
+            post.image.delete(save=False)
+        user.delete()
+
+    return results
+
+
+def pick_variant(variants, viewport, density):
+    """Вариант, который выберет браузер с поддержкой всех форматов.
+
+    Берется первый по порядку формат, а в нем самый узкий вариант не уже
+    места под изображение в физических пикселях или самый широкий.
+    """
+    by_type = {}
+    for variant in variants:
+        by_type.setdefault(variant_type(variant), []).append(variant)
+    modern = [mime for mime in by_type if mime not in FALLBACK_TYPES]
+    candidates = sorted(
+        by_type[(modern or list(by_type))[0]],
+        key=lambda variant: variant.width,
+    )
+    slot = min(viewport, CARD_WIDTH) * density
+
+    return next(
+        (variant for variant in candidates if variant.width >= slot),
+        candidates[-1],
+    )
+
+
+def image_bytes_benchmark(viewports=VIEWPORTS, posts=POSTS_ON_PAGE,
+                          log=None):
+    """Считает байты изображений страницы ленты до и после srcset.
+
+    До — одна миниатюра 960 пикселей для всех экранов, после — варианты,
+    которые браузер выберет из srcset. Возвращает по экрану байты обоих
+    способов и долю сэкономленного. Посты и пользователь удаляются после
+    прогона.
+    """
+    user = User.objects.get_or_create(username=IMAGES_USER)[0]
+    results = {}
+    try:
+        with override_settings(TASKS_EAGER=False):
+            page = [
+                Post.objects.create(
+                    text=f'Фотография {number}',
+                    author=user,
+                    image=SimpleUploadedFile(
+                        f'photo{number}.jpg', make_photo(2), 'image/jpeg'
+                    ),
+                ) for number in range(posts)
+            ]
+        for post in page:
+            generate_thumbnail(post.pk)
+            post.refresh_from_db()
+        attach_image_variants(page)
+        before = sum(post.thumbnail.size for post in page)
+        for viewport, density in viewports:
+            after = sum(
+                variant.storage.size(variant.name)
+                for variant in (
+                    pick_variant(post.image_variants, viewport, density)
+                    for post in page
+                )
+            )
+            key = f'{viewport}x{density}'
+            results[key] = {
+                'before_bytes': before,
+                'after_bytes': after,
+                'saved': round(1 - after / before, 3),
+            }
+            if log:
+                log(key, results[key])
+    finally:
+        for post in Post.objects.filter(author=user):
+            Task.objects.filter(key=f'fan_out:{post.pk}').delete()
+        user.delete()
+
+    return results
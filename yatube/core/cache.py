@@ -0,0 +1,313 @@
+"""Бэкенды кэша: общий Redis и двухуровневый кэш поверх него.
+
+`TwoTierCache` держит в каждом процессе небольшой LRU-кэш с коротким
+временем жизни перед общим кэшем. Общий кэш хранит номер поколения:
+`clear()` меняет его, и локальные уровни всех процессов сбрасываются при
+ближайшей проверке поколения.
+
+Оба кэша по умолчанию сообщают о попаданиях и промахах в `core.metrics`.
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache as BaseLocMemCache
+
+from .metrics import record_cache
+from .redis import RedisClient
+
+GENERATION_KEY = 'core:two-tier:generation'
+
+
+class LocMemCache(BaseLocMemCache):
+    """Кэш в памяти процесса, который учитывает попадания в метриках."""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, version=version)
+        record_cache(value is not None, value is None)
+
+        return default if value is None else value
+
+
+class RedisCache(BaseCache):
+    """Кэш в Redis или в совместимом с ним `LocalRedisServer`.
+
+    Целые числа хранятся как есть, чтобы работал `INCRBY`, остальные
+    значения сериализуются через pickle.
+    """
+
+    def __init__(self, server, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._client = RedisClient(
+            server, timeout=options.get('SOCKET_TIMEOUT', 1.0)
+        )
+
+    def _encode(self, value):
+        if isinstance(value, int) and not isinstance(value, bool):
+            return b'%d' % value
+
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def _decode(self, raw):
+        if raw is None:
+            return None
+        try:
+            return int(raw)
+        except ValueError:
+            return pickle.loads(raw)
+
+    def _get_expire_ms(self, timeout):
+        """Переводит таймаут Django в миллисекунды для PX и PEXPIRE."""
+        if timeout == DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+
+        return None if timeout is None else max(int(timeout * 1000), 1)
+
+    def _set_command(self, key, value, timeout, *options):
+        command = ['SET', key, self._encode(value), *options]
+        expire_ms = self._get_expire_ms(timeout)
+        if expire_ms is not None:
+            command += ['PX', expire_ms]
+
+        return command
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+
+        return self._client.execute(
+            *self._set_command(key, value, timeout, 'NX')
+        ) is not None
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        value = self._decode(self._client.execute('GET', key))
+
+        return default if value is None else value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._client.execute(*self._set_command(key, value, timeout))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        expire_ms = self._get_expire_ms(timeout)
+        if expire_ms is None:
+            exists, _ = self._client.pipeline(
+                ('EXISTS', key), ('PERSIST', key)
+            )
+
+            return bool(exists)
+
+        return bool(self._client.execute('PEXPIRE', key, expire_ms))
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._client.execute('DEL', key)
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        if not keys:
+            return {}
+        made = [self.make_key(key, version=version) for key in keys]
+        values = self._client.execute('MGET', *made)
+
+        return {
+            key: self._decode(value)
+            for key, value in zip(keys, values) if value is not None
+        }
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        if data:
+            self._client.pipeline(*(
+                self._set_command(
+                    self.make_key(key, version=version), value, timeout
+                ) for key, value in data.items()
+            ))
+
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        if keys:
+            self._client.execute('DEL', *keys)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+
+        return bool(self._client.execute('EXISTS', key))
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        if not self._client.execute('EXISTS', key):
+            raise ValueError(f"Key '{key}' not found")
+
+        return self._client.execute('INCRBY', key, delta)
+
+    def clear(self):
+        self._client.execute('FLUSHDB')
+
+    def close(self, **kwargs):
+        self._client.close()
+
+
+class TwoTierCache(BaseCache):
+    """Локальный LRU-кэш процесса перед общим кэшем.
+
+    Параметры OPTIONS:
+        SHARED — имя общего кэша из CACHES;
+        LOCAL_MAX_ENTRIES — размер локального уровня;
+        LOCAL_TIMEOUT — сколько секунд значение живет в локальном уровне;
+        GENERATION_CHECK_INTERVAL — как часто сверять поколение.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options['SHARED']
+        self._max_entries = options.get('LOCAL_MAX_ENTRIES', 1000)
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self._check_interval = options.get('GENERATION_CHECK_INTERVAL', 1)
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = None
+        self._checked_at = 0
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _sync_generation(self):
+        now = time.monotonic()
+        if now - self._checked_at < self._check_interval:
+            return
+        self._checked_at = now
+        generation = self.shared.get(GENERATION_KEY)
+        if generation != self._generation:
+            with self._lock:
+                self._local.clear()
+            self._generation = generation
+
+    def _local_get(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+
+            return entry
+
+    def _local_set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        timeout = self.get_backend_timeout(timeout)
+        lifetime = self._local_timeout
+        if timeout is not None:
+            lifetime = min(lifetime, timeout - time.time())
+        if lifetime <= 0:
+            return self._local_delete(key)
+        with self._lock:
+            self._local[key] = value, time.monotonic() + lifetime
+            self._local.move_to_end(key)
+            while len(self._local) > self._max_entries:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, key):
+        with self._lock:
+            self._local.pop(key, None)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._local_set(self.make_key(key, version), value, timeout)
+
+        return added
+
+    def get(self, key, default=None, version=None):
+        self._sync_generation()
+        local_key = self.make_key(key, version)
+        entry = self._local_get(local_key)
+        if entry is not None:
+            record_cache(1, 0)
+            return entry[0]
+        value = self.shared.get(key, version=version)
+        record_cache(value is not None, value is None)
+        if value is None:
+            return default
+        self._local_set(local_key, value)
+
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self._local_set(self.make_key(key, version), value, timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._local_delete(self.make_key(key, version))
+
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._local_delete(self.make_key(key, version))
+        self.shared.delete(key, version=version)
+
+    def get_many(self, keys, version=None):
+        self._sync_generation()
+        keys = list(keys)
+        found, missing = {}, []
+        for key in keys:
+            entry = self._local_get(self.make_key(key, version))
+            if entry is None:
+                missing.append(key)
+            else:
+                found[key] = entry[0]
+        if missing:
+            shared = self.shared.get_many(missing, version=version)
+            for key, value in shared.items():
+                self._local_set(self.make_key(key, version), value)
+            found.update(shared)
+        record_cache(len(found), len(keys) - len(found))
+
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            self._local_set(self.make_key(key, version), value, timeout)
+
+        return failed
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        for key in keys:
+            self._local_delete(self.make_key(key, version))
+        self.shared.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        return self.get(key, version=version) is not None
+
+    def incr(self, key, delta=1, version=None):
+        self._local_delete(self.make_key(key, version))
+
+        return self.shared.incr(key, delta, version=version)
+
+    def clear(self):
+        """Очищает общий кэш и локальные уровни всех процессов."""
+        self.shared.clear()
+        self.bump_generation()
+
+    def bump_generation(self):
+        with self._lock:
+            self._local.clear()
+        self._generation = time.time_ns()
+        self.shared.set(GENERATION_KEY, self._generation, None)
+        self._checked_at = time.monotonic()
@@ -0,0 +1,107 @@
+"""Заголовки Cache-Control и Vary для представлений.
+
+Каждый маршрут объявляет политику кэширования декоратором
+`cache_policy`, а тест проверяет, что политика есть у всех маршрутов.
+Ответ на GET по публичной политике может храниться в общем кэше
+(обратном прокси) `max_age` секунд и еще `stale_while_revalidate` секунд
+отдаваться устаревшим, пока прокси обновляет его в фоне. Страницы с
+меню и лентами зависят от читателя: вошедшему они отдаются
+`private, no-cache`, а `Vary: Cookie` не дает прокси отдать ему копию
+для анонима. Ответ, который ставит cookie или содержит CSRF-токен, в
+общий кэш не попадает.
+"""
+from functools import wraps
+
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+SHARED_STATUSES = (200, 304)
+
+
+class CachePolicy:
+    """Политика кэширования ответов представления.
+
+    `personal=False` значит, что ответ одинаков для всех читателей и
+    публичен даже для вошедшего. Без `store` ответ не сохраняется нигде.
+    """
+
+    def __init__(self, name, public=False, max_age=0,
+                 stale_while_revalidate=0, personal=True, store=True):
+        self.name = name
+        self.public = public
+        self.max_age = max_age
+        self.stale_while_revalidate = stale_while_revalidate
+        self.personal = personal
+        self.store = store
+
+    def __repr__(self):
+        return f'<CachePolicy {self.name}>'
+
+    def is_shared(self, request, response):
+        """Можно ли хранить этот ответ в общем кэше."""
+        return (
+            self.public
+            and request.method in ('GET', 'HEAD')
+            and response.status_code in SHARED_STATUSES
+            and not response.cookies
+            and not request.META.get('CSRF_COOKIE_USED')
+            and not (self.personal and request.user.is_authenticated)
+        )
+
+    def apply(self, request, response):
+        if not self.store:
+            patch_cache_control(response, private=True, no_store=True)
+            return response
+        if self.personal:
+            patch_vary_headers(response, ('Cookie',))
+        if self.is_shared(request, response):
+            patch_cache_control(
+                response,
+                public=True,
+                max_age=self.max_age,
+                stale_while_revalidate=self.stale_while_revalidate,
+            )
+        else:
+            patch_cache_control(response, private=True, no_cache=True)
+
+        return response
+
+
+# Ленты и посты: правки видны анонимам не позже чем через минуту.
+PUBLIC = CachePolicy('public', public=True, max_age=60,
+                     stale_while_revalidate=600)
+# Страницы, которые меняются только с выкладкой.
+STATIC = CachePolicy('static', public=True, max_age=60 * 60,
+                     stale_while_revalidate=24 * 60 * 60)
+# JSON-ленты одинаковы для всех читателей.
+SHARED = CachePolicy('shared', public=True, max_age=60,
+                     stale_while_revalidate=600, personal=False)
+# Страницы только для вошедшего читателя.
+PRIVATE = CachePolicy('private')
+# Формы с CSRF-токеном, вход и выход, изменения и служебные ответы.
+NO_STORE = CachePolicy('no-store', store=False)
+
+
+def cache_policy(policy):
+    """Ставит ответам представления заголовки по политике `policy`.
+
+    Политика доступна тестам как атрибут `cache_policy` представления.
+    Для TemplateResponse заголовки ставятся после отрисовки, когда
+    известно, попал ли в страницу CSRF-токен.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = view_func(request, *args, **kwargs)
+            if getattr(response, 'is_rendered', True):
+                return policy.apply(request, response)
+            response.add_post_render_callback(
+                lambda rendered: policy.apply(request, rendered)
+            )
+
+            return response
+
+        wrapper.cache_policy = policy
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,102 @@
+"""Чтение лент с реплик базы данных.
+
+`ReplicaRouter` отправляет чтения на реплику из `DATABASE_REPLICAS` только
+внутри представлений, отмеченных `read_from_replica`; остальные запросы и
+все записи идут в основную базу. После ответа представления, отмеченного
+`write_to_primary`, клиент получает cookie, и следующие
+`REPLICA_STICKY_SECONDS` секунд его чтения тоже идут в основную базу:
+автор сразу видит свой пост или комментарий, даже если реплика отстает.
+Сессии и пользователи всегда читаются из основной базы: `request.session`
+и `request.user` ленивые и впервые читаются уже внутри представления, а
+только что вошедший пользователь на отстающей реплике был бы анонимом.
+"""
+import random
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PRIMARY_COOKIE = 'read_primary'
+# Приложения, модели которых читаются только из основной базы.
+PRIMARY_APPS = {'auth', 'sessions'}
+
+_state = threading.local()
+
+
+def get_replica():
+    """Реплика, с которой читает текущий поток, или None."""
+    return getattr(_state, 'replica', None)
+
+
+@contextmanager
+def use_replica(alias=None):
+    """Направляет чтения в потоке на реплику, по умолчанию случайную."""
+    previous = get_replica()
+    replicas = settings.DATABASE_REPLICAS
+    _state.replica = alias or (random.choice(replicas) if replicas else None)
+    try:
+        yield _state.replica
+    finally:
+        _state.replica = previous
+
+
+def read_primary():
+    """Переводит чтения потока в основную базу до конца `use_replica`.
+
+    Нужна, когда уже внутри представления выясняется, что реплика могла
+    не получить свежие изменения.
+    """
+    _state.replica = None
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_APPS:
+            return DEFAULT_DB_ALIAS
+
+        return get_replica() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Объект, прочитанный с реплики, все равно сохраняется в основную.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+def read_from_replica(view_func):
+    """Выполняет представление с чтением с реплики.
+
+    Клиент, недавно что-то записавший, читает из основной базы.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if PRIMARY_COOKIE in request.COOKIES:
+            return view_func(request, *args, **kwargs)
+        with use_replica():
+            return view_func(request, *args, **kwargs)
+
+    return wrapper
+
+
+def write_to_primary(view_func):
+    """Закрепляет чтения клиента за основной базой после записи."""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        response = view_func(request, *args, **kwargs)
+        # Успешная запись в представлениях заканчивается редиректом.
+        if response.status_code == 302:
+            response.set_cookie(
+                PRIMARY_COOKIE,
+                '1',
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+
+        return response
+
+    return wrapper
@@ -0,0 +1,71 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmark import (
+    TOLERANCE, TRANSPORTS, compare, load_baseline, run_suite, save_baseline
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет время ответа, запросы к базе и память для всех страниц '
+        'и сравнивает их с базисом. Данные готовит manage.py seed_benchmark.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=20,
+            help='Число замеряемых запросов на маршрут.'
+        )
+        parser.add_argument(
+            '--transport', action='append', choices=sorted(TRANSPORTS),
+            help='client или wsgi, по умолчанию оба.'
+        )
+        parser.add_argument(
+            '--route', help='Прогнать только маршруты, содержащие строку.'
+        )
+        parser.add_argument(
+            '--baseline',
+            default=os.path.join(settings.BASE_DIR, 'benchmark.json'),
+            help='JSON-файл базиса.'
+        )
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Записать результаты в базис вместо сравнения.'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=TOLERANCE,
+            help='Допустимый рост p99 и памяти относительно базиса.'
+        )
+
+    def log(self, key, result):
+        self.stdout.write(
+            f'{key:<55} {result["status"]} p50 {result["p50_ms"]:>8} мс '
+            f'p99 {result["p99_ms"]:>8} мс запросов {result["queries"]:>3} '
+            f'память {result["allocated_bytes"]:>9} байт'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            results = run_suite(
+                transports=options['transport'] or sorted(TRANSPORTS),
+                requests=options['requests'],
+                only=options['route'],
+                log=self.log,
+            )
+        except ValueError as error:
+            raise CommandError(error)
+        path = options['baseline']
+        baseline = load_baseline(path)
+        if options['save_baseline'] or baseline is None:
+            save_baseline(path, {**(baseline or {}), **results})
+            self.stdout.write(self.style.SUCCESS(f'Базис записан в {path}'))
+            return
+        regressions = compare(results, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError(
+                'Замедления относительно базиса:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('Замедлений нет'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from core.benchmark import VIEWPORTS, image_bytes_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Считает байты изображений страницы ленты для экранов разной '
+        'ширины: с одной миниатюрой и с вариантами из srcset.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--viewports', nargs='+', default=[
+                f'{width}x{density}' for width, density in VIEWPORTS
+            ],
+            help='Экраны в виде <ширина в CSS-пикселях>x<плотность>.'
+        )
+
+    def log(self, key, result):
+        self.stdout.write(
+            f'{key:<8} до {result["before_bytes"] / 1024:>8.1f} КБ '
+            f'после {result["after_bytes"] / 1024:>8.1f} КБ '
+            f'экономия {result["saved"]:>6.1%}'
+        )
+
+    def handle(self, *args, **options):
+        viewports = [
+            tuple(map(int, viewport.split('x')))
+            for viewport in options['viewports']
+        ]
+        image_bytes_benchmark(viewports, log=self.log)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from core.benchmark import RENDER_SIZES, render_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет отрисовку шаблонов лент с 10, 50 и 100 постами при '
+        'чтении шаблонов с диска и из кэша загрузчика.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=list(RENDER_SIZES),
+            help='Число постов на странице.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Число отрисовок для медианы.'
+        )
+
+    def handle(self, *args, **options):
+        results = render_benchmark(options['sizes'], repeat=options['repeat'])
+        for key, milliseconds in results.items():
+            self.stdout.write(f'{key:<40} {milliseconds:>9} мс')
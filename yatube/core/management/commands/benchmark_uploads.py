@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from core.benchmark import MEGABYTE, TRANSPORTS, UPLOAD_SIZES, upload_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает фотографии разного размера в форму поста и замеряет '
+        'время ответа и пик резидентной памяти процесса.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=float, nargs='+', default=list(UPLOAD_SIZES),
+            help='Размеры фотографий в мегапикселях.'
+        )
+        parser.add_argument(
+            '--transport', choices=sorted(TRANSPORTS), default='wsgi',
+            help='Через тестовый клиент или настоящий WSGI-сервер.'
+        )
+
+    def log(self, key, result):
+        self.stdout.write(
+            f'{key:<10} {result["status"]} '
+            f'файл {result["bytes"] / MEGABYTE:>6.1f} МБ '
+            f'{result["ms"]:>9} мс '
+            f'пик RSS {result["peak_rss_bytes"] / MEGABYTE:>6.1f} МБ'
+        )
+
+    def handle(self, *args, **options):
+        upload_benchmark(
+            options['sizes'], transport=options['transport'], log=self.log
+        )
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from core.tasks import Worker
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads', type=int, default=4,
+            help='Размер пула потоков; 0 — выполнять в текущем потоке.'
+        )
+        parser.add_argument(
+            '--processes', type=int, default=2,
+            help='Размер пула процессов для тяжелых задач.'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выйти, когда готовых задач не останется.'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Пауза между опросами пустой очереди в секундах.'
+        )
+
+    def handle(self, *args, **options):
+        worker = Worker(options['threads'], options['processes'])
+        worker.run(
+            once=options['once'], poll_interval=options['poll_interval']
+        )
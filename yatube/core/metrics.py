@@ -0,0 +1,285 @@
+"""Метрики запросов в формате Prometheus.
+
+`MetricsMiddleware` собирает по каждому запросу число и время SQL-запросов,
+время отрисовки шаблонов, попадания в кэш и размер ответа и складывает их в
+гистограммы с меткой имени представления. Каждый поток пишет в собственную
+копию счетчиков, поэтому запись обходится без блокировок; копии потоков
+суммируются только при чтении страницы метрик.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+UNRESOLVED_VIEW = 'unresolved'
+
+
+class Histogram:
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+
+    def new_cell(self):
+        # Счетчики по корзинам, последняя — +Inf, затем сумма значений.
+        return [0] * (len(self.buckets) + 1) + [0]
+
+    def observe(self, cell, value):
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def merge(self, total, cell):
+        for index, value in enumerate(cell):
+            total[index] += value
+
+    def render(self, labels, cell):
+        lines = []
+        cumulative = 0
+        bounds = [*map(format_value, self.buckets), '+Inf']
+        for bound, count in zip(bounds, cell):
+            cumulative += count
+            lines.append(
+                f'{self.name}_bucket'
+                f'{format_labels(labels + (("le", bound),))} {cumulative}'
+            )
+        lines.append(
+            f'{self.name}_sum{format_labels(labels)} {format_value(cell[-1])}'
+        )
+        lines.append(f'{self.name}_count{format_labels(labels)} {cumulative}')
+
+        return lines
+
+
+class Counter:
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+
+    def new_cell(self):
+        return [0]
+
+    def observe(self, cell, value):
+        cell[0] += value
+
+    def merge(self, total, cell):
+        total[0] += cell[0]
+
+    def render(self, labels, cell):
+        return [f'{self.name}{format_labels(labels)} {format_value(cell[0])}']
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+
+    return str(value)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n'),
+        ) for name, value in labels
+    )
+
+    return f'{{{pairs}}}'
+
+
+class Registry:
+    """Набор метрик со счетчиками, разложенными по потокам."""
+
+    def __init__(self, *metrics):
+        self.metrics = {metric.name: metric for metric in metrics}
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def _get_shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            # Блокировка нужна только при первой записи из нового потока.
+            with self._lock:
+                self._shards.append(shard)
+
+        return shard
+
+    def observe(self, name, labels, value):
+        shard = self._get_shard()
+        key = name, labels
+        cell = shard.get(key)
+        if cell is None:
+            cell = shard[key] = self.metrics[name].new_cell()
+        self.metrics[name].observe(cell, value)
+
+    def collect(self):
+        """Суммирует копии счетчиков всех потоков."""
+        with self._lock:
+            shards = list(self._shards)
+        totals = {}
+        for shard in shards:
+            for (name, labels), cell in list(shard.items()):
+                metric = self.metrics[name]
+                total = totals.get((name, labels))
+                if total is None:
+                    total = totals[name, labels] = metric.new_cell()
+                metric.merge(total, list(cell))
+
+        return totals
+
+    def render(self):
+        """Возвращает метрики в текстовом формате Prometheus."""
+        totals = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f'# HELP {name} {metric.help_text}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for (total_name, labels), cell in sorted(totals.items()):
+                if total_name == name:
+                    lines.extend(metric.render(labels, cell))
+
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            for shard in self._shards:
+                shard.clear()
+
+
+registry = Registry(
+    Counter('yatube_http_responses_total', 'Ответы по коду статуса.'),
+    Histogram(
+        'yatube_http_request_duration_seconds',
+        'Время обработки запроса.',
+        DURATION_BUCKETS,
+    ),
+    Histogram(
+        'yatube_http_response_size_bytes', 'Размер тела ответа.', SIZE_BUCKETS
+    ),
+    Histogram(
+        'yatube_db_queries', 'SQL-запросов на один HTTP-запрос.', QUERY_BUCKETS
+    ),
+    Histogram(
+        'yatube_db_duration_seconds',
+        'Суммарное время SQL-запросов на один HTTP-запрос.',
+        DURATION_BUCKETS,
+    ),
+    Histogram(
+        'yatube_template_render_duration_seconds',
+        'Время отрисовки шаблонов на один HTTP-запрос.',
+        DURATION_BUCKETS,
+    ),
+    Counter('yatube_cache_hits_total', 'Попадания в кэш.'),
+    Counter('yatube_cache_misses_total', 'Промахи кэша.'),
+)
+
+
+class RequestStats:
+    """Замеры одного запроса, которые копятся до его завершения."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0
+        self.template_time = 0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """Обертка `execute_wrapper` для подсчета SQL-запросов."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+
+
+_current = threading.local()
+
+
+def start_request():
+    stats = _current.stats = RequestStats()
+
+    return stats
+
+
+def finish_request():
+    stats = getattr(_current, 'stats', None)
+    _current.stats = None
+
+    return stats
+
+
+def get_current():
+    return getattr(_current, 'stats', None)
+
+
+def record_cache(hits, misses):
+    """Учитывает обращения к кэшу в текущем запросе."""
+    stats = get_current()
+    if stats is not None:
+        stats.cache_hits += hits
+        stats.cache_misses += misses
+
+
+class TemplateTimer:
+    """Замеряет отрисовку шаблона верхнего уровня в текущем запросе."""
+
+    def __enter__(self):
+        self.stats = get_current()
+        if self.stats is not None:
+            self.stats.template_depth += 1
+            self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.stats is not None:
+            self.stats.template_depth -= 1
+            if not self.stats.template_depth:
+                self.stats.template_time += (
+                    time.perf_counter() - self.started
+                )
+
+
+def record_request(view, status, stats, size=None):
+    labels = (('view', view),)
+    registry.observe(
+        'yatube_http_responses_total', labels + (('status', status),), 1
+    )
+    registry.observe(
+        'yatube_http_request_duration_seconds',
+        labels,
+        time.perf_counter() - stats.started,
+    )
+    registry.observe('yatube_db_queries', labels, stats.queries)
+    registry.observe('yatube_db_duration_seconds', labels, stats.sql_time)
+    registry.observe(
+        'yatube_template_render_duration_seconds',
+        labels,
+        stats.template_time,
+    )
+    registry.observe('yatube_cache_hits_total', labels, stats.cache_hits)
+    registry.observe('yatube_cache_misses_total', labels, stats.cache_misses)
+    if size is not None:
+        record_size(view, size)
+
+
+def record_size(view, size):
+    registry.observe(
+        'yatube_http_response_size_bytes', (('view', view),), size
+    )
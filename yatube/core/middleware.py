@@ -0,0 +1,51 @@
+from contextlib import ExitStack
+
+from django.db import connections
+
+from . import metrics
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+
+    return match.view_name if match else metrics.UNRESOLVED_VIEW
+
+
+def count_streaming(content, view):
+    size = 0
+    for chunk in content:
+        size += len(chunk)
+        yield chunk
+    metrics.record_size(view, size)
+
+
+class MetricsMiddleware:
+    """Записывает метрики каждого запроса в `core.metrics.registry`.
+
+    Ставится первой в MIDDLEWARE, чтобы учитывать запросы к базе из
+    остальных промежуточных слоев.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = metrics.start_request()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            metrics.finish_request()
+        view = get_view_name(request)
+        size = None
+        if response.streaming:
+            response.streaming_content = count_streaming(
+                response.streaming_content, view
+            )
+        else:
+            size = len(response.content)
+        metrics.record_request(view, response.status_code, stats, size)
+
+        return response
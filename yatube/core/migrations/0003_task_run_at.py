@@ -0,0 +1,19 @@
+# Generated by Django 2.2.16 on 2026-10-17 07:32
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_blob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='task',
+            name='run_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Для выполняемой задачи — конец аренды воркером, для выполненной — время выполнения', verbose_name='Запустить после'),
+        ),
+    ]
@@ -0,0 +1,278 @@
+"""Минимальный клиент и локальный сервер протокола Redis (RESP).
+
+Клиент поддерживает только команды, нужные кэшу `core.cache.RedisCache`.
+`LocalRedisServer` понимает те же команды, хранит данные в памяти и
+используется в тестах и для локальной разработки вместо настоящего Redis.
+"""
+import socket
+import socketserver
+import threading
+import time
+from urllib.parse import urlparse
+
+DEFAULT_PORT = 6379
+
+
+class RedisError(Exception):
+    """Ошибка, которую вернул сервер."""
+
+
+def encode_command(*args):
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode()
+        elif isinstance(arg, int):
+            arg = b'%d' % arg
+        parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+
+    return b''.join(parts)
+
+
+def read_reply(stream):
+    """Читает один ответ сервера из файлового объекта.
+
+    Ошибку сервера возвращает объектом `RedisError`, а не выбрасывает:
+    так ответы пакета дочитываются до конца.
+    """
+    line = stream.readline()
+    if not line:
+        raise ConnectionError('Соединение с Redis закрыто')
+    kind, payload = line[:1], line[1:-2]
+    if kind == b'+':
+        return payload.decode()
+    if kind == b'-':
+        return RedisError(payload.decode())
+    if kind == b':':
+        return int(payload)
+    if kind == b'$':
+        length = int(payload)
+        if length < 0:
+            return None
+        data = stream.read(length + 2)
+
+        return data[:-2]
+    if kind == b'*':
+        length = int(payload)
+        if length < 0:
+            return None
+
+        return [read_reply(stream) for _ in range(length)]
+    raise RedisError(f'Неизвестный ответ: {line!r}')
+
+
+class RedisClient:
+    """Клиент с отдельным соединением на каждый поток."""
+
+    def __init__(self, url, timeout=1.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or DEFAULT_PORT
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection(
+            (self.host, self.port), timeout=self.timeout
+        )
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        stream = sock.makefile('rb')
+        self._local.connection = sock, stream
+        if self.db:
+            sock.sendall(encode_command('SELECT', self.db))
+            reply = read_reply(stream)
+            if isinstance(reply, RedisError):
+                self.close()
+                raise reply
+
+        return sock, stream
+
+    def _get_connection(self):
+        connection = getattr(self._local, 'connection', None)
+
+        return connection or self._connect()
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection:
+            sock, stream = connection
+            stream.close()
+            sock.close()
+            self._local.connection = None
+
+    def pipeline(self, *commands):
+        """Отправляет команды одним пакетом и возвращает их ответы.
+
+        Ответы читаются все, даже если среди них есть ошибки: первая из
+        них выбрасывается уже после этого. Соединение, на котором ответы
+        прочитать не удалось, закрывается, чтобы следующая команда потока
+        не получила чужой ответ.
+        """
+        payload = b''.join(encode_command(*command) for command in commands)
+        for attempt in range(2):
+            reused = getattr(self._local, 'connection', None) is not None
+            sock, stream = self._get_connection()
+            try:
+                sock.sendall(payload)
+            except OSError:
+                # Повторяем только неотправленный пакет и только на
+                # соединении, которое мог закрыть сервер: отправленные
+                # команды вроде INCRBY сервер мог уже выполнить.
+                self.close()
+                if attempt or not reused:
+                    raise
+                continue
+            try:
+                replies = [read_reply(stream) for _ in commands]
+            except Exception:
+                self.close()
+                raise
+            break
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+
+        return replies
+
+    def execute(self, *args):
+        return self.pipeline(args)[0]
+
+
+class LocalRedisServer(socketserver.ThreadingTCPServer):
+    """Сервер в памяти с подмножеством команд Redis.
+
+    Запускается в фоновом потоке:
+
+        server = LocalRedisServer().start()
+        ...
+        server.stop()
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__((host, port), LocalRedisHandler)
+        self.data = {}
+        self.expires = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+
+        return f'redis://{host}:{port}/0'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def _alive(self, key):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+
+        return key in self.data
+
+    def call(self, name, *args):
+        handler = getattr(self, f'command_{name.lower()}', None)
+        if handler is None:
+            raise RedisError(f"ERR unknown command '{name}'")
+        with self.lock:
+            return handler(*args)
+
+    def command_ping(self):
+        return 'PONG'
+
+    def command_select(self, db):
+        return 'OK'
+
+    def command_get(self, key):
+        return self.data[key] if self._alive(key) else None
+
+    def command_mget(self, *keys):
+        return [self.command_get(key) for key in keys]
+
+    def command_set(self, key, value, *options):
+        options = [option.upper() for option in options]
+        if b'NX' in options and self._alive(key):
+            return None
+        self.data[key] = value
+        self.expires.pop(key, None)
+        if b'PX' in options:
+            milliseconds = int(options[options.index(b'PX') + 1])
+            self.expires[key] = time.monotonic() + milliseconds / 1000
+
+        return 'OK'
+
+    def command_pexpire(self, key, milliseconds):
+        if not self._alive(key):
+            return 0
+        self.expires[key] = time.monotonic() + int(milliseconds) / 1000
+
+        return 1
+
+    def command_persist(self, key):
+        return int(self.expires.pop(key, None) is not None)
+
+    def command_exists(self, *keys):
+        return sum(self._alive(key) for key in keys)
+
+    def command_del(self, *keys):
+        deleted = sum(self._alive(key) for key in keys)
+        for key in keys:
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+
+        return deleted
+
+    def command_incrby(self, key, amount):
+        value = int(self.data[key]) if self._alive(key) else 0
+        value += int(amount)
+        self.data[key] = b'%d' % value
+
+        return value
+
+    def command_flushdb(self):
+        self.data.clear()
+        self.expires.clear()
+
+        return 'OK'
+
+
+def encode_reply(reply):
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, RedisError):
+        return b'-%s\r\n' % str(reply).encode()
+    if isinstance(reply, str):
+        return b'+%s\r\n' % reply.encode()
+    if isinstance(reply, int):
+        return b':%d\r\n' % reply
+    if isinstance(reply, list):
+        return b'*%d\r\n' % len(reply) + b''.join(map(encode_reply, reply))
+
+    return b'$%d\r\n%s\r\n' % (len(reply), reply)
+
+
+class LocalRedisHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        while True:
+            try:
+                command = read_reply(self.rfile)
+            except (ConnectionError, OSError):
+                return
+            try:
+                name, *args = command
+                reply = self.server.call(name.decode(), *args)
+            except (RedisError, TypeError, ValueError) as error:
+                reply = RedisError(str(error))
+            self.wfile.write(encode_reply(reply))
@@ -0,0 +1,129 @@
+"""Хранилище файлов, адресуемых по содержимому.
+
+`ContentAddressedStorage` называет файл по SHA-256 его содержимого
+(`posts/ab/ab12….jpg`), так что одинаковые загрузки хранятся одним
+файлом, а sorl строит для них одни и те же миниатюры: ключ миниатюры
+зависит от имени исходного файла. Файл пишется во временный рядом и
+переименовывается атомарно, поэтому одновременные загрузки одного
+содержимого не мешают друг другу.
+
+Ссылки моделей на файлы считаются в `Blob`: `acquire` и `release`
+вызываются из сигналов моделей. Файл, на который больше никто не
+ссылается, удаляется вместе с миниатюрами задачей `collect_blob` после
+`BLOB_GRACE_PERIOD`, если за это время ссылка не появилась снова. Файлы
+с другими именами (загруженные до учета ссылок или указанные вручную)
+не учитываются и не удаляются.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db.models import F
+from sorl.thumbnail import default as thumbnails
+from sorl.thumbnail.images import ImageFile
+
+from .models import Blob
+from .tasks import enqueue, task
+
+HASHED_NAME = re.compile(r'(?:.+/)?([0-9a-f]{2})/\1[0-9a-f]{62}(?:\.\w+)?')
+# Сколько секунд файл без ссылок хранится до удаления.
+BLOB_GRACE_PERIOD = 60 * 60
+FILE_MODE = 0o644
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, где имя файла — хэш его содержимого."""
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        hexdigest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+
+        return posixpath.join(
+            posixpath.dirname(name), hexdigest[:2], hexdigest + extension
+        )
+
+    @staticmethod
+    def is_hashed(name):
+        """Сохранено ли имя этим хранилищем, а не задано вручную."""
+        return HASHED_NAME.fullmatch(name) is not None
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if not self.exists(name):
+            self._store(name, content)
+
+        return name
+
+    def _store(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            if hasattr(content, 'temporary_file_path'):
+                os.close(descriptor)
+                file_move_safe(
+                    content.temporary_file_path(), temporary,
+                    allow_overwrite=True,
+                )
+            else:
+                with os.fdopen(descriptor, 'wb') as output:
+                    for chunk in content.chunks():
+                        output.write(chunk)
+            os.chmod(temporary, self.file_permissions_mode or FILE_MODE)
+            # Одинаковое имя значит одинаковое содержимое, поэтому
+            # перезапись файла, сохраненного параллельно, безопасна.
+            os.replace(temporary, full_path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+
+content_storage = ContentAddressedStorage()
+
+
+def acquire(name):
+    """Добавляет ссылку на файл хранилища."""
+    if not content_storage.is_hashed(name):
+        return
+    updated = Blob.objects.filter(name=name).update(refs=F('refs') + 1)
+    if not updated:
+        _, created = Blob.objects.get_or_create(
+            name=name, defaults={'refs': 1}
+        )
+        if not created:
+            Blob.objects.filter(name=name).update(refs=F('refs') + 1)
+
+
+def release(name):
+    """Убирает ссылку и откладывает удаление файла, если ссылок нет."""
+    if not content_storage.is_hashed(name):
+        return
+    released = Blob.objects.filter(name=name, refs__gt=0).update(
+        refs=F('refs') - 1
+    )
+    if released and Blob.objects.filter(name=name, refs=0).exists():
+        enqueue(collect_blob, name, delay=BLOB_GRACE_PERIOD)
+
+
+@task()
+def collect_blob(name):
+    """Удаляет файл без ссылок и его миниатюры."""
+    deleted, _ = Blob.objects.filter(name=name, refs=0).delete()
+    if not deleted:
+        return
+    thumbnails.kvstore.delete(ImageFile(name, content_storage))
+    content_storage.delete(name)
@@ -0,0 +1,246 @@
+"""Очередь фоновых задач в базе данных.
+
+Задача — функция, отмеченная декоратором `task`. `enqueue` записывает ее
+вызов в таблицу задач в той же транзакции, что и изменение данных, так
+что задача попадает в очередь только вместе с ним. Воркер
+(`manage.py run_tasks`) забирает готовые задачи условным UPDATE, выполняет
+их в пуле потоков или процессов и при ошибке откладывает повтор с
+удваивающейся паузой. Задача с уже известным ключом идемпотентности
+повторно не ставится, пока ее запись хранится: выполненные задачи с
+ключом воркер удаляет через `KEY_TTL` после завершения. При
+`TASKS_EAGER` задачи выполняются сразу в вызывающем потоке: так работают
+тесты и локальная разработка.
+"""
+import json
+import time
+import traceback
+from concurrent.futures import (
+    FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+)
+from datetime import timedelta
+from multiprocessing import get_context
+
+import django
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+THREAD_POOL = 'thread'
+PROCESS_POOL = 'process'
+DEFAULT_RETRIES = 3
+# Пауза перед первым повтором в секундах, дальше она удваивается.
+RETRY_DELAY = 10
+# Сколько секунд задача принадлежит воркеру, прежде чем ее заберет другой.
+LEASE = 300
+# Сколько секунд после выполнения действует ключ идемпотентности задачи.
+KEY_TTL = 24 * 60 * 60
+# Как часто воркер удаляет выполненные задачи с истекшим ключом.
+PURGE_INTERVAL = 60 * 60
+
+_registry = {}
+
+
+def task(retries=DEFAULT_RETRIES, pool=THREAD_POOL):
+    """Регистрирует функцию как фоновую задачу.
+
+    Аргументы задачи должны сериализоваться в JSON. Задачи с тяжелыми
+    вычислениями отправляются в пул процессов через `pool=PROCESS_POOL`.
+    """
+    def decorator(func):
+        func.task_name = f'{func.__module__}.{func.__name__}'
+        func.retries = retries
+        func.pool = pool
+        _registry[func.task_name] = func
+
+        return func
+
+    return decorator
+
+
+def get_task(name):
+    """Находит зарегистрированную задачу, импортируя ее модуль."""
+    if name not in _registry:
+        import_string(name)
+
+    return _registry[name]
+
+
+def enqueue(func, *args, key=None, delay=0):
+    """Ставит вызов `func(*args)` в очередь и возвращает запись задачи.
+
+    Если задача с ключом `key` уже ставилась, новая не создается. При
+    `TASKS_EAGER` отложенная через `delay` задача не выполняется сразу, а
+    ждет воркера: пауза бывает нужна самой задаче.
+    """
+    fields = {
+        'name': func.task_name,
+        'args': json.dumps(args),
+        'run_at': timezone.now() + timedelta(seconds=delay),
+    }
+    if key is None:
+        queued, created = Task.objects.create(**fields), True
+    else:
+        queued, created = Task.objects.get_or_create(key=key, defaults=fields)
+    if created and settings.TASKS_EAGER and delay <= 0:
+        execute(queued, propagate=True)
+
+    return queued
+
+
+def execute(queued, propagate=False):
+    """Выполняет задачу и записывает результат.
+
+    При ошибке задача откладывается для повтора, а после исчерпания
+    попыток помечается как неудачная. Выполненные задачи без ключа
+    удаляются, с ключом — остаются до `purge_done`, чтобы ключ продолжал
+    действовать; `run_at` у них — время выполнения.
+    """
+    attempts = queued.attempts + 1
+    try:
+        func = get_task(queued.name)
+        func(*json.loads(queued.args))
+    except Exception:
+        retries = getattr(_registry.get(queued.name), 'retries', 0)
+        update = {'attempts': attempts, 'last_error': traceback.format_exc()}
+        if propagate or attempts > retries:
+            update['status'] = Task.FAILED
+        else:
+            update['status'] = Task.QUEUED
+            update['run_at'] = timezone.now() + timedelta(
+                seconds=RETRY_DELAY * 2 ** (attempts - 1)
+            )
+        Task.objects.filter(pk=queued.pk).update(**update)
+        if propagate:
+            raise
+        return False
+    if queued.key is None:
+        Task.objects.filter(pk=queued.pk).delete()
+    else:
+        Task.objects.filter(pk=queued.pk).update(
+            status=Task.DONE, attempts=attempts, last_error='',
+            run_at=timezone.now(),
+        )
+
+    return True
+
+
+def run_task(task_id):
+    """Выполняет задачу по id в потоке или процессе пула."""
+    try:
+        queued = Task.objects.filter(pk=task_id).first()
+
+        return execute(queued) if queued else False
+    finally:
+        close_old_connections()
+
+
+def purge_done(ttl=KEY_TTL):
+    """Удаляет выполненные задачи с истекшим ключом и возвращает их число."""
+    border = timezone.now() - timedelta(seconds=ttl)
+
+    return Task.objects.filter(status=Task.DONE, run_at__lt=border).delete(
+    )[0]
+
+
+def claim(limit):
+    """Забирает до `limit` готовых задач в аренду текущему воркеру.
+
+    Задача с истекшей арендой считается брошенной упавшим воркером и
+    забирается снова.
+    """
+    now = timezone.now()
+    candidates = Task.objects.filter(
+        status__in=(Task.QUEUED, Task.RUNNING), run_at__lte=now
+    ).order_by('run_at', 'pk').values_list('pk', 'status', 'run_at')
+    claimed = []
+    for pk, status, run_at in candidates[:limit]:
+        # Условие на прежние статус и время не дает двум воркерам
+        # забрать одну задачу.
+        if Task.objects.filter(pk=pk, status=status, run_at=run_at).update(
+            status=Task.RUNNING, run_at=now + timedelta(seconds=LEASE)
+        ):
+            claimed.append(pk)
+
+    return list(Task.objects.filter(pk__in=claimed).order_by('run_at', 'pk'))
+
+
+class Worker:
+    """Раздает задачи из очереди пулам потоков и процессов.
+
+    Без пулов задачи выполняются в текущем потоке по одной.
+    """
+
+    def __init__(self, threads=4, processes=2):
+        self.pools = {}
+        if threads:
+            self.pools[THREAD_POOL] = ThreadPoolExecutor(
+                threads, thread_name_prefix='tasks'
+            )
+        if processes:
+            # Новые процессы не наследуют соединения с базой родителя.
+            self.pools[PROCESS_POOL] = ProcessPoolExecutor(
+                processes,
+                mp_context=get_context('spawn'),
+                initializer=django.setup,
+            )
+        self.capacity = max(threads + processes, 1)
+        self.running = set()
+        self.purged_at = None
+
+    def get_pool(self, name):
+        try:
+            pool = get_task(name).pool
+        except (ImportError, KeyError):
+            pool = THREAD_POOL
+
+        return self.pools.get(pool) or self.pools.get(THREAD_POOL)
+
+    def run_once(self):
+        """Раздает готовые задачи на свободные места и возвращает их число."""
+        self.running = {
+            future for future in self.running if not future.done()
+        }
+        free = self.capacity - len(self.running)
+        if free <= 0:
+            return 0
+        tasks = claim(free)
+        for queued in tasks:
+            pool = self.get_pool(queued.name)
+            if pool is None:
+                execute(queued)
+            else:
+                self.running.add(pool.submit(run_task, queued.pk))
+
+        return len(tasks)
+
+    def purge(self):
+        """Раз в `PURGE_INTERVAL` удаляет выполненные задачи с истекшим
+        ключом."""
+        now = time.monotonic()
+        if self.purged_at is None or now - self.purged_at >= PURGE_INTERVAL:
+            purge_done()
+            self.purged_at = now
+
+    def run(self, once=False, poll_interval=1.0):
+        """Работает, пока не прервут; с `once` — пока есть готовые задачи."""
+        try:
+            while True:
+                self.purge()
+                if self.run_once():
+                    continue
+                if self.running:
+                    wait(
+                        self.running,
+                        timeout=poll_interval,
+                        return_when=FIRST_COMPLETED,
+                    )
+                elif once:
+                    return
+                else:
+                    time.sleep(poll_interval)
+        finally:
+            for pool in self.pools.values():
+                pool.shutdown()
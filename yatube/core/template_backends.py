@@ -0,0 +1,60 @@
+import os
+
+from django.template import engines
+from django.template.backends.django import DjangoTemplates
+from django.template.loaders.cached import Loader as CachedLoader
+from django.template.utils import get_app_template_dirs
+
+from .metrics import TemplateTimer
+
+
+class TimedTemplate:
+    """Шаблон, время отрисовки которого попадает в метрики запроса."""
+
+    def __init__(self, template):
+        self._wrapped = template
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+    def render(self, context=None, request=None):
+        with TemplateTimer():
+            return self._wrapped.render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Движок шаблонов Django с замером времени отрисовки."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+def warm_up_templates():
+    """Компилирует все шаблоны проекта в кэш загрузчика.
+
+    Работает только с кэширующим загрузчиком, иначе ничего не делает.
+    Возвращает число скомпилированных шаблонов.
+    """
+    compiled = 0
+    for backend in engines.all():
+        if not isinstance(backend, DjangoTemplates):
+            continue
+        engine = backend.engine
+        if not any(
+            isinstance(loader, CachedLoader)
+            for loader in engine.template_loaders
+        ):
+            continue
+        for directory in (*engine.dirs, *get_app_template_dirs('templates')):
+            for root, _, files in os.walk(directory):
+                for name in files:
+                    if not name.endswith('.html'):
+                        continue
+                    path = os.path.join(root, name)
+                    engine.get_template(os.path.relpath(path, directory))
+                    compiled += 1
+
+    return compiled
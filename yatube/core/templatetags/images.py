@@ -0,0 +1,78 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+MIME_TYPES = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+}
+# Форматы, которые понимает любой браузер: они идут в srcset у <img>.
+FALLBACK_TYPES = ('image/jpeg', 'image/png', 'image/gif')
+
+
+def variant_type(variant):
+    """MIME-тип миниатюры по расширению ее файла или None."""
+    return MIME_TYPES.get(variant.name.rsplit('.', 1)[-1].lower())
+
+
+def group_variants(variants):
+    """Раскладывает варианты по MIME-типу в строки srcset.
+
+    Порядок типов сохраняется, внутри типа варианты идут по ширине без
+    повторов: маленькое изображение без увеличения дает одинаковые
+    варианты разной заданной ширины.
+    """
+    groups = {}
+    for variant in variants:
+        mime_type = variant_type(variant)
+        if mime_type:
+            groups.setdefault(mime_type, {}).setdefault(
+                variant.width, variant.url
+            )
+
+    return {
+        mime_type: ', '.join(
+            f'{url} {width}w' for width, url in sorted(widths.items())
+        ) for mime_type, widths in groups.items()
+    }
+
+
+@register.simple_tag
+def responsive_image(variants, src, sizes='100vw', **attrs):
+    """Отрисовывает изображение с вариантами для srcset.
+
+    `variants` — готовые миниатюры sorl разной ширины и формата, `src` —
+    адрес для браузеров без srcset и для изображения без вариантов.
+    Современные форматы попадают в <source> элемента <picture>, а
+    JPEG, PNG и GIF — в srcset самого <img>. Остальные именованные
+    аргументы становятся атрибутами <img>.
+    """
+    groups = group_variants(variants or ())
+    fallback = next(
+        (groups.pop(mime_type) for mime_type in FALLBACK_TYPES
+         if mime_type in groups),
+        None,
+    )
+    if fallback:
+        attrs = {'srcset': fallback, 'sizes': sizes, **attrs}
+    image = format_html(
+        '<img src="{}"{}>', src,
+        format_html_join('', ' {}="{}"', attrs.items()),
+    )
+    if not groups:
+        return image
+
+    return format_html(
+        '<picture>{}{}</picture>',
+        format_html_join(
+            '', '<source type="{}" srcset="{}" sizes="{}">',
+            ((mime_type, srcset, sizes)
+             for mime_type, srcset in groups.items()),
+        ),
+        image,
+    )
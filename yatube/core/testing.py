@@ -0,0 +1,49 @@
+"""Вспомогательные классы для тестов."""
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# Строки плана SQLite, которые означают чтение всей таблицы или сортировку
+# результата во временном B-дереве.
+BAD_PLAN_MARKERS = ('USE TEMP B-TREE',)
+
+
+def explain(sql):
+    """Возвращает строки EXPLAIN QUERY PLAN для запроса SQLite."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def is_full_scan(detail):
+    """SCAN без индекса: таблица читается целиком."""
+    return detail.startswith('SCAN ') and ' USING ' not in detail
+
+
+class QueryPlanMixin:
+    """Проверяет, что запросы внутри блока используют индексы."""
+
+    @contextmanager
+    def assertQueriesUseIndexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN есть только в SQLite')
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        for query in context.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            plan = explain(sql)
+            bad = [
+                detail for detail in plan
+                if is_full_scan(detail)
+                or any(marker in detail for marker in BAD_PLAN_MARKERS)
+            ]
+            if bad:
+                self.fail(
+                    'Запрос не использует индекс:\n{}\n{}'.format(
+                        sql, '\n'.join(plan)
+                    )
+                )
@@ -0,0 +1,996 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http import HTTPStatus
+from io import BytesIO
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connections
+from django.template import TemplateSyntaxError, engines
+from django.test import (
+    Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase,
+    override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from PIL import Image
+from sorl.thumbnail import default as thumbnail_default, get_thumbnail
+
+from posts.models import Follow, Group, Post, TimelineEntry, User
+from posts.seeding import seed_dataset
+from .auth import get_user
+from .benchmark import (
+    CARD_LOOP, IMAGES_USER, NAMESPACES, UPLOAD_USER, collect_routes,
+    compare, get_fixtures, image_bytes_benchmark, make_feed_posts,
+    render_benchmark, run_suite, upload_benchmark
+)
+from .cache import TwoTierCache
+from .cache_control import NO_STORE, PRIVATE, PUBLIC, SHARED, STATIC
+from .db import PRIMARY_COOKIE, use_replica
+from .metrics import Counter, Histogram, Registry, registry
+from .models import Blob, Task
+from .template_backends import warm_up_templates
+from .thumbnails import KVStore, get_ready_thumbnails
+from .redis import LocalRedisServer, RedisClient, RedisError, read_reply
+from .storage import ContentAddressedStorage, collect_blob, content_storage
+from .tasks import KEY_TTL, RETRY_DELAY, claim, enqueue, task
+
+
+class LocalRedisMixin:
+    """Поднимает LocalRedisServer и настраивает на него кэши."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalRedisServer().start()
+        cls.cache_settings = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'core.cache.TwoTierCache',
+                'OPTIONS': {
+                    'SHARED': 'shared',
+                    'LOCAL_MAX_ENTRIES': 2,
+                    'GENERATION_CHECK_INTERVAL': 0,
+                },
+            },
+            'shared': {
+                'BACKEND': 'core.cache.RedisCache',
+                'LOCATION': cls.server.url,
+            },
+        })
+        cls.cache_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.cache_settings.disable()
+        cls.server.stop()
+
+    def setUp(self):
+        caches['shared'].clear()
+
+
+class RedisCacheTests(LocalRedisMixin, SimpleTestCase):
+    """Тесты кэша поверх LocalRedisServer."""
+
+    def setUp(self):
+        super().setUp()
+        self.cache = caches['shared']
+
+    def test_set_get_delete(self):
+        """Значения сохраняются, читаются и удаляются."""
+        self.cache.set('key', {'value': [1, 2]})
+        self.assertEqual(self.cache.get('key'), {'value': [1, 2]})
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_add_incr_and_many(self):
+        """add не перезаписывает ключ, incr и *_many работают."""
+        self.assertTrue(self.cache.add('counter', 1))
+        self.assertFalse(self.cache.add('counter', 5))
+        self.assertEqual(self.cache.incr('counter', 2), 3)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set_many({'a': 'A', 'b': 'B'})
+        self.assertEqual(
+            self.cache.get_many(['a', 'b', 'c']), {'a': 'A', 'b': 'B'}
+        )
+
+    def test_pipeline_error_keeps_connection_in_sync(self):
+        """Ошибка в пакете не оставляет непрочитанных ответов."""
+        client = RedisClient(self.server.url)
+        self.addCleanup(client.close)
+        with self.assertRaises(RedisError):
+            client.pipeline(('SET', 'a', 'A'), ('BOGUS',), ('GET', 'a'))
+        self.assertIsNone(client.execute('GET', 'b'))
+
+    def test_pipeline_retries_only_unsent_commands(self):
+        """Пакет повторяется, только если он не ушел на сервер."""
+        client = RedisClient(self.server.url)
+        self.addCleanup(client.close)
+        client.execute('SET', 'counter', 0)
+        client_thread = threading.current_thread()
+
+        def lost_reply(stream):
+            # Сервер читает команды той же функцией в своем потоке.
+            reply = read_reply(stream)
+            if threading.current_thread() is not client_thread:
+                return reply
+            # Команда выполнена, но ответ до клиента не дошел.
+            raise ConnectionError
+
+        with mock.patch('core.redis.read_reply', lost_reply):
+            with self.assertRaises(ConnectionError):
+                client.execute('INCRBY', 'counter', 1)
+        self.assertEqual(client.execute('GET', 'counter'), b'1')
+        # Сервер закрыл соединение, и отправка не удалась.
+        client._local.connection[0].close()
+        self.assertEqual(client.execute('INCRBY', 'counter', 1), 2)
+
+    def test_timeout(self):
+        """Ключ истекает по таймауту."""
+        self.cache.set('short', 'value', 0.01)
+        time.sleep(0.05)
+        self.assertIsNone(self.cache.get('short'))
+
+
+class TwoTierCacheTests(LocalRedisMixin, SimpleTestCase):
+    """Тесты двухуровневого кэша."""
+
+    def make_process_cache(self):
+        """Кэш, как его видит другой процесс со своим локальным уровнем."""
+        return TwoTierCache(None, {
+            'OPTIONS': {'SHARED': 'shared', 'GENERATION_CHECK_INTERVAL': 0},
+        })
+
+    def test_local_tier_serves_hits(self):
+        """Повторное чтение не обращается к общему кэшу."""
+        cache = caches['default']
+        cache.set('key', 'local')
+        caches['shared'].set('key', 'shared')
+        self.assertEqual(cache.get('key'), 'local')
+
+    def test_local_tier_is_bounded(self):
+        """Локальный уровень вытесняет давно не читанные ключи."""
+        cache = caches['default']
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key)
+        caches['shared'].set('a', 'shared')
+        self.assertEqual(cache.get('a'), 'shared')
+        self.assertEqual(cache.get('c'), 'c')
+
+    def test_generation_bump_clears_other_processes(self):
+        """clear() в одном процессе сбрасывает локальные уровни других."""
+        first, second = self.make_process_cache(), self.make_process_cache()
+        first.set('key', 'old')
+        self.assertEqual(second.get('key'), 'old')
+        second.clear()
+        caches['shared'].set('key', 'new')
+        self.assertEqual(first.get('key'), 'new')
+
+
+class TwoTierSiteTests(LocalRedisMixin, TestCase):
+    """Сайт работает с двухуровневым кэшем."""
+
+    def test_index_page(self):
+        """Главная страница отдается и кэшируется."""
+        for _ in range(2):
+            response = self.client.get('/')
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+
+
+class BenchmarkTests(TestCase):
+    """Тесты наполнения базы и нагрузочного прогона."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.created = seed_dataset(
+            users=30, posts=60, groups=3, follows_per_user=4, comments=20,
+            image_ratio=0,
+        )
+
+    def test_seed_dataset(self):
+        """Набор данных создан вместе с лентами и счетчиками."""
+        self.assertEqual(Post.objects.count(), 60)
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Follow.objects.count(), self.created['follows'])
+        self.assertTrue(TimelineEntry.objects.exists())
+        author = Post.objects.first().author
+        self.assertEqual(
+            author.stats.posts_count, author.posts.count()
+        )
+
+    def test_run_suite_covers_all_routes(self):
+        """Прогон замеряет все маршруты posts, users и about."""
+        results = run_suite(transports=('client',), requests=2)
+        routes = {key.split()[-1] for key in results}
+        for namespace in NAMESPACES:
+            self.assertTrue(
+                any(route.startswith(f'{namespace}:') for route in routes)
+            )
+        self.assertIn('client user posts:follow_index', results)
+        for key, result in results.items():
+            with self.subTest(key=key):
+                self.assertLess(result['status'], 500)
+        # Сессия восстанавливается после маршрута выхода.
+        after_logout = results['client user users:password_change_form']
+        self.assertEqual(after_logout['status'], HTTPStatus.OK)
+        self.assertEqual(compare(results, results), [])
+        baseline = {
+            key: {**result, 'queries': result['queries'] - 1}
+            for key, result in results.items()
+        }
+        self.assertTrue(compare(results, baseline))
+
+    @override_settings(MEDIA_ROOT=tempfile.gettempdir())
+    def test_upload_benchmark(self):
+        """Замер загрузки создает пост и убирает его за собой."""
+        results = upload_benchmark(sizes=(0.1,), transport='client')
+        self.assertEqual(results['0.1 Мп']['status'], HTTPStatus.FOUND)
+        self.assertGreaterEqual(results['0.1 Мп']['peak_rss_bytes'], 0)
+        self.assertFalse(User.objects.filter(username=UPLOAD_USER).exists())
+
+    def test_image_bytes_benchmark(self):
+        """Узкому экрану из srcset достается меньше байт."""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with self.settings(MEDIA_ROOT=media_root):
+            results = image_bytes_benchmark(((360, 1),), posts=2)
+        result = results['360x1']
+        self.assertLess(result['after_bytes'], result['before_bytes'])
+        self.assertGreater(result['saved'], 0)
+        self.assertFalse(User.objects.filter(username=IMAGES_USER).exists())
+
+
+class MetricsTests(TestCase):
+    """Тесты метрик запросов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+        cls.user = User.objects.create_user(username='not_staff')
+
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+
+    def get_metrics(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+        return response.content.decode()
+
+    def test_metrics_per_view(self):
+        """Запросы учитываются с именем представления."""
+        for _ in range(2):
+            self.client.get(reverse('posts:index'))
+        text = self.get_metrics()
+        view = 'view="posts:index"'
+        for line in (
+            f'yatube_http_request_duration_seconds_count{{{view}}} 2',
+            f'yatube_http_responses_total{{{view},status="200"}} 2',
+            f'yatube_db_queries_count{{{view}}} 2',
+            f'yatube_template_render_duration_seconds_count{{{view}}} 2',
+            f'yatube_http_response_size_bytes_count{{{view}}} 2',
+        ):
+            self.assertIn(line, text)
+        # Второй запрос отдан из кэша страниц.
+        self.assertRegex(text, rf'yatube_cache_hits_total{{{view}}} [1-9]')
+        self.assertRegex(text, rf'yatube_cache_misses_total{{{view}}} [1-9]')
+
+    def test_metrics_are_for_staff_only(self):
+        """Страница метрик недоступна обычным пользователям."""
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+
+    def test_registry_sums_threads(self):
+        """Значения из разных потоков складываются при чтении."""
+        local = Registry(
+            Counter('hits', 'Счетчик.'), Histogram('size', 'Размер.', (1, 10))
+        )
+
+        def work():
+            for value in range(20):
+                local.observe('hits', (), 1)
+                local.observe('size', (('view', 'v'),), value)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        text = local.render()
+        self.assertIn('hits 80', text)
+        self.assertIn('size_bucket{view="v",le="1"} 8', text)
+        self.assertIn('size_bucket{view="v",le="10"} 44', text)
+        self.assertIn('size_bucket{view="v",le="+Inf"} 80', text)
+        self.assertIn('size_sum{view="v"} 760', text)
+
+
+class TemplateTests(SimpleTestCase):
+    """Тесты встраивания шаблонов и кэширующего загрузчика."""
+
+    def test_inline_include_matches_include(self):
+        """inline_include отрисовывает то же, что и include."""
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        context = {'page_obj': make_feed_posts(3)}
+        engine = engines['django']
+        rendered = [
+            engine.from_string(CARD_LOOP % tag).render(context, request)
+            for tag in ('include', 'inline_include')
+        ]
+        self.assertIn('Текст поста 3', rendered[1])
+        self.assertEqual(rendered[0], rendered[1])
+
+    def test_inline_include_requires_literal_name(self):
+        """Имя встраиваемого шаблона должно быть строкой."""
+        with self.assertRaises(TemplateSyntaxError):
+            engines['django'].from_string(
+                '{% load inline_include %}{% inline_include name %}'
+            )
+
+    def test_warm_up_templates(self):
+        """Прогрев компилирует шаблоны в кэш загрузчика."""
+        self.assertEqual(warm_up_templates(), 0)
+        options = dict(settings.TEMPLATES[0]['OPTIONS'])
+        options['loaders'] = [
+            ('django.template.loaders.cached.Loader', options['loaders'])
+        ]
+        templates = [{**settings.TEMPLATES[0], 'OPTIONS': options}]
+        with override_settings(TEMPLATES=templates):
+            self.assertGreater(warm_up_templates(), 0)
+            loader = engines['django'].engine.template_loaders[0]
+            self.assertIn('posts/index.html', loader.get_template_cache)
+
+    def test_responsive_image(self):
+        """Современные форматы идут в <source>, JPEG — в srcset <img>."""
+        variants = [
+            SimpleNamespace(name=f'cache/{width}.{extension}',
+                            url=f'/media/{width}.{extension}', width=width)
+            for extension in ('webp', 'jpg') for width in (640, 320, 320)
+        ]
+        template = engines['django'].from_string(
+            '{% load images %}'
+            '{% responsive_image variants "/a.jpg" sizes="50vw" alt="x" %}'
+        )
+        self.assertHTMLEqual(
+            template.render({'variants': variants}),
+            '<picture><source type="image/webp" sizes="50vw" '
+            'srcset="/media/320.webp 320w, /media/640.webp 640w">'
+            '<img src="/a.jpg" sizes="50vw" alt="x" '
+            'srcset="/media/320.jpg 320w, /media/640.jpg 640w"></picture>',
+        )
+        self.assertHTMLEqual(
+            template.render({'variants': []}), '<img src="/a.jpg" alt="x">'
+        )
+
+    def test_render_benchmark(self):
+        """Замер отрисовки возвращает время для всех вариантов."""
+        results = render_benchmark(sizes=(2,), repeat=1)
+        self.assertIn('posts/follow.html cached 2', results)
+        self.assertIn('post_card inline_include 2', results)
+
+
+calls = []
+
+
+@task(retries=1)
+def record(value):
+    calls.append(value)
+
+
+@task(retries=1)
+def fail(value):
+    raise RuntimeError(value)
+
+
+@override_settings(TASKS_EAGER=False)
+class TaskTests(TestCase):
+    """Тесты очереди фоновых задач."""
+
+    def setUp(self):
+        calls.clear()
+
+    def run_worker(self):
+        call_command(
+            'run_tasks', once=True, threads=0, processes=0, poll_interval=0
+        )
+
+    def test_eager_tasks_run_immediately(self):
+        """В режиме TASKS_EAGER задача выполняется сразу и один раз."""
+        with self.settings(TASKS_EAGER=True):
+            enqueue(record, 1)
+            enqueue(record, 2, key='record:2')
+            enqueue(record, 2, key='record:2')
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual(
+            list(Task.objects.values_list('key', 'status')),
+            [('record:2', Task.DONE)],
+        )
+
+    def test_eager_mode_keeps_delay(self):
+        """Отложенная задача и в режиме TASKS_EAGER ждет воркера."""
+        with self.settings(TASKS_EAGER=True):
+            queued = enqueue(record, 1, delay=60)
+        self.assertEqual(calls, [])
+        self.assertEqual(Task.objects.get().status, Task.QUEUED)
+        Task.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        self.run_worker()
+        self.assertEqual(calls, [1])
+
+    def test_worker_runs_queued_tasks(self):
+        """Воркер выполняет отложенные задачи по порядку."""
+        enqueue(record, 1)
+        enqueue(record, 2)
+        enqueue(record, 3, delay=60)
+        self.assertEqual(calls, [])
+        self.run_worker()
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_retries_with_backoff(self):
+        """Упавшая задача повторяется с паузой, затем помечается ошибкой."""
+        queued = enqueue(fail, 'boom')
+        self.run_worker()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Task.QUEUED)
+        self.assertEqual(queued.attempts, 1)
+        self.assertIn('RuntimeError: boom', queued.last_error)
+        self.assertGreater(
+            queued.run_at, timezone.now() + timedelta(seconds=RETRY_DELAY - 1)
+        )
+        Task.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        self.run_worker()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Task.FAILED)
+        self.assertEqual(queued.attempts, 2)
+
+    def test_worker_purges_expired_keys(self):
+        """Выполненные задачи с ключом удаляются через KEY_TTL."""
+        enqueue(record, 1, key='record:1')
+        enqueue(record, 2, key='record:2')
+        self.run_worker()
+        Task.objects.filter(key='record:1').update(
+            run_at=timezone.now() - timedelta(seconds=KEY_TTL + 1)
+        )
+        self.run_worker()
+        self.assertEqual(
+            list(Task.objects.values_list('key', flat=True)), ['record:2']
+        )
+        enqueue(record, 1, key='record:1')
+        self.run_worker()
+        self.assertEqual(calls, [1, 2, 1])
+
+    def test_expired_lease_is_reclaimed(self):
+        """Задачу упавшего воркера забирает другой после конца аренды."""
+        queued = enqueue(record, 1)
+        Task.objects.filter(pk=queued.pk).update(
+            status=Task.RUNNING, run_at=timezone.now() + timedelta(seconds=60)
+        )
+        self.assertEqual(claim(10), [])
+        Task.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        self.assertEqual([task.pk for task in claim(10)], [queued.pk])
+        self.assertEqual(claim(10), [])
+
+    def test_follow_backfill_runs_in_worker(self):
+        """Подписка ставит заполнение ленты в очередь."""
+        author = User.objects.create_user(username='task_author')
+        reader = User.objects.create_user(username='task_reader')
+        Post.objects.create(text='Пост', author=author)
+        Follow.objects.create(user=reader, author=author)
+        self.assertFalse(TimelineEntry.objects.filter(user=reader).exists())
+        self.run_worker()
+        self.assertTrue(TimelineEntry.objects.filter(user=reader).exists())
+        self.assertFalse(Task.objects.exclude(status=Task.DONE).exists())
+
+
+REPLICA = 'replica_test'
+
+
+class ReplicaTests(TransactionTestCase):
+    """Тесты чтения лент с реплики, которую изображает второй файл SQLite."""
+
+    databases = {'default', REPLICA}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        connections.databases[REPLICA] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(cls.directory, 'replica.sqlite3'),
+        }
+        connections.ensure_defaults(REPLICA)
+        connections.prepare_test_settings(REPLICA)
+        call_command('migrate', database=REPLICA, verbosity=0)
+        cls.replicas = override_settings(DATABASE_REPLICAS=[REPLICA])
+        cls.replicas.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.replicas.disable()
+        connections[REPLICA].close()
+        del connections.databases[REPLICA]
+        delattr(connections._connections, REPLICA)
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='replica_author')
+        Post.objects.create(text='Пост из основной базы', author=self.user)
+        User.objects.using(REPLICA).bulk_create([
+            User(pk=self.user.pk, username=self.user.username)
+        ])
+        Post.objects.using(REPLICA).bulk_create([
+            Post(text='Пост из реплики', author_id=self.user.pk)
+        ])
+
+    def get_feed(self, client):
+        response = client.get(reverse('posts:index'))
+
+        return [post.text for post in response.context['page_obj']]
+
+    @override_settings(REPLICA_STICKY_SECONDS=0)
+    def test_feeds_read_from_replica(self):
+        """Ленты читаются с реплики, запись идет в основную базу."""
+        self.assertEqual(self.get_feed(self.client), ['Пост из реплики'])
+
+        with use_replica():
+            post = Post.objects.get()
+            post.text = 'Исправленный пост'
+            post.save()
+        self.assertTrue(
+            Post.objects.filter(text='Исправленный пост').exists()
+        )
+        self.assertFalse(
+            Post.objects.using(REPLICA).filter(
+                text='Исправленный пост'
+            ).exists()
+        )
+
+    def test_export_streams_from_replica(self):
+        """Выгрузка читает реплику, хотя поток отдается после представления."""
+        response = self.client.get(reverse(
+            'posts:api_profile_export', args=(self.user.username,)
+        ))
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn('Пост из реплики', content)
+        self.assertNotIn('Пост из основной базы', content)
+
+    def test_writer_reads_own_writes(self):
+        """После записи клиент какое-то время читает из основной базы."""
+        writer = Client()
+        writer.force_login(self.user)
+        response = writer.post(
+            reverse('posts:post_create'), {'text': 'Только что написан'}
+        )
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+        self.assertEqual(
+            response.cookies[PRIMARY_COOKIE]['max-age'],
+            settings.REPLICA_STICKY_SECONDS,
+        )
+        self.assertEqual(
+            self.get_feed(writer),
+            ['Только что написан', 'Пост из основной базы'],
+        )
+        # Ленты без кэша страниц у остальных читаются с реплики.
+        reader = Client()
+        reader.force_login(self.user)
+        response = reader.get(reverse('posts:popular'))
+        self.assertEqual(
+            [post.text for post in response.context['page_obj']],
+            ['Пост из реплики'],
+        )
+
+    def test_sessions_and_users_read_from_primary(self):
+        """Только что вошедший не становится анонимом на отстающей реплике."""
+        User.objects.create_user(username='newcomer', password='pass-12345')
+        client = Client()
+        response = client.post(reverse('users:login'), {
+            'username': 'newcomer', 'password': 'pass-12345'
+        })
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+        client.cookies.pop(PRIMARY_COOKIE)
+        response = client.get(reverse('posts:popular'))
+        self.assertEqual(response.context['user'].username, 'newcomer')
+        self.assertEqual(
+            [post.text for post in response.context['page_obj']],
+            ['Пост из реплики'],
+        )
+
+    def test_recent_changes_cached_from_primary(self):
+        """Страницу со свежими изменениями кэш и ETag берут из основной базы.
+
+        Версия главной сменилась только что, и реплика могла ее еще не
+        догнать, поэтому ни аноним, ни вошедший не видят отстающую
+        реплику.
+        """
+        self.assertEqual(
+            self.get_feed(self.client), ['Пост из основной базы']
+        )
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Пост из основной базы')
+        reader = Client()
+        reader.force_login(self.user)
+        response = reader.get(
+            reverse('posts:profile', args=(self.user.username,))
+        )
+        self.assertTrue(response.has_header('ETag'))
+        self.assertEqual(
+            [post.text for post in response.context['page_obj']],
+            ['Пост из основной базы'],
+        )
+
+
+@override_settings(
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+    SESSION_CACHE_ALIAS='shared',
+    USER_CACHE='shared',
+)
+class AuthCacheTests(LocalRedisMixin, TestCase):
+    """Тесты сессий и пользователей без запросов к базе."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='reader', password='old-password-123'
+        )
+        self.client.force_login(self.user)
+
+    def get_auth_queries(self, client):
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+        return [
+            query['sql'] for query in queries
+            if 'auth_user' in query['sql'] or 'django_session' in query['sql']
+        ]
+
+    def test_no_auth_queries_in_steady_state(self):
+        """Повторный запрос не читает сессию и пользователя из базы."""
+        self.get_auth_queries(self.client)
+        self.assertEqual(self.get_auth_queries(self.client), [])
+
+    def test_signed_cookie_sessions(self):
+        """Сессия в подписанной cookie не обращается к базе."""
+        engine = 'django.contrib.sessions.backends.signed_cookies'
+        with self.settings(SESSION_ENGINE=engine):
+            client = Client()
+            client.force_login(self.user)
+            self.get_auth_queries(client)
+            self.assertEqual(self.get_auth_queries(client), [])
+
+    def test_password_change_ends_other_sessions(self):
+        """После смены пароля старые сессии перестают действовать."""
+        other = Client()
+        other.force_login(self.user)
+        self.get_auth_queries(other)
+        response = self.client.post(reverse('users:password_change_form'), {
+            'old_password': 'old-password-123',
+            'new_password1': 'new-password-456',
+            'new_password2': 'new-password-456',
+        })
+        self.assertRedirects(response, reverse('users:password_change_done'))
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        response = other.get(reverse('posts:follow_index'))
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+
+    @override_settings(
+        SESSION_ENGINE='django.contrib.sessions.backends.db',
+        USER_CACHE=None,
+    )
+    def test_without_shared_cache(self):
+        """Без общего кэша пароль, смененный другим процессом, сразу
+        завершает сессию."""
+        client = Client()
+        client.force_login(self.user)
+        self.get_auth_queries(client)
+        self.assertNotEqual(self.get_auth_queries(client), [])
+        # Сигнал другого процесса до этого процесса не дошел бы.
+        User.objects.filter(pk=self.user.pk).update(
+            password=make_password('new-password-456')
+        )
+        response = client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+
+    def test_cached_user_is_a_copy(self):
+        """Изменения пользователя в запросе не попадают в кэш."""
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        first = get_user(request)
+        first.username = 'changed'
+        self.assertEqual(get_user(request).username, 'reader')
+
+
+class ContentStorageTests(TestCase):
+    """Тесты хранилища, адресуемого по содержимому."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        # Содержимое файлов — не картинки: миниатюры только ставятся в
+        # очередь.
+        settings_override = self.settings(
+            MEDIA_ROOT=media_root, TASKS_EAGER=False
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.author = User.objects.create_user(username='blob_author')
+
+    def create_post(self, content=b'GIF89a', name='photo.GIF'):
+        return Post.objects.create(
+            text='Пост', author=self.author, image=ContentFile(content, name)
+        )
+
+    def test_name_is_content_hash(self):
+        """Одинаковое содержимое сохраняется одним файлом."""
+        storage = ContentAddressedStorage()
+        digest = hashlib.sha256(b'content').hexdigest()
+        first = storage.save('posts/a.JPG', ContentFile(b'content'))
+        second = storage.save('posts/b.jpg', ContentFile(b'content'))
+        self.assertEqual(first, f'posts/{digest[:2]}/{digest}.jpg')
+        self.assertEqual(second, first)
+        self.assertEqual(os.listdir(os.path.dirname(storage.path(first))), [
+            os.path.basename(first)
+        ])
+
+    def test_posts_share_file_and_count_refs(self):
+        """Посты с одним изображением ссылаются на один файл."""
+        first = self.create_post()
+        second = self.create_post(name='copy.gif')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(Blob.objects.get(name=first.image.name).refs, 2)
+        first.delete()
+        self.assertEqual(Blob.objects.get(name=second.image.name).refs, 1)
+        self.assertFalse(
+            Task.objects.filter(name=collect_blob.task_name).exists()
+        )
+
+    def test_unreferenced_file_is_collected(self):
+        """Файл без ссылок удаляется после паузы, если ссылка не
+        появилась снова."""
+        post = self.create_post()
+        name = post.image.name
+        post.delete()
+        queued = Task.objects.get(name=collect_blob.task_name)
+        self.assertGreater(queued.run_at, timezone.now())
+        # Пока удаление в очереди, такой же файл загрузили снова.
+        again = self.create_post()
+        collect_blob(name)
+        self.assertTrue(content_storage.exists(name))
+        again.delete()
+        collect_blob(name)
+        self.assertFalse(content_storage.exists(name))
+        self.assertFalse(Blob.objects.filter(name=name).exists())
+
+    def test_replaced_image_is_released(self):
+        """Замена изображения освобождает прежний файл."""
+        post = self.create_post()
+        previous = post.image.name
+        post.image = ContentFile(b'GIF89a-other', 'other.gif')
+        post.save()
+        self.assertEqual(Blob.objects.get(name=previous).refs, 0)
+        self.assertEqual(Blob.objects.get(name=post.image.name).refs, 1)
+
+    def test_files_without_refs_are_kept(self):
+        """Файлы, загруженные до учета ссылок, не удаляются."""
+        name = content_storage.save('posts/old.gif', ContentFile(b'old'))
+        collect_blob(name)
+        self.assertTrue(content_storage.exists(name))
+
+
+class ThumbnailStoreTests(TestCase):
+    """Тесты пакетного чтения записей миниатюр."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = self.settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        thumbnail_default.kvstore.memo.clear()
+        author = User.objects.create_user(username='thumbnail_author')
+        self.posts = [
+            Post.objects.create(
+                text='Пост', author=author, image=ContentFile(
+                    self.jpeg((40, 30 + number)), f'photo{number}.jpg'
+                ),
+            ) for number in range(3)
+        ]
+
+    @staticmethod
+    def jpeg(size):
+        output = BytesIO()
+        Image.new('RGB', size, 'blue').save(output, format='JPEG')
+
+        return output.getvalue()
+
+    def test_plan_matches_get_thumbnail(self):
+        """Вычисленное имя совпадает с именем созданной миниатюры."""
+        image = self.posts[0].image
+        self.assertEqual(
+            thumbnail_default.backend.plan(image, '20x10', crop='top').name,
+            get_thumbnail(image, '20x10', crop='top').name,
+        )
+
+    def test_ready_thumbnails_in_one_query(self):
+        """Миниатюры пачки ищутся одним запросом, повторно — без запросов."""
+        images = [post.image for post in self.posts]
+        thumbnails = [get_thumbnail(image, '20') for image in images[:2]]
+        cache.clear()
+        thumbnail_default.kvstore.memo.clear()
+        with self.assertNumQueries(1):
+            ready = get_ready_thumbnails(images, '20')
+        self.assertEqual(
+            {name: thumbnail.name for name, thumbnail in ready.items()},
+            {
+                image.name: thumbnail.name
+                for image, thumbnail in zip(images, thumbnails)
+            },
+        )
+        self.assertEqual(ready[images[0].name].size, [20, 15])
+        cache.clear()
+        with self.assertNumQueries(1):
+            get_ready_thumbnails(images, '20')
+        with self.assertNumQueries(0):
+            get_ready_thumbnails(images, '20')
+
+    def test_thumbnail_from_worker_becomes_visible(self):
+        """Отсутствие записи помнится недолго: миниатюра из воркера,
+        записанная мимо кэша этого процесса, появляется."""
+        image = self.posts[0].image
+        self.assertEqual(get_ready_thumbnails([image], '20'), {})
+        worker_cache = LocMemCache('thumbnail-worker', {})
+        with mock.patch.object(KVStore, 'cache', worker_cache):
+            thumbnail = get_thumbnail(image, '20')
+        self.assertEqual(get_ready_thumbnails([image], '20'), {})
+        later = time.time() + settings.THUMBNAIL_MISS_TIMEOUT + 1
+        with mock.patch('time.time', return_value=later):
+            ready = get_ready_thumbnails([image], '20')
+        self.assertEqual(ready[image.name].name, thumbnail.name)
+
+
+class CacheControlTests(TestCase):
+    """Тесты политик Cache-Control для всех маршрутов."""
+
+    POLICIES = {
+        'posts:index': PUBLIC,
+        'posts:group_list': PUBLIC,
+        'posts:group_popular': PUBLIC,
+        'posts:popular': PUBLIC,
+        'posts:profile': PUBLIC,
+        'posts:post_detail': PUBLIC,
+        'posts:comments': PUBLIC,
+        'posts:search': PUBLIC,
+        'posts:follow_index': PRIVATE,
+        'posts:post_create': NO_STORE,
+        'posts:post_edit': NO_STORE,
+        'posts:add_comment': NO_STORE,
+        'posts:profile_follow': NO_STORE,
+        'posts:profile_unfollow': NO_STORE,
+        'posts:api_index': SHARED,
+        'posts:api_group_list': SHARED,
+        'posts:api_group_export': SHARED,
+        'posts:api_profile': SHARED,
+        'posts:api_profile_export': SHARED,
+        'posts:api_follow_index': PRIVATE,
+        'users:signup': NO_STORE,
+        'users:logout': NO_STORE,
+        'users:login': NO_STORE,
+        'users:password_change_form': NO_STORE,
+        'users:password_change_done': NO_STORE,
+        'users:password_reset_form': NO_STORE,
+        'users:password_reset_done': NO_STORE,
+        'users:password_reset_confirm': NO_STORE,
+        'users:password_reset_complete': NO_STORE,
+        'about:author': STATIC,
+        'about:tech': STATIC,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader')
+        group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, text='Текст поста', group=group
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def cache_control(self, name, **kwargs):
+        response = self.client.get(reverse(name, kwargs=kwargs))
+
+        return set(response['Cache-Control'].split(', ')), response
+
+    def test_every_route_has_policy(self):
+        """У каждого маршрута объявлена ожидаемая политика."""
+        routes = collect_routes(get_fixtures()['kwargs'])
+        self.assertEqual(
+            {route.name for route in routes}, set(self.POLICIES)
+        )
+        for route in routes:
+            with self.subTest(route=route.name):
+                self.assertIs(
+                    resolve(route.path).func.cache_policy,
+                    self.POLICIES[route.name],
+                )
+        self.assertIs(resolve(reverse('metrics')).func.cache_policy, NO_STORE)
+
+    def test_public_pages_shared_with_anonymous(self):
+        """Аноним получает публичный ответ с Vary: Cookie, и из кэша тоже."""
+        for name, kwargs, policy in (
+            ('posts:index', {}, PUBLIC),
+            ('posts:post_detail', {'post_id': self.post.pk}, PUBLIC),
+            ('about:author', {}, STATIC),
+        ):
+            for attempt in range(2):
+                with self.subTest(name=name, attempt=attempt):
+                    directives, response = self.cache_control(name, **kwargs)
+                    self.assertEqual(directives, {
+                        'public',
+                        f'max-age={policy.max_age}',
+                        'stale-while-revalidate='
+                        f'{policy.stale_while_revalidate}',
+                    })
+                    self.assertIn('Cookie', response['Vary'])
+
+    def test_personal_pages_private_for_user(self):
+        """Вошедшему страницы с меню и формами не отдаются в общий кэш."""
+        self.client.force_login(self.user)
+        for name, kwargs in (
+            ('posts:index', {}),
+            ('posts:post_detail', {'post_id': self.post.pk}),
+            ('posts:follow_index', {}),
+        ):
+            with self.subTest(name=name):
+                directives, _ = self.cache_control(name, **kwargs)
+                self.assertEqual(directives, {'private', 'no-cache'})
+
+    def test_shared_api_public_for_user(self):
+        """JSON-лента одинакова для всех и публична даже для вошедшего."""
+        self.client.force_login(self.user)
+        directives, _ = self.cache_control('posts:api_index')
+        self.assertIn('public', directives)
+        directives, _ = self.cache_control('posts:api_follow_index')
+        self.assertEqual(directives, {'private', 'no-cache'})
+
+    def test_forms_and_errors_not_shared(self):
+        """Формы с CSRF-токеном не хранятся, ошибки не публичны."""
+        directives, _ = self.cache_control('users:login')
+        self.assertIn('no-store', directives)
+        self.assertNotIn('public', directives)
+        directives, response = self.cache_control(
+            'posts:api_profile', username='missing'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        self.assertEqual(directives, {'private', 'no-cache'})
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': 'Комментарий'},
+        )
+        self.assertIn('no-store', response['Cache-Control'])
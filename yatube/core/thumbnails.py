@@ -0,0 +1,212 @@
+"""Метаданные миниатюр sorl-thumbnail без запроса на каждое изображение.
+
+sorl хранит имя и размер каждого файла в хранилище ключей: сначала в
+кэше, затем в таблице `thumbnail_kvstore`, и `get_thumbnail` читает его
+для каждого изображения отдельно. `KVStore` добавляет перед кэшем память
+процесса и метод `get_many`, который достает записи для целой страницы
+или пачки постов одним `get_many` кэша и одним запросом к базе.
+`ThumbnailBackend.plan` вычисляет файл миниатюры так же, как
+`get_thumbnail`, но без обращения к хранилищу, так что миниатюры пачки
+изображений находятся одним `get_many`. Кроме форматов sorl бэкенд
+сохраняет миниатюры в AVIF, если Pillow умеет его записывать.
+
+В памяти процесса хранятся только записи файлов: они не меняются, пока
+файл существует. Удаление записи в другом процессе становится видно
+здесь не позже `THUMBNAIL_MEMO_TIMEOUT`, а миниатюра, созданная
+воркером, — не позже `THUMBNAIL_MISS_TIMEOUT`.
+"""
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.base import (
+    EXTENSIONS, ThumbnailBackend as BaseThumbnailBackend
+)
+from sorl.thumbnail.conf import defaults as thumbnail_defaults
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.helpers import serialize, tokey
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import (
+    EMPTY_VALUE, KVStore as CachedDBKVStore
+)
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+# SQLite ограничивает число параметров запроса.
+KEYS_PER_QUERY = 500
+FORMAT_EXTENSIONS = {**EXTENSIONS, 'AVIF': 'avif'}
+
+
+def saveable_formats(formats):
+    """Форматы из списка, в которых Pillow умеет сохранять изображения."""
+    Image.init()
+
+    return [image_format for image_format in formats
+            if image_format in Image.SAVE]
+
+
+class KVStore(CachedDBKVStore):
+    """Хранилище ключей sorl с памятью процесса и пакетным чтением."""
+
+    def __init__(self):
+        super().__init__()
+        self.memo = LocMemCache('core-thumbnails', {
+            'TIMEOUT': settings.THUMBNAIL_MEMO_TIMEOUT,
+            'OPTIONS': {'MAX_ENTRIES': settings.THUMBNAIL_MEMO_SIZE},
+        })
+
+    def is_memoized(self, key):
+        # Списки миниатюр источника меняются, записи файлов — нет.
+        return key.startswith(add_prefix('', 'image'))
+
+    def cache_values(self, values):
+        """Кладет записи в кэш; отсутствие записи помнится недолго.
+
+        Миниатюру создает воркер, и его запись в кэш процесса не видна
+        этому процессу, поэтому отсутствие записи хранится
+        `THUMBNAIL_MISS_TIMEOUT`, а не годами, как в sorl.
+        """
+        found = {
+            key: value for key, value in values.items()
+            if value != EMPTY_VALUE
+        }
+        self.cache.set_many(found, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT)
+        self.cache.set_many(
+            {key: EMPTY_VALUE for key in values if key not in found},
+            settings.THUMBNAIL_MISS_TIMEOUT,
+        )
+
+        return found
+
+    def _get_raw(self, key):
+        value = self.memo.get(key)
+        if value is not None:
+            return value
+        value = self.cache.get(key)
+        if value is None:
+            value = KVStoreModel.objects.filter(key=key).values_list(
+                'value', flat=True
+            ).first()
+            self.cache_values({key: EMPTY_VALUE if value is None else value})
+        if value == EMPTY_VALUE:
+            return None
+        if self.is_memoized(key):
+            self.memo.set(key, value)
+
+        return value
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        self.memo.delete(key)
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        self.memo.delete_many(keys)
+
+    def clear(self, delete_thumbnails=False):
+        super().clear(delete_thumbnails)
+        self.memo.clear()
+
+    def get_many(self, image_files):
+        """Записи файлов из хранилища в словаре по `ImageFile.key`.
+
+        Файлов, которых нет в хранилище, в словаре нет.
+        """
+        keys = {add_prefix(image_file.key): image_file.key
+                for image_file in image_files}
+        values = self.memo.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            cached = self.cache.get_many(missing)
+            uncached = [key for key in missing if key not in cached]
+            for start in range(0, len(uncached), KEYS_PER_QUERY):
+                batch = uncached[start:start + KEYS_PER_QUERY]
+                stored = dict(KVStoreModel.objects.filter(
+                    key__in=batch
+                ).values_list('key', 'value'))
+                # Как и `_get_raw`, кэш ненадолго помнит отсутствие записи.
+                cached.update(self.cache_values(
+                    {key: stored.get(key, EMPTY_VALUE) for key in batch}
+                ))
+            found = {
+                key: value for key, value in cached.items()
+                if value != EMPTY_VALUE
+            }
+            self.memo.set_many(found)
+            values.update(found)
+
+        return {
+            keys[key]: deserialize_image_file(value)
+            for key, value in values.items()
+        }
+
+
+class ThumbnailBackend(BaseThumbnailBackend):
+    """Бэкенд sorl, который умеет вычислить миниатюру без ее создания."""
+
+    def get_options(self, source, options):
+        """Параметры миниатюры с умолчаниями, как в `get_thumbnail`."""
+        options = dict(options)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(thumbnail_defaults, attr):
+                options.setdefault(key, value)
+
+        return options
+
+    def _get_thumbnail_filename(self, source, geometry_string, options):
+        key = tokey(source.key, geometry_string, serialize(options))
+        path = f'{key[:2]}/{key[2:4]}/{key}'
+        extension = FORMAT_EXTENSIONS[options['format']]
+
+        return f'{thumbnail_settings.THUMBNAIL_PREFIX}{path}.{extension}'
+
+    def plan(self, file_, geometry_string, **options):
+        """Файл, в котором `get_thumbnail` сохранит эту миниатюру."""
+        source = ImageFile(file_)
+        name = self._get_thumbnail_filename(
+            source, geometry_string, self.get_options(source, options)
+        )
+
+        return ImageFile(name, default.storage)
+
+
+def get_ready_variants(files, specs):
+    """Готовые миниатюры изображений по списку `(геометрия, параметры)`.
+
+    Возвращает словарь по имени изображения со списком миниатюр в порядке
+    `specs`, где вместо еще не созданных стоит None. Все миниатюры всех
+    изображений ищутся одним чтением хранилища ключей.
+    """
+    planned = {
+        file_.name: [
+            default.backend.plan(file_, geometry_string, **options)
+            for geometry_string, options in specs
+        ] for file_ in files
+    }
+    ready = default.kvstore.get_many(
+        thumbnail for thumbnails in planned.values()
+        for thumbnail in thumbnails
+    )
+
+    return {
+        name: [ready.get(thumbnail.key) for thumbnail in thumbnails]
+        for name, thumbnails in planned.items()
+    }
+
+
+def get_ready_thumbnails(files, geometry_string, **options):
+    """Готовые миниатюры изображений в словаре по имени изображения.
+
+    Изображений, для которых миниатюра еще не создана, в словаре нет.
+    """
+    variants = get_ready_variants(files, [(geometry_string, options)])
+
+    return {
+        name: thumbnail
+        for name, (thumbnail,) in variants.items() if thumbnail is not None
+    }
@@ -0,0 +1,116 @@
+"""Загрузка изображений без полного чтения в память.
+
+`BoundedUploadHandler` пишет тело загрузки на диск кусками и перестает
+сохранять файл, когда тот превысил `FILE_UPLOAD_MAX_SIZE`: остаток
+только подсчитывается, а `prepare_image` отклоняет файл по размеру.
+`forms.ImageField` открывает изображение без декодирования пикселей, и
+`prepare_image` проверяет по заголовку число пикселей: декомпрессионная
+бомба отклоняется до выделения памяти под нее. Изображение больше
+`IMAGE_MAX_SIDE` уменьшается, а JPEG при этом декодируется в режиме
+draft сразу в 2–8 раз меньшим. Форматы, которые Pillow читает, но не
+умеет записывать (SUN, PSD, CUR…), при уменьшении пересохраняются в PNG.
+"""
+import posixpath
+
+from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from PIL import Image, ImageOps
+
+MEGABYTE = 1024 * 1024
+JPEG_QUALITY = 85
+# Формат для изображений, которые Pillow не умеет записывать как были.
+FALLBACK_FORMAT = 'PNG'
+FALLBACK_MODES = ('1', 'L', 'LA', 'P', 'RGB', 'RGBA', 'I')
+FILE_TOO_LARGE = 'Файл больше %(limit)s МБ.'
+TOO_MANY_PIXELS = 'Изображение больше %(limit)s Мп.'
+
+
+class BoundedUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку во временный файл не больше FILE_UPLOAD_MAX_SIZE.
+
+    Размер файла после загрузки остается настоящим, так что форма видит
+    превышение, хотя на диске лежит только начало файла.
+    """
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.FILE_UPLOAD_MAX_SIZE:
+            return None
+
+        return super().receive_data_chunk(raw_data, start)
+
+
+def fit_size(size, side):
+    """Размер, вписанный в квадрат `side` с сохранением пропорций."""
+    width, height = size
+    ratio = side / max(width, height)
+
+    return max(round(width * ratio), 1), max(round(height * ratio), 1)
+
+
+def downsample(image, upload):
+    """Заменяет содержимое загрузки изображением не больше IMAGE_MAX_SIDE.
+
+    Файл загрузки переписывается на месте, так что временный файл на
+    диске по-прежнему удаляет Django в конце запроса. Если Pillow не
+    умеет записывать исходный формат, загрузка становится PNG.
+    """
+    image_format = image.format
+    size = fit_size(image.size, settings.IMAGE_MAX_SIDE)
+    # Для JPEG декодер сразу отдает картинку меньше в целое число раз,
+    # для остальных форматов вызов ничего не делает.
+    image.draft(None, size)
+    image.thumbnail(size)
+    # Метаданные при пересохранении теряются, поэтому поворот из EXIF
+    # применяется к пикселям, уже уменьшенным.
+    image = ImageOps.exif_transpose(image)
+    Image.init()
+    if image_format not in Image.SAVE:
+        image_format = FALLBACK_FORMAT
+        if image.mode not in FALLBACK_MODES:
+            image = image.convert(
+                'RGBA' if 'A' in image.getbands() else 'RGB'
+            )
+        root = posixpath.splitext(upload.name)[0]
+        upload.name = f'{root}.{FALLBACK_FORMAT.lower()}'
+        upload.content_type = Image.MIME[FALLBACK_FORMAT]
+    upload.file.seek(0)
+    upload.file.truncate()
+    image.save(upload.file, format=image_format, quality=JPEG_QUALITY)
+    upload.size = upload.file.tell()
+
+
+def prepare_image(upload):
+    """Проверяет изображение из `forms.ImageField` и уменьшает большое.
+
+    Вызывается из `clean_<поле>` формы; прежний файл модели и пустое
+    значение возвращаются как есть.
+    """
+    if not isinstance(upload, UploadedFile):
+        return upload
+    if upload.size > settings.FILE_UPLOAD_MAX_SIZE:
+        raise forms.ValidationError(
+            FILE_TOO_LARGE,
+            code='file_too_large',
+            params={'limit': settings.FILE_UPLOAD_MAX_SIZE // MEGABYTE},
+        )
+    width, height = upload.image.size
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise forms.ValidationError(
+            TOO_MANY_PIXELS,
+            code='too_many_pixels',
+            params={'limit': settings.IMAGE_MAX_PIXELS // 10 ** 6},
+        )
+    if max(width, height) > settings.IMAGE_MAX_SIDE:
+        # После verify() изображение нужно открыть заново.
+        if hasattr(upload, 'temporary_file_path'):
+            source = upload.temporary_file_path()
+        else:
+            upload.seek(0)
+            source = upload
+        with Image.open(source) as image:
+            downsample(image, upload)
+    upload.seek(0)
+
+    return upload
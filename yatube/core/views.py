@@ -1,7 +1,14 @@
 from http import HTTPStatus
 
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse
 from django.shortcuts import render
 
+from .cache_control import NO_STORE, cache_policy
+from .metrics import registry
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
 
 def page_not_found(request, exception):
     return render(
@@ -17,3 +24,12 @@ def csrf_failure(request, reason=''):
 
 def server_error(request, *args, **kwargs):
     return render(request, 'core/500.html')
+
+
+@cache_policy(NO_STORE)
+@staff_member_required
+def metrics(request):
+    """Отдает метрики запросов в текстовом формате Prometheus."""
+    return HttpResponse(
+        registry.render(), content_type=PROMETHEUS_CONTENT_TYPE
+    )
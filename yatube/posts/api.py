@@ -0,0 +1,234 @@
+"""JSON API для чтения лент.
+
+Отдает те же ленты, что и HTML-страницы, с курсорной пагинацией
+`?after=`/`?before=` и размером страницы `?limit=`. Параметр
+`?fields=id,text,author` оставляет в ответе только перечисленные поля,
+и из базы выбираются только нужные для них колонки. Выгрузки всех постов
+группы или автора отдаются потоком и не собираются в памяти целиком.
+"""
+from functools import wraps
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET
+
+from core.cache_control import PRIVATE, SHARED, cache_policy
+from core.db import read_from_replica
+from .constants import API_EXPORT_CHUNK, API_MAX_LIMIT, POSTS_ON_PAGE
+from .models import Group, Post, User
+from .utils import KeysetPaginator, TimelinePaginator, make_cursor
+
+# Поле ответа и колонка, из которой оно читается.
+API_FIELDS = {
+    'id': 'pk',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'comments_count': 'comments_count',
+}
+JSON_PARAMS = {'ensure_ascii': False}
+
+
+def parse_fields(request):
+    """Возвращает запрошенные поля ответа, по умолчанию все."""
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(API_FIELDS)
+    fields = list(dict.fromkeys(
+        field.strip() for field in raw.split(',') if field.strip()
+    ))
+    unknown = [field for field in fields if field not in API_FIELDS]
+    if unknown:
+        raise ValueError(f'Неизвестные поля: {", ".join(unknown)}')
+    if not fields:
+        raise ValueError('Не указаны поля')
+
+    return fields
+
+
+def parse_limit(request):
+    try:
+        limit = int(request.GET.get('limit', POSTS_ON_PAGE))
+    except ValueError:
+        raise ValueError('limit должен быть числом')
+    if not 1 <= limit <= API_MAX_LIMIT:
+        raise ValueError(f'limit должен быть от 1 до {API_MAX_LIMIT}')
+
+    return limit
+
+
+def get_columns(fields):
+    """Колонки для `values()`: поля ответа и ключ курсора."""
+    return list(dict.fromkeys(
+        ['pk', 'pub_date', *(API_FIELDS[field] for field in fields)]
+    ))
+
+
+def serialize(row, fields):
+    item = {field: row[API_FIELDS[field]] for field in fields}
+    if 'image' in item:
+        item['image'] = (
+            default_storage.url(item['image']) if item['image'] else None
+        )
+
+    return item
+
+
+class ValuesCursorMixin:
+    """Курсор строится по строке `values()`, а не по объекту поста."""
+
+    def cursor_for(self, row):
+        return make_cursor(row['pub_date'], row['pk'])
+
+
+class ApiPaginator(ValuesCursorMixin, KeysetPaginator):
+    pass
+
+
+class ApiTimelinePaginator(ValuesCursorMixin, TimelinePaginator):
+
+    def __init__(self, user, per_page, columns, after=None, before=None):
+        super().__init__(user, per_page, after=after, before=before)
+        self.columns = columns
+
+    def load_posts(self, post_ids):
+        rows = Post.objects.filter(pk__in=post_ids).order_by().values(
+            *self.columns
+        )
+
+        return {row['pk']: row for row in rows}
+
+
+def api_view(view):
+    """Только GET с чтением с реплики, ошибки и 404 отдаются в JSON."""
+    @require_GET
+    @read_from_replica
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ValueError as error:
+            return JsonResponse({'detail': str(error)}, status=400)
+        except Http404:
+            return JsonResponse({'detail': 'Не найдено'}, status=404)
+
+    return wrapper
+
+
+def page_response(paginator, fields):
+    page = paginator.get_page()
+
+    return JsonResponse(
+        {
+            'results': [serialize(row, fields) for row in page],
+            'next': paginator.next_cursor,
+            'previous': paginator.previous_cursor,
+        },
+        json_dumps_params=JSON_PARAMS,
+    )
+
+
+def feed_response(request, posts):
+    fields = parse_fields(request)
+    paginator = ApiPaginator(
+        posts.values(*get_columns(fields)),
+        parse_limit(request),
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+
+    return page_response(paginator, fields)
+
+
+def stream_json(rows, fields):
+    """Отдает JSON-массив кусками по API_EXPORT_CHUNK строк."""
+    encoder = DjangoJSONEncoder(**JSON_PARAMS)
+    chunk = ['[']
+    for number, row in enumerate(rows):
+        if number:
+            chunk.append(',')
+        chunk.append(encoder.encode(serialize(row, fields)))
+        if len(chunk) >= API_EXPORT_CHUNK:
+            yield ''.join(chunk)
+            chunk = []
+    chunk.append(']')
+    yield ''.join(chunk)
+
+
+def export_response(request, posts):
+    fields = parse_fields(request)
+    # Поток читается уже после выхода из представления, поэтому база
+    # выбирается сейчас, пока действует `read_from_replica`.
+    rows = posts.using(router.db_for_read(Post)).order_by(
+        '-pub_date', '-pk'
+    ).values(*get_columns(fields)).iterator(chunk_size=API_EXPORT_CHUNK)
+
+    return StreamingHttpResponse(
+        stream_json(rows, fields), content_type='application/json'
+    )
+
+
+@cache_policy(SHARED)
+@api_view
+def index(request):
+    """Лента всех постов."""
+    return feed_response(request, Post.objects.all())
+
+
+@cache_policy(SHARED)
+@api_view
+def group_posts(request, slug):
+    """Лента постов группы."""
+    group = get_object_or_404(Group, slug=slug)
+
+    return feed_response(request, group.posts.all())
+
+
+@cache_policy(SHARED)
+@api_view
+def profile(request, username):
+    """Лента постов автора."""
+    author = get_object_or_404(User, username=username)
+
+    return feed_response(request, author.posts.all())
+
+
+@cache_policy(PRIVATE)
+@api_view
+def follow_index(request):
+    """Лента подписок текущего пользователя."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'detail': 'Нужно войти'}, status=401)
+    fields = parse_fields(request)
+    paginator = ApiTimelinePaginator(
+        request.user,
+        parse_limit(request),
+        get_columns(fields),
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+
+    return page_response(paginator, fields)
+
+
+@cache_policy(SHARED)
+@api_view
+def group_export(request, slug):
+    """Все посты группы одним потоковым JSON-массивом."""
+    group = get_object_or_404(Group, slug=slug)
+
+    return export_response(request, group.posts.all())
+
+
+@cache_policy(SHARED)
+@api_view
+def profile_export(request, username):
+    """Все посты автора одним потоковым JSON-массивом."""
+    author = get_object_or_404(User, username=username)
+
+    return export_response(request, author.posts.all())
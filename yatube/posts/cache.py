@@ -0,0 +1,166 @@
+"""Кэш страниц для анонимных читателей с точечной инвалидацией.
+
+Каждая закэшированная страница помнит версии областей, от которых она
+зависит: главная, группа, автор или пост. Сигналы меняют версию области
+при изменении данных, и все зависящие от нее страницы становятся
+недействительными, не дожидаясь истечения `PAGE_CACHE_TIMEOUT`.
+"""
+import hashlib
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from core.db import read_primary
+
+from .constants import PAGE_CACHE_TIMEOUT
+
+PAGE_KEY = 'posts:page:{}'
+VERSION_KEY = 'posts:version:{}'
+INDEX_SCOPE = 'index'
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def group_info_scope(group_id):
+    """Область названия и слага группы без списка ее постов."""
+    return f'group-info:{group_id}'
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def get_post_scopes(post_id, author_id, group_id):
+    """Области страниц, на которых виден пост."""
+    scopes = [INDEX_SCOPE, post_scope(post_id), author_scope(author_id)]
+    if group_id:
+        scopes.append(group_scope(group_id))
+
+    return scopes
+
+
+def new_version():
+    """Версия области: время изменения и случайный суффикс."""
+    return f'{time.time():.6f}:{uuid.uuid4().hex}'
+
+
+def version_time(version):
+    """Возвращает время изменения области по ее версии."""
+    try:
+        stamp = float(version.split(':', 1)[0])
+    except (AttributeError, ValueError):
+        return None
+
+    return datetime.fromtimestamp(stamp, timezone.utc)
+
+
+def is_recent(versions):
+    """Менялась ли какая-то область за время возможного отставания реплики.
+
+    Отставание оценивается так же, как для cookie после записи:
+    `REPLICA_STICKY_SECONDS`.
+    """
+    border = datetime.now(timezone.utc) - timedelta(
+        seconds=settings.REPLICA_STICKY_SECONDS
+    )
+
+    return any(
+        changed is None or changed > border
+        for changed in map(version_time, versions)
+    )
+
+
+def get_versions(scopes):
+    """Возвращает текущие версии областей одним запросом к кэшу."""
+    keys = {VERSION_KEY.format(scope): scope for scope in scopes}
+    found = cache.get_many(keys)
+
+    return {scope: found.get(key) for key, scope in keys.items()}
+
+
+def get_version(scope):
+    """Возвращает версию области, заводя ее при необходимости."""
+    key = VERSION_KEY.format(scope)
+    cache.add(key, new_version(), None)
+
+    return cache.get(key)
+
+
+def invalidate(*scopes):
+    """Делает недействительными все страницы, зависящие от областей."""
+    cache.set_many(
+        {VERSION_KEY.format(scope): new_version() for scope in scopes},
+        None,
+    )
+
+
+def add_scopes(request, *scopes):
+    """Отмечает области, от которых зависит ответ на запрос.
+
+    Для кэшируемой страницы версии областей запоминаются в момент
+    первого упоминания, поэтому представление вызывает функцию до
+    запросов к базе: если запись случится во время отрисовки, страница
+    останется в кэше под старой версией и не будет отдана. Если какая-то
+    из областей менялась недавно, дальше страница читается из основной
+    базы: отстающая реплика не должна попасть в кэш или ETag под новой
+    версией.
+    """
+    versions = getattr(request, 'cache_versions', None)
+    if versions is None:
+        return
+    for scope in scopes:
+        if scope not in versions:
+            versions[scope] = get_version(scope)
+    if is_recent(versions.values()):
+        read_primary()
+
+
+def get_page_key(request, view_name, kwargs):
+    raw = f'{view_name}:{sorted(kwargs.items())}:{request.GET.urlencode()}'
+
+    return PAGE_KEY.format(hashlib.md5(raw.encode()).hexdigest())
+
+
+def cache_anonymous_page(view_func):
+    """Кэширует ответы анонимным читателям на GET-запросы.
+
+    Представление перечисляет области через `add_scopes`; без них ответ
+    не кэшируется. В кэш попадают версии, снятые до отрисовки.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET' or request.user.is_authenticated:
+            return view_func(request, *args, **kwargs)
+
+        key = get_page_key(request, view_func.__name__, kwargs)
+        entry = cache.get(key)
+        if entry and get_versions(entry['versions']) == entry['versions']:
+            return HttpResponse(
+                entry['content'], content_type=entry['content_type']
+            )
+
+        if not hasattr(request, 'cache_versions'):
+            request.cache_versions = {}
+        response = view_func(request, *args, **kwargs)
+        versions = request.cache_versions
+        if response.status_code == 200 and versions:
+            cache.set(key, {
+                'versions': versions,
+                'content': response.content,
+                'content_type': response['Content-Type'],
+            }, PAGE_CACHE_TIMEOUT)
+
+        return response
+
+    return wrapper
@@ -0,0 +1,126 @@
+"""Условные GET-запросы для страниц поста, группы и профиля.
+
+Валидаторы считаются без запроса ленты и отрисовки шаблона. ETag
+складывается из версий областей кэша страниц (у каждого поста своя) и
+читателя, Last-Modified — из даты самого нового поста или комментария и
+времени последнего изменения областей: правка и удаление поста не
+меняют дат в базе, но меняют версии. Сами версии и даты тоже лежат в
+кэше, так что повторный запрос обходится без базы. На совпавшие
+If-None-Match или If-Modified-Since представление отвечает 304 сразу.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Max
+from django.views.decorators.http import condition
+
+from .cache import (
+    author_scope, get_version, get_versions, group_info_scope, group_scope,
+    post_scope, version_time
+)
+from .constants import PAGE_CACHE_TIMEOUT
+from .models import Group, Post, User
+
+STATE_KEY = 'posts:state:{}'
+
+
+def _get_or_none(queryset):
+    try:
+        return queryset.get()
+    except queryset.model.DoesNotExist:
+        return None
+
+
+def group_state(slug):
+    found = _get_or_none(Group.objects.filter(slug=slug).values_list(
+        'pk'
+    ).annotate(last_post=Max('posts__pub_date')))
+    if found is None:
+        return None
+    group_id, last_post = found
+
+    return [group_scope(group_id)], [last_post]
+
+
+def profile_state(username):
+    found = _get_or_none(User.objects.filter(username=username).values_list(
+        'pk'
+    ).annotate(last_post=Max('posts__pub_date')))
+    if found is None:
+        return None
+    author_id, last_post = found
+
+    return [author_scope(author_id)], [last_post]
+
+
+def post_state(post_id):
+    found = _get_or_none(Post.objects.filter(pk=post_id).values_list(
+        'author_id', 'group_id', 'pub_date'
+    ).annotate(last_comment=Max('comments__created')))
+    if found is None:
+        return None
+    author_id, group_id, pub_date, last_comment = found
+    scopes = [post_scope(post_id), author_scope(author_id)]
+    if group_id:
+        scopes.append(group_info_scope(group_id))
+
+    return scopes, [pub_date, last_comment]
+
+
+def get_state(name, compute, kwargs):
+    """Возвращает версии областей и даты страницы.
+
+    Состояние кэшируется вместе с версиями областей и пересчитывается
+    запросом к базе, только когда одна из них сменилась.
+    """
+    raw = f'{name}:{sorted(kwargs.items())}'
+    key = STATE_KEY.format(hashlib.md5(raw.encode()).hexdigest())
+    entry = cache.get(key)
+    if entry and get_versions(entry['versions']) == entry['versions']:
+        return entry['versions'], entry['dates']
+    state = compute(**kwargs)
+    if state is None:
+        return None
+    scopes, dates = state
+    versions = {scope: get_version(scope) for scope in scopes}
+    cache.set(
+        key, {'versions': versions, 'dates': dates}, PAGE_CACHE_TIMEOUT
+    )
+
+    return versions, dates
+
+
+def get_validators(request, state):
+    """Возвращает пару (ETag, Last-Modified) или (None, None)."""
+    if state is None:
+        return None, None
+    versions, dates = state
+    raw = f'{request.user.pk}:{sorted(versions.items())}'
+    etag = f'W/"{hashlib.md5(raw.encode()).hexdigest()}"'
+    dates = [*dates, *map(version_time, versions.values())]
+
+    return etag, max(filter(None, dates), default=None)
+
+
+def conditional_page(compute):
+    """Отвечает 304, если страница не менялась с прошлого визита клиента.
+
+    `compute` получает аргументы представления и возвращает области
+    кэша страницы и даты ее содержимого либо None, если объекта нет.
+    """
+    def validators(request, **kwargs):
+        if not hasattr(request, 'page_validators'):
+            state = get_state(compute.__name__, compute, kwargs)
+            if state is not None:
+                # Версии сняты до отрисовки: `add_scopes` возьмет их же.
+                request.cache_versions = dict(state[0])
+            request.page_validators = get_validators(request, state)
+
+        return request.page_validators
+
+    return condition(
+        etag_func=lambda *args, **kwargs: validators(*args, **kwargs)[0],
+        last_modified_func=(
+            lambda *args, **kwargs: validators(*args, **kwargs)[1]
+        ),
+    )
@@ -1,5 +1,24 @@
 POSTS_ON_PAGE = 10
+COMMENTS_ON_PAGE = 20
 FIRST_SYMBOLS = 15
 POSTS_FOR_PAGINATOR = 13
 POSTS_ON_SECOND_PAGE = 4
 FIRST_POST_ON_PAGE = 0
+TIMELINE_FANOUT_LIMIT = 1000
+TIMELINE_BACKFILL_BATCH = 1000
+PAGE_CACHE_TIMEOUT = 60 * 60
+THUMBNAIL_GEOMETRY = '960x339'
+THUMBNAIL_WORKERS = 4
+THUMBNAIL_BATCH_SIZE = 500
+IMAGE_VARIANT_WIDTHS = (360, 480, 720, 960)
+IMAGE_VARIANT_FORMATS = ('AVIF', 'WEBP', 'JPEG')
+IMAGE_VARIANT_QUALITY = 80
+API_MAX_LIMIT = 100
+API_EXPORT_CHUNK = 2000
+HOT_HALF_LIFE = 12 * 60 * 60
+HOT_POST_WEIGHT = 1
+HOT_COMMENT_WEIGHT = 1
+HOT_FOLLOW_WEIGHT = 2
+HOT_GROUPS = 5
+TRANSFER_BATCH_SIZE = 5000
+TRANSFER_WORKERS = 3
@@ -0,0 +1,109 @@
+"""Денормализованные счетчики постов, подписок и комментариев.
+
+Счетчики обновляются атомарным `UPDATE ... SET n = n + 1` из сигналов,
+поэтому профиль и страница поста не выполняют ни одного `COUNT(*)`.
+Если счетчики разошлись с данными, их пересчитывает команда
+`manage.py rebuild_counters`.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from core.models import Blob
+from core.storage import content_storage
+from .models import AuthorStats, Comment, Follow, Post, User
+
+
+def _count_subquery(queryset, field):
+    counted = queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+        field
+    ).annotate(total=Count('pk')).values('total')
+
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+def increment(user_id, field):
+    """Увеличивает счетчик пользователя, создавая строку при ее отсутствии."""
+    updated = AuthorStats.objects.filter(user_id=user_id).update(
+        **{field: F(field) + 1}
+    )
+    if not updated:
+        rebuild_author_stats(User.objects.filter(pk=user_id))
+
+
+def decrement(user_id, field):
+    AuthorStats.objects.filter(user_id=user_id, **{f'{field}__gt': 0}).update(
+        **{field: F(field) - 1}
+    )
+
+
+def increment_comments(post_id):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=F('comments_count') + 1
+    )
+
+
+def decrement_comments(post_id):
+    Post.objects.filter(pk=post_id, comments_count__gt=0).update(
+        comments_count=F('comments_count') - 1
+    )
+
+
+def rebuild_author_stats(users=None):
+    """Пересчитывает счетчики указанных (по умолчанию всех) пользователей."""
+    users = User.objects.all() if users is None else users
+    AuthorStats.objects.bulk_create(
+        (
+            AuthorStats(user_id=user_id)
+            for user_id in users.values_list('pk', flat=True).iterator()
+        ),
+        ignore_conflicts=True,
+    )
+    totals = users.annotate(
+        posts_total=_count_subquery(Post.objects, 'author'),
+        followers_total=_count_subquery(Follow.objects, 'author'),
+        following_total=_count_subquery(Follow.objects, 'user'),
+    ).values_list('pk', 'posts_total', 'followers_total', 'following_total')
+    AuthorStats.objects.bulk_update(
+        [
+            AuthorStats(
+                user_id=user_id,
+                posts_count=posts,
+                followers_count=followers,
+                following_count=following,
+            ) for user_id, posts, followers, following in totals.iterator()
+        ],
+        ['posts_count', 'followers_count', 'following_count'],
+        batch_size=1000,
+    )
+
+
+def rebuild_comments_count():
+    """Пересчитывает количество комментариев у всех постов."""
+    return Post.objects.update(
+        comments_count=_count_subquery(Comment.objects, 'post')
+    )
+
+
+def rebuild_image_refs():
+    """Пересчитывает ссылки постов на файлы изображений.
+
+    Учитываются только имена, выданные `core.storage`. Строки `Blob` без
+    ссылок остаются с нулем: удалять ли такие файлы, решает
+    `core.storage.collect_blob`.
+    """
+    refs = {
+        name: total
+        for name, total in Post.objects.exclude(image='').order_by().values(
+            'image'
+        ).annotate(total=Count('pk')).values_list('image', 'total')
+        if content_storage.is_hashed(name)
+    }
+    Blob.objects.update(refs=0)
+    Blob.objects.bulk_create(
+        (Blob(name=name) for name in refs), ignore_conflicts=True
+    )
+    Blob.objects.bulk_update(
+        [Blob(name=name, refs=total) for name, total in refs.items()],
+        ['refs'],
+        batch_size=1000,
+    )
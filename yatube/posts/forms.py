@@ -1,6 +1,7 @@
 from django import forms
 
-from .models import Post, Comment
+from core.uploads import prepare_image
+from .models import Comment, Group, Post, User
 
 
 class PostForm(forms.ModelForm):
@@ -10,6 +11,9 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def clean_image(self):
+        return prepare_image(self.cleaned_data['image'])
+
 
 class CommentForm(forms.ModelForm):
     """Форма для написания комментария к постам."""
@@ -17,3 +21,27 @@ class CommentForm(forms.ModelForm):
     class Meta:
         model = Comment
         fields = ('text', )
+
+
+class SearchForm(forms.Form):
+    """Форма поиска по тексту постов."""
+
+    q = forms.CharField(label='Запрос', max_length=200)
+    group = forms.ModelChoiceField(
+        queryset=Group.objects.all(),
+        to_field_name='slug',
+        required=False,
+        label='Группа',
+        empty_label='Все группы',
+    )
+    author = forms.CharField(label='Автор', max_length=150, required=False)
+
+    def clean_author(self):
+        username = self.cleaned_data['author']
+        if not username:
+            return None
+        author = User.objects.filter(username=username).first()
+        if author is None:
+            raise forms.ValidationError('Такого автора нет')
+
+        return author
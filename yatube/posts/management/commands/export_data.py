@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from posts.constants import TRANSFER_BATCH_SIZE, TRANSFER_WORKERS
+from posts.transfer import DUMPS, export_data
+
+
+class Command(BaseCommand):
+    help = 'Выгружает пользователей, группы, посты, комментарии и подписки.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Каталог для файлов выгрузки.')
+        parser.add_argument(
+            '--models', nargs='+', choices=list(DUMPS), default=list(DUMPS)
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=TRANSFER_BATCH_SIZE,
+            help='Сколько строк читать из базы за раз.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=TRANSFER_WORKERS,
+            help='Процессов выгрузки, 0 — все модели в текущем процессе.'
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Выгрузить заново, а не продолжать прерванную выгрузку.'
+        )
+
+    def handle(self, *args, **options):
+        total = export_data(
+            options['directory'],
+            names=options['models'],
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            restart=options['restart'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Выгружено строк: {total}'))
@@ -0,0 +1,76 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import delete as delete_thumbnails
+
+from posts.constants import THUMBNAIL_BATCH_SIZE, THUMBNAIL_WORKERS
+from posts.models import Post
+from posts.thumbnails import (
+    generate_thumbnail, run_in_worker, share_ready_thumbnails
+)
+
+
+class Command(BaseCommand):
+    help = 'Генерирует миниатюры для постов с изображениями.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=THUMBNAIL_WORKERS,
+            help='Количество потоков генерации.'
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Перегенерировать уже готовые миниатюры.'
+        )
+
+    def batches(self):
+        """Посты без миниатюры пачками по THUMBNAIL_BATCH_SIZE.
+
+        Пачки выбираются по pk заново, так что посты, получившие
+        миниатюру от поста с тем же изображением, пропускаются.
+        """
+        posts = Post.objects.exclude(image='').filter(thumbnail='').only(
+            'image'
+        ).order_by('pk')
+        last_pk = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last_pk)[:THUMBNAIL_BATCH_SIZE])
+            if not batch:
+                return
+            last_pk = batch[-1].pk
+            yield batch
+
+    def regenerate(self, posts):
+        """Удаляет готовые миниатюры и варианты изображений пачки.
+
+        Без этого sorl вернул бы прежние файлы из хранилища ключей.
+        Возвращает по одному посту на изображение.
+        """
+        unique = {post.image.name: post for post in posts}
+        for post in unique.values():
+            delete_thumbnails(post.image, delete_file=False)
+
+        return list(unique.values())
+
+    def generate(self, post_ids, workers):
+        if workers > 1:
+            with ThreadPoolExecutor(workers) as executor:
+                names = list(executor.map(run_in_worker, post_ids))
+        else:
+            names = [generate_thumbnail(post_id) for post_id in post_ids]
+
+        return sum(name is not None for name in names)
+
+    def handle(self, *args, **options):
+        if options['force']:
+            Post.objects.exclude(thumbnail='').update(thumbnail='')
+        done = 0
+        for batch in self.batches():
+            if options['force']:
+                missing = self.regenerate(batch)
+            else:
+                missing = share_ready_thumbnails(batch)
+            done += self.generate(
+                [post.pk for post in missing], options['workers']
+            )
+        self.stdout.write(self.style.SUCCESS(f'Миниатюр создано: {done}'))
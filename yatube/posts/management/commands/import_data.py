@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.constants import TRANSFER_BATCH_SIZE, TRANSFER_WORKERS
+from posts.transfer import DUMPS, import_data
+
+
+class Command(BaseCommand):
+    help = 'Загружает выгрузку export_data, продолжая прерванную загрузку.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Каталог с файлами выгрузки.')
+        parser.add_argument(
+            '--models', nargs='+', choices=list(DUMPS), default=list(DUMPS)
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=TRANSFER_BATCH_SIZE,
+            help='Сколько объектов вставлять одним bulk_create.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=TRANSFER_WORKERS,
+            help='Процессов загрузки, 0 — все модели в текущем процессе.'
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Загрузить файлы с начала, не учитывая сохраненный прогресс.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            total = import_data(
+                options['directory'],
+                names=options['models'],
+                workers=options['workers'],
+                batch_size=options['batch_size'],
+                restart=options['restart'],
+                log=self.stdout.write,
+            )
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(f'Загружено строк: {total}'))
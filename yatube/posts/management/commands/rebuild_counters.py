@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.counters import (
+    rebuild_author_stats, rebuild_comments_count, rebuild_image_refs
+)
+from posts.timeline import update_popularity
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счетчики постов, подписок, комментариев и ссылок '
+        'на изображения.'
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_author_stats()
+            update_popularity()
+            posts = rebuild_comments_count()
+            rebuild_image_refs()
+        self.stdout.write(
+            self.style.SUCCESS(f'Счетчики пересчитаны, постов: {posts}')
+        )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts.ranking import rebuild_hot_scores
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинги активности постов и групп.'
+
+    def handle(self, *args, **options):
+        rebuild_hot_scores()
+        self.stdout.write(self.style.SUCCESS('Рейтинги пересчитаны'))
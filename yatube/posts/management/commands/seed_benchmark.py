@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from posts.seeding import BENCHMARK_PASSWORD, seed_dataset
+
+
+class Command(BaseCommand):
+    help = 'Наполняет базу данными для нагрузочного тестирования.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--posts', type=int, default=1_000_000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument(
+            '--follows-per-user', type=int, default=20,
+            help='Среднее число подписок пользователя.'
+        )
+        parser.add_argument('--comments', type=int, default=500_000)
+        parser.add_argument(
+            '--image-ratio', type=float, default=0.1,
+            help='Доля постов с изображением.'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Зерно генератора: один seed дает одни и те же данные.'
+        )
+
+    def handle(self, *args, **options):
+        created = seed_dataset(
+            users=options['users'],
+            posts=options['posts'],
+            groups=options['groups'],
+            follows_per_user=options['follows_per_user'],
+            comments=options['comments'],
+            image_ratio=options['image_ratio'],
+            seed=options['seed'],
+            log=self.stdout.write,
+        )
+        summary = ', '.join(
+            f'{name}: {total}' for name, total in created.items()
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано {summary}. Пароль пользователей: {BENCHMARK_PASSWORD}'
+        ))
@@ -0,0 +1,92 @@
+# Generated by Django 2.2.16 on 2026-10-17 06:27
+
+import math
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+
+# Формула и веса posts.ranking на момент миграции.
+HOT_EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+TAU = 12 * 60 * 60 / math.log(2)
+HOT_POST_WEIGHT = 1
+HOT_COMMENT_WEIGHT = 1
+
+
+def event_score(weight, moment):
+    return math.log(weight) + (moment - HOT_EPOCH).total_seconds() / TAU
+
+
+def logaddexp(first, second):
+    top = max(first, second)
+
+    return top + math.log1p(math.exp(-abs(first - second)))
+
+
+def fill_hot_scores(apps, schema_editor):
+    """Считает рейтинги существующих постов и групп, как
+    `ranking.rebuild_hot_scores`: иначе старые посты с нулем окажутся на
+    /popular/ ниже всех новых."""
+    Comment = apps.get_model('posts', 'Comment')
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    post_scores = {}
+    groups = {}
+    posts = Post.objects.values_list('pk', 'group_id', 'pub_date')
+    for post_id, group_id, pub_date in posts.iterator():
+        post_scores[post_id] = event_score(HOT_POST_WEIGHT, pub_date)
+        groups[post_id] = group_id
+    comments = Comment.objects.values_list('post_id', 'created')
+    for post_id, created in comments.iterator():
+        post_scores[post_id] = logaddexp(
+            post_scores[post_id], event_score(HOT_COMMENT_WEIGHT, created)
+        )
+    group_scores = {}
+    for post_id, score in post_scores.items():
+        group_id = groups[post_id]
+        if group_id:
+            group_scores[group_id] = logaddexp(
+                group_scores.get(group_id, -math.inf), score
+            )
+    Post.objects.bulk_update(
+        [Post(pk=pk, hot_score=score) for pk, score in post_scores.items()],
+        ['hot_score'],
+        batch_size=1000,
+    )
+    Group.objects.bulk_update(
+        [Group(pk=pk, hot_score=score) for pk, score in group_scores.items()],
+        ['hot_score'],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='hot_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Рейтинг активности'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='hot_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Рейтинг активности'),
+        ),
+        migrations.AddIndex(
+            model_name='group',
+            index=models.Index(fields=['hot_score', 'id'], name='group_hot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['hot_score', 'id'], name='post_hot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', 'hot_score', 'id'], name='post_group_hot_idx'),
+        ),
+        migrations.RunPython(fill_hot_scores, migrations.RunPython.noop),
+    ]
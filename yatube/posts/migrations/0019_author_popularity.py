@@ -0,0 +1,29 @@
+# Generated by Django 2.2.16 on 2026-10-17 07:11
+
+from django.db import migrations, models
+
+# Порог на момент миграции: прежде он проверялся по подпискам в кэше.
+TIMELINE_FANOUT_LIMIT = 1000
+
+
+def mark_popular(apps, schema_editor):
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    AuthorStats.objects.filter(
+        followers_count__gte=TIMELINE_FANOUT_LIMIT
+    ).update(popular=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorstats',
+            name='popular',
+            field=models.BooleanField(db_index=True, default=False, help_text='Посты не раскладываются в ленты, а читаются при запросе', verbose_name='Популярный автор'),
+        ),
+        migrations.RunPython(mark_popular, migrations.RunPython.noop),
+    ]
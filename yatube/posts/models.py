@@ -1,11 +1,32 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from core.storage import content_storage
 from .constants import FIRST_SYMBOLS
 
 User = get_user_model()
 
 
+class PostQuerySet(models.QuerySet):
+
+    FEED_FIELDS = (
+        'text',
+        'pub_date',
+        'image',
+        'thumbnail',
+        'author__username',
+        'author__first_name',
+        'author__last_name',
+        'group__slug',
+        'group__title',
+        'hot_score',
+    )
+
+    def for_feed(self):
+        """Посты для ленты с автором и группой, только нужные колонки."""
+        return self.select_related('author', 'group').only(*self.FEED_FIELDS)
+
+
 class Post(models.Model):
     text = models.TextField(
         verbose_name='Текст',
@@ -33,14 +54,56 @@ class Post(models.Model):
     image = models.ImageField(
         blank=True,
         upload_to='posts/',
+        storage=content_storage,
         verbose_name='Изображение',
         help_text='Изображение для публикации'
     )
+    thumbnail = models.ImageField(
+        blank=True,
+        editable=False,
+        upload_to='posts/thumbnails/',
+        verbose_name='Миниатюра',
+    )
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Комментариев',
+    )
+    hot_score = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name='Рейтинг активности',
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(
+                fields=['pub_date', 'id'],
+                name='post_feed_idx'
+            ),
+            models.Index(
+                fields=['group', 'pub_date', 'id'],
+                name='post_group_feed_idx'
+            ),
+            models.Index(
+                fields=['author', 'pub_date', 'id'],
+                name='post_author_feed_idx'
+            ),
+            models.Index(
+                fields=['hot_score', 'id'],
+                name='post_hot_idx'
+            ),
+            models.Index(
+                fields=['group', 'hot_score', 'id'],
+                name='post_group_hot_idx'
+            ),
+            models.Index(fields=['image'], name='post_image_idx'),
+        ]
 
     def __str__(self):
         return self.text[:FIRST_SYMBOLS]
@@ -50,10 +113,21 @@ class Group(models.Model):
     title = models.CharField(max_length=200, verbose_name='Название группы')
     slug = models.SlugField(max_length=40, unique=True, verbose_name='Слаг')
     description = models.TextField(verbose_name='Описание группы')
+    hot_score = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name='Рейтинг активности',
+    )
 
     class Meta:
         verbose_name = 'Группа'
         verbose_name_plural = 'Группы'
+        indexes = [
+            models.Index(
+                fields=['hot_score', 'id'],
+                name='group_hot_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -85,6 +159,12 @@ class Comment(models.Model):
         ordering = ('-created', )
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(
+                fields=['post', 'created'],
+                name='comment_post_created_idx'
+            ),
+        ]
 
 
 class Follow(models.Model):
@@ -113,3 +193,88 @@ class Follow(models.Model):
 
     def __str__(self):
         return f'{self.user} - {self.author}'
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        related_name='timeline',
+        on_delete=models.CASCADE,
+        verbose_name='Читатель'
+    )
+    post = models.ForeignKey(
+        'Post',
+        related_name='timeline_entries',
+        on_delete=models.CASCADE,
+        verbose_name='Пост'
+    )
+    author = models.ForeignKey(
+        User,
+        related_name='+',
+        on_delete=models.CASCADE,
+        verbose_name='Автор'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        ordering = ('-pub_date', '-post')
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_user_post'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'pub_date', 'post'],
+                name='timeline_user_feed_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='timeline_user_author_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.post_id}'
+
+
+class AuthorStats(models.Model):
+    """Счетчики постов и подписок пользователя."""
+
+    user = models.OneToOneField(
+        User,
+        primary_key=True,
+        related_name='stats',
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Постов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Подписчиков'
+    )
+    following_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Подписок'
+    )
+    popular = models.BooleanField(
+        default=False,
+        db_index=True,
+        verbose_name='Популярный автор',
+        help_text='Посты не раскладываются в ленты, а читаются при запросе'
+    )
+
+    class Meta:
+        verbose_name = 'Статистика автора'
+        verbose_name_plural = 'Статистика авторов'
+
+    def __str__(self):
+        return str(self.user)
@@ -0,0 +1,118 @@
+"""Рейтинг активных постов и групп с затуханием по времени.
+
+Событие весом w в момент t к моменту now весит
+w * 2 ** (-(now - t) / HOT_HALF_LIFE). Все вклады затухают одинаково,
+поэтому порядок по их сумме со временем не меняется, и в `hot_score`
+хранится логарифм суммы без множителя now:
+ln(sum(w * e ** ((t - HOT_EPOCH) / tau))). Новое событие добавляется одним
+атомарным UPDATE через logaddexp без пересчета по таблицам, а ленты
+читаются по индексу (hot_score, id) за время, пропорциональное странице.
+"""
+import math
+from datetime import datetime, timezone
+
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.utils import timezone as django_timezone
+
+from .constants import (
+    HOT_COMMENT_WEIGHT, HOT_FOLLOW_WEIGHT, HOT_HALF_LIFE, HOT_POST_WEIGHT
+)
+from .models import Comment, Group, Post
+
+HOT_EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+TAU = HOT_HALF_LIFE / math.log(2)
+
+
+def event_score(weight, moment):
+    """Вклад события в логарифмической шкале рейтинга."""
+    return math.log(weight) + (moment - HOT_EPOCH).total_seconds() / TAU
+
+
+def add_score(score, field='hot_score'):
+    """Выражение ln(e ** field + e ** score) без переполнения."""
+    value = Value(score, output_field=FloatField())
+
+    return Greatest(F(field), value) + Ln(
+        Value(1.0) + Exp(-Abs(F(field) - value))
+    )
+
+
+def logaddexp(first, second):
+    """ln(e ** first + e ** second) без переполнения."""
+    top = max(first, second)
+
+    return top + math.log1p(math.exp(-abs(first - second)))
+
+
+def record_post(post):
+    """Учитывает новый пост в рейтинге поста и его группы."""
+    post.hot_score = event_score(HOT_POST_WEIGHT, post.pub_date)
+    Post.objects.filter(pk=post.pk).update(hot_score=post.hot_score)
+    if post.group_id:
+        Group.objects.filter(pk=post.group_id).update(
+            hot_score=add_score(post.hot_score)
+        )
+
+
+def record_comment(comment):
+    """Поднимает пост и его группу после нового комментария."""
+    score = event_score(HOT_COMMENT_WEIGHT, comment.created)
+    Post.objects.filter(pk=comment.post_id).update(
+        hot_score=add_score(score)
+    )
+    Group.objects.filter(posts=comment.post_id).update(
+        hot_score=add_score(score)
+    )
+
+
+def record_follow(follow):
+    """Поднимает последний пост автора, на которого подписались."""
+    latest = Post.objects.filter(author_id=follow.author_id).order_by(
+        '-pub_date', '-pk'
+    ).values('pk')[:1]
+    Post.objects.filter(pk__in=latest).update(hot_score=add_score(
+        event_score(HOT_FOLLOW_WEIGHT, django_timezone.now())
+    ))
+
+
+def rebuild_hot_scores():
+    """Пересчитывает рейтинги по датам постов и комментариев.
+
+    У подписок нет даты, поэтому их вклад при пересчете теряется.
+    """
+    post_scores = {}
+    groups = {}
+    posts = Post.objects.values_list('pk', 'group_id', 'pub_date')
+    for post_id, group_id, pub_date in posts.iterator():
+        post_scores[post_id] = event_score(HOT_POST_WEIGHT, pub_date)
+        groups[post_id] = group_id
+    comments = Comment.objects.values_list('post_id', 'created')
+    for post_id, created in comments.iterator():
+        post_scores[post_id] = logaddexp(
+            post_scores[post_id], event_score(HOT_COMMENT_WEIGHT, created)
+        )
+    group_scores = {}
+    for post_id, score in post_scores.items():
+        group_id = groups[post_id]
+        if group_id:
+            group_scores[group_id] = logaddexp(
+                group_scores.get(group_id, -math.inf), score
+            )
+    Post.objects.bulk_update(
+        [
+            Post(pk=post_id, hot_score=score)
+            for post_id, score in post_scores.items()
+        ],
+        ['hot_score'],
+        batch_size=1000,
+    )
+    Group.objects.update(hot_score=0)
+    Group.objects.bulk_update(
+        [
+            Group(pk=group_id, hot_score=score)
+            for group_id, score in group_scores.items()
+        ],
+        ['hot_score'],
+        batch_size=1000,
+    )
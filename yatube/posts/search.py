@@ -0,0 +1,274 @@
+"""Полнотекстовый поиск по постам.
+
+На SQLite с FTS5 индекс хранится в виртуальной таблице `posts_post_fts` и
+обновляется сигналами при сохранении и удалении поста, иначе посты ищутся
+запросами к их таблице. Оба способа ранжируют результаты по BM25 и умеют
+фильтровать их по группе и автору.
+"""
+import math
+import re
+from collections import Counter
+
+from django.db import DatabaseError, connection
+
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text):
+    return [token.lower() for token in TOKEN_RE.findall(text or '')]
+
+
+class SearchResults:
+    """Ленивая выдача для Paginator: COUNT и LIMIT/OFFSET по индексу."""
+
+    def __init__(self, backend, terms, group_id=None, author_id=None):
+        self.backend = backend
+        self.terms = terms
+        self.filters = {'group_id': group_id, 'author_id': author_id}
+
+    def count(self):
+        if not self.terms:
+            return 0
+
+        return self.backend.count(self.terms, **self.filters)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        if not self.terms:
+            return []
+        offset = item.start or 0
+        limit = item.stop - offset if item.stop is not None else None
+        post_ids = self.backend.search(
+            self.terms, limit=limit, offset=offset, **self.filters
+        )
+        posts = Post.objects.for_feed().in_bulk(post_ids)
+
+        return [posts[post_id] for post_id in post_ids if post_id in posts]
+
+
+class Fts5Backend:
+    """Индекс во внешней таблице FTS5 с rowid, равным id поста."""
+
+    def _match(self, terms):
+        return ' '.join(f'"{term}"' for term in terms)
+
+    def _where(self, terms, group_id, author_id):
+        where = [f'{FTS_TABLE} MATCH %s']
+        params = [self._match(terms)]
+        if group_id is not None:
+            where.append('p.group_id = %s')
+            params.append(group_id)
+        if author_id is not None:
+            where.append('p.author_id = %s')
+            params.append(author_id)
+
+        return ' AND '.join(where), params
+
+    def search(self, terms, limit=None, offset=0, group_id=None,
+               author_id=None):
+        where, params = self._where(terms, group_id, author_id)
+        sql = (
+            f'SELECT p.id FROM {FTS_TABLE} '
+            f'JOIN posts_post p ON p.id = {FTS_TABLE}.rowid '
+            f'WHERE {where} ORDER BY {FTS_TABLE}.rank, p.id DESC '
+            'LIMIT %s OFFSET %s'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params + [limit or -1, offset])
+
+            return [row[0] for row in cursor.fetchall()]
+
+    def count(self, terms, group_id=None, author_id=None):
+        where, params = self._where(terms, group_id, author_id)
+        sql = (
+            f'SELECT COUNT(*) FROM {FTS_TABLE} '
+            f'JOIN posts_post p ON p.id = {FTS_TABLE}.rowid WHERE {where}'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+            return cursor.fetchone()[0]
+
+    def filter(self, queryset, terms):
+        """Посты выборки, подходящие под запрос, через подзапрос к FTS5."""
+        return queryset.extra(
+            where=[
+                f'posts_post.id IN (SELECT rowid FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s)'
+            ],
+            params=[self._match(terms)],
+        )
+
+    def index(self, post):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk]
+            )
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)',
+                [post.pk, post.text],
+            )
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id]
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) '
+                'SELECT id, text FROM posts_post'
+            )
+
+
+class DatabaseBackend:
+    """Поиск запросами к таблице постов, когда FTS5 нет.
+
+    Собственного индекса нет, поэтому все процессы сразу видят новые,
+    измененные и удаленные посты. База находит посты, где встречаются все
+    слова запроса, а BM25 считается в Python по текстам найденных постов.
+    Каждый поиск читает таблицу целиком, так что это запасной вариант для
+    небольших баз.
+    """
+
+    def _match(self, queryset, terms):
+        # Слова состоят из \w и не требуют экранирования. iregex, в отличие
+        # от icontains на SQLite, не различает регистр и у кириллицы.
+        for term in terms:
+            queryset = queryset.filter(text__iregex=term)
+
+        return queryset
+
+    def _rank(self, terms, group_id, author_id):
+        posts = self._match(Post.objects.order_by(), terms)
+        if group_id is not None:
+            posts = posts.filter(group_id=group_id)
+        if author_id is not None:
+            posts = posts.filter(author_id=author_id)
+        found = {}
+        for post_id, text in posts.values_list('pk', 'text').iterator():
+            tokens = Counter(tokenize(text))
+            # Подстрока может оказаться частью другого слова.
+            if all(tokens[term] for term in terms):
+                found[post_id] = tokens
+        if not found:
+            return []
+        total = Post.objects.count()
+        frequencies = {
+            term: self._match(Post.objects.order_by(), [term]).count()
+            for term in terms
+        }
+        average = sum(
+            sum(tokens.values()) for tokens in found.values()
+        ) / len(found)
+        scores = []
+        for post_id, tokens in found.items():
+            norm = BM25_K1 * (
+                1 - BM25_B + BM25_B * sum(tokens.values()) / average
+            )
+            score = 0
+            for term in terms:
+                frequency = tokens[term]
+                idf = math.log(
+                    1 + (total - frequencies[term] + 0.5)
+                    / (frequencies[term] + 0.5)
+                )
+                score += idf * frequency * (BM25_K1 + 1) / (
+                    frequency + norm
+                )
+            scores.append((-score, -post_id))
+
+        return [-post_id for _, post_id in sorted(scores)]
+
+    def search(self, terms, limit=None, offset=0, group_id=None,
+               author_id=None):
+        ranked = self._rank(terms, group_id, author_id)
+        stop = None if limit is None else offset + limit
+
+        return ranked[offset:stop]
+
+    def count(self, terms, group_id=None, author_id=None):
+        return len(self._rank(terms, group_id, author_id))
+
+    def filter(self, queryset, terms):
+        """Посты выборки, в тексте которых есть все слова запроса."""
+        return self._match(queryset, terms)
+
+    def index(self, post):
+        pass
+
+    def remove(self, post_id):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+_fts5_available = None
+
+
+def has_fts5():
+    """Проверяет, что таблица FTS5 создана миграцией в этой базе."""
+    global _fts5_available
+    if _fts5_available is None:
+        _fts5_available = False
+        if connection.vendor == 'sqlite':
+            try:
+                _fts5_available = FTS_TABLE in (
+                    connection.introspection.table_names()
+                )
+            except DatabaseError:
+                pass
+
+    return _fts5_available
+
+
+def get_backend():
+    return Fts5Backend() if has_fts5() else DatabaseBackend()
+
+
+def search_posts(query, group_id=None, author_id=None):
+    """Возвращает ранжированную выдачу по тексту постов."""
+    return SearchResults(
+        get_backend(), tokenize(query), group_id=group_id, author_id=author_id
+    )
+
+
+def filter_posts(queryset, query):
+    """Оставляет в выборке постов только найденные по тексту."""
+    terms = tokenize(query)
+    if not terms:
+        return queryset.none()
+
+    return get_backend().filter(queryset, terms)
+
+
+def search_post_ids(query):
+    """Возвращает id всех найденных постов в порядке релевантности."""
+    terms = tokenize(query)
+
+    return get_backend().search(terms) if terms else []
+
+
+def index_post(post):
+    get_backend().index(post)
+
+
+def remove_post(post_id):
+    get_backend().remove(post_id)
+
+
+def rebuild_index():
+    get_backend().rebuild()
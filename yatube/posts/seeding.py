@@ -0,0 +1,222 @@
+"""Генерация большого набора данных для нагрузочного тестирования.
+
+Объекты вставляются пачками через `bulk_create` с заранее выданными id,
+минуя сигналы, а ленты, счетчики и поисковый индекс затем строятся
+отдельными запросами. Распределения подписчиков и постов по авторам
+скошены (закон Ципфа): несколько авторов читаются почти всеми и
+несколько пишут очень много, большинство не читает почти никто. Один и
+тот же `seed` дает один и тот же набор данных.
+"""
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from core.storage import content_storage
+from .counters import (
+    rebuild_author_stats, rebuild_comments_count, rebuild_image_refs
+)
+from .models import Comment, Follow, Group, Post, TimelineEntry, User
+from .ranking import rebuild_hot_scores
+from .search import rebuild_index
+from .timeline import get_popular_author_ids, update_popularity
+
+BENCHMARK_PASSWORD = 'benchmark'
+BENCHMARK_IMAGE = 'posts/benchmark.gif'
+FOLLOWERS_EXPONENT = 1.1
+POSTS_EXPONENT = 0.8
+BATCH_SIZE = 5000
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+WORDS = (
+    'кот', 'собака', 'лес', 'город', 'река', 'утро', 'вечер', 'книга',
+    'дорога', 'море', 'поезд', 'чай', 'снег', 'солнце', 'письмо', 'песня',
+)
+
+
+class ZipfSampler:
+    """Выбирает элементы с вероятностью, обратной степени их ранга."""
+
+    def __init__(self, items, rng, exponent):
+        self.items = items
+        self.rng = rng
+        self.weights = list(accumulate(
+            1 / (rank + 1) ** exponent for rank in range(len(items))
+        ))
+
+    def sample(self, k=1):
+        return self.rng.choices(self.items, cum_weights=self.weights, k=k)
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """Отключает auto_now_add, чтобы сохранить заданные даты."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def _next_id(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def _insert(model, objects, batch_size=BATCH_SIZE):
+    """Вставляет объекты пачками, не собирая их все в памяти."""
+    objects = iter(objects)
+    total = 0
+    while True:
+        batch = list(islice(objects, batch_size))
+        if not batch:
+            return total
+        model.objects.bulk_create(batch)
+        total += len(batch)
+
+
+def _text(rng, words=12):
+    return ' '.join(rng.choices(WORDS, k=rng.randint(3, words))).capitalize()
+
+
+def seed_dataset(users=100_000, posts=1_000_000, groups=50,
+                 follows_per_user=20, comments=500_000, image_ratio=0.1,
+                 seed=0, days=365, log=None):
+    """Наполняет базу пользователями, постами, подписками и комментариями.
+
+    Возвращает словарь с количеством созданных объектов.
+    """
+    log = log or (lambda message: None)
+    rng = random.Random(seed)
+    now = timezone.now()
+    first_user = _next_id(User)
+    first_group = _next_id(Group)
+    first_post = _next_id(Post)
+    first_comment = _next_id(Comment)
+    password = make_password(BENCHMARK_PASSWORD)
+    # Хранилище называет файл по содержимому и не пишет его повторно.
+    image = content_storage.save(
+        BENCHMARK_IMAGE, ContentFile(SMALL_GIF)
+    ) if image_ratio else ''
+
+    user_ids = list(range(first_user, first_user + users))
+    group_ids = list(range(first_group, first_group + groups))
+    post_groups = group_ids + [None]
+    # Популярность и плодовитость автора независимы: у каждого
+    # распределения свой случайный порядок пользователей.
+    followed = ZipfSampler(
+        rng.sample(user_ids, len(user_ids)), rng, FOLLOWERS_EXPONENT
+    )
+    writers = ZipfSampler(
+        rng.sample(user_ids, len(user_ids)), rng, POSTS_EXPONENT
+    )
+    created = {}
+    with transaction.atomic(), explicit_dates(
+        Post._meta.get_field('pub_date'),
+        Comment._meta.get_field('created'),
+    ):
+        log('Пользователи')
+        created['users'] = _insert(User, (
+            User(
+                pk=user_id,
+                username=f'bench_{user_id}',
+                first_name='Автор',
+                last_name=str(user_id),
+                password=password,
+                date_joined=now,
+            ) for user_id in user_ids
+        ))
+        log('Группы')
+        created['groups'] = _insert(Group, (
+            Group(
+                pk=group_id,
+                title=f'Группа {group_id}',
+                slug=f'bench-{group_id}',
+                description=_text(rng),
+            ) for group_id in group_ids
+        ))
+        log('Посты')
+        step = timedelta(days=days) / max(posts, 1)
+        created['posts'] = _insert(Post, (
+            Post(
+                pk=first_post + number,
+                text=_text(rng, 40),
+                author_id=writers.sample()[0],
+                group_id=rng.choice(post_groups),
+                image=image if rng.random() < image_ratio else '',
+                pub_date=now - step * (posts - number),
+            ) for number in range(posts)
+        ))
+        log('Подписки')
+        created['follows'] = _insert(Follow, (
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in set(
+                followed.sample(rng.randint(0, follows_per_user * 2))
+            ) - {user_id}
+        ))
+        log('Комментарии')
+        created['comments'] = _insert(Comment, (
+            Comment(
+                pk=first_comment + number,
+                post_id=first_post + posts - 1 - int(
+                    posts * rng.random() ** 3
+                ),
+                author_id=rng.choice(user_ids),
+                text=_text(rng),
+                created=now - timedelta(seconds=rng.randint(0, 86400)),
+            ) for number in range(comments if posts else 0)
+        ))
+        log('Ленты, счетчики, рейтинги и поисковый индекс')
+        rebuild_derived_data()
+    cache.clear()
+
+    return created
+
+
+def rebuild_derived_data():
+    """Строит ленты, счетчики, ссылки на изображения, рейтинги и поисковый
+    индекс для данных, вставленных в обход сигналов."""
+    rebuild_author_stats()
+    update_popularity()
+    fill_timelines(get_popular_author_ids())
+    rebuild_comments_count()
+    rebuild_image_refs()
+    rebuild_hot_scores()
+    rebuild_index()
+
+
+def fill_timelines(popular_ids):
+    """Перестраивает ленты подписок одним INSERT ... SELECT.
+
+    Посты популярных авторов в ленты не попадают, как и при fan-out.
+    """
+    timeline = TimelineEntry._meta.db_table
+    follow = Follow._meta.db_table
+    post = Post._meta.db_table
+    sql = (
+        f'INSERT INTO {timeline} (user_id, post_id, author_id, pub_date) '
+        f'SELECT f.user_id, p.id, p.author_id, p.pub_date FROM {follow} f '
+        f'JOIN {post} p ON p.author_id = f.author_id'
+    )
+    params = list(popular_ids)
+    if params:
+        placeholders = ', '.join(['%s'] * len(params))
+        sql += f' WHERE f.author_id NOT IN ({placeholders})'
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {timeline}')
+        cursor.execute(sql, params)
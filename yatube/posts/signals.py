@@ -0,0 +1,247 @@
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from core import storage
+from core.tasks import enqueue
+from . import counters, ranking, search, tasks, timeline
+from .cache import (
+    INDEX_SCOPE, author_scope, get_post_scopes, group_info_scope, group_scope,
+    invalidate, post_scope
+)
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+
+# Связи, по которым ведутся счетчики: их смена в админке переносит счет.
+COUNTED_LINKS = {
+    Comment: ('post_id',),
+    Follow: ('user_id', 'author_id'),
+}
+
+
+@receiver(post_save, sender=User)
+def create_author_stats(sender, instance, created, **kwargs):
+    """Заводит счетчики для нового пользователя."""
+    if created:
+        AuthorStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def on_post_created(sender, instance, created, **kwargs):
+    """Учитывает новый пост и раскладывает его в ленты подписчиков."""
+    if created:
+        counters.increment(instance.author_id, 'posts_count')
+        ranking.record_post(instance)
+        enqueue(
+            tasks.fan_out_post, instance.pk, key=f'fan_out:{instance.pk}'
+        )
+
+
+@receiver(post_delete, sender=Post)
+def on_post_deleted(sender, instance, **kwargs):
+    counters.decrement(instance.author_id, 'posts_count')
+
+
+@receiver(post_save, sender=Comment)
+def on_comment_created(sender, instance, created, **kwargs):
+    if created:
+        counters.increment_comments(instance.post_id)
+        ranking.record_comment(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def on_comment_deleted(sender, instance, **kwargs):
+    counters.decrement_comments(instance.post_id)
+
+
+@receiver(post_save, sender=Follow)
+def on_follow_created(sender, instance, created, **kwargs):
+    """Учитывает подписку и заполняет ленту постами автора."""
+    if created:
+        counters.increment(instance.author_id, 'followers_count')
+        counters.increment(instance.user_id, 'following_count')
+        timeline.update_popularity(instance.author_id)
+        ranking.record_follow(instance)
+        enqueue(tasks.backfill_timeline, instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def on_follow_deleted(sender, instance, **kwargs):
+    """Учитывает отписку и убирает посты автора из ленты."""
+    counters.decrement(instance.author_id, 'followers_count')
+    counters.decrement(instance.user_id, 'following_count')
+    timeline.prune(instance.user_id, instance.author_id)
+
+
+@receiver(pre_save, sender=Comment)
+@receiver(pre_save, sender=Follow)
+def remember_counted_links(sender, instance, **kwargs):
+    """Запоминает связи, по которым ведутся счетчики, до правки объекта."""
+    instance._previous_links = sender.objects.filter(
+        pk=instance.pk
+    ).values_list(*COUNTED_LINKS[sender]).first() if instance.pk else None
+
+
+@receiver(post_save, sender=Post)
+def move_post_counter(sender, instance, created, **kwargs):
+    """Переносит пост в счетчике нового автора после правки в админке."""
+    previous = getattr(instance, '_previous_author_id', None)
+    if not created and previous and previous != instance.author_id:
+        counters.decrement(previous, 'posts_count')
+        counters.increment(instance.author_id, 'posts_count')
+
+
+@receiver(post_save, sender=Comment)
+def move_comment_counter(sender, instance, created, **kwargs):
+    """Переносит комментарий в счетчик другого поста."""
+    previous = getattr(instance, '_previous_links', None)
+    if created or not previous:
+        return
+    (post_id,) = previous
+    if post_id != instance.post_id:
+        counters.decrement_comments(post_id)
+        counters.increment_comments(instance.post_id)
+        invalidate(post_scope(post_id))
+
+
+@receiver(post_save, sender=Follow)
+def move_follow_counters(sender, instance, created, **kwargs):
+    """Переносит подписку в счетчики и ленту другого читателя или автора."""
+    previous = getattr(instance, '_previous_links', None)
+    if created or not previous:
+        return
+    user_id, author_id = previous
+    if (user_id, author_id) == (instance.user_id, instance.author_id):
+        return
+    if author_id != instance.author_id:
+        counters.decrement(author_id, 'followers_count')
+        counters.increment(instance.author_id, 'followers_count')
+        timeline.update_popularity(instance.author_id)
+    if user_id != instance.user_id:
+        counters.decrement(user_id, 'following_count')
+        counters.increment(instance.user_id, 'following_count')
+    timeline.prune(user_id, author_id)
+    enqueue(tasks.backfill_timeline, instance.user_id, instance.author_id)
+    invalidate(author_scope(author_id), author_scope(user_id))
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_scopes(sender, instance, **kwargs):
+    """Запоминает прежних автора, группу и изображение поста."""
+    instance._previous_scopes = []
+    instance._previous_image = ''
+    instance._previous_author_id = None
+    previous = Post.objects.filter(pk=instance.pk).values_list(
+        'author_id', 'group_id', 'image'
+    ).first() if instance.pk else None
+    if previous:
+        author_id, group_id, instance._previous_image = previous
+        instance._previous_author_id = author_id
+        instance._previous_scopes = get_post_scopes(
+            instance.pk, author_id, group_id
+        )
+
+
+@receiver(post_save, sender=Post)
+def count_image_refs(sender, instance, **kwargs):
+    """Учитывает ссылку поста на файл изображения."""
+    previous = getattr(instance, '_previous_image', '')
+    if instance.image.name != previous:
+        if instance.image:
+            storage.acquire(instance.image.name)
+        if previous:
+            storage.release(previous)
+        instance._previous_image = instance.image.name
+
+
+@receiver(post_delete, sender=Post)
+def release_image(sender, instance, **kwargs):
+    if instance.image:
+        storage.release(instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_pages(sender, instance, **kwargs):
+    invalidate(
+        *get_post_scopes(instance.pk, instance.author_id, instance.group_id),
+        *getattr(instance, '_previous_scopes', ()),
+    )
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_pages(sender, instance, **kwargs):
+    invalidate(post_scope(instance.post_id))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_pages(sender, instance, **kwargs):
+    invalidate(
+        author_scope(instance.author_id), author_scope(instance.user_id)
+    )
+
+
+def get_group_author_scopes(group_id):
+    """Области профилей авторов, у которых есть посты в группе."""
+    return [
+        author_scope(author_id)
+        for author_id in Post.objects.filter(group_id=group_id).order_by(
+        ).values_list('author_id', flat=True).distinct()
+    ]
+
+
+def get_user_page_scopes(user_id):
+    """Области страниц, на которых видно имя пользователя: главная,
+    группы его постов и посты с его комментариями."""
+    group_ids = Post.objects.filter(
+        author_id=user_id, group__isnull=False
+    ).order_by().values_list('group_id', flat=True).distinct()
+    post_ids = Comment.objects.filter(author_id=user_id).order_by(
+    ).values_list('post_id', flat=True).distinct()
+
+    return [
+        INDEX_SCOPE,
+        *map(group_scope, group_ids),
+        *map(post_scope, post_ids),
+    ]
+
+
+@receiver(pre_delete, sender=Group)
+def remember_group_authors(sender, instance, **kwargs):
+    """Запоминает авторов группы, пока посты еще ссылаются на нее."""
+    instance._author_scopes = get_group_author_scopes(instance.pk)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_pages(sender, instance, **kwargs):
+    """Сбрасывает страницы с названием группы, в том числе профили."""
+    author_scopes = getattr(instance, '_author_scopes', None)
+    if author_scopes is None:
+        author_scopes = get_group_author_scopes(instance.pk)
+    invalidate(
+        INDEX_SCOPE, group_scope(instance.pk), group_info_scope(instance.pk),
+        *author_scopes,
+    )
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_pages(sender, instance, update_fields=None, **kwargs):
+    """Сбрасывает страницы с именем пользователя при его смене, но не при
+    входе на сайт."""
+    if update_fields != frozenset(['last_login']):
+        invalidate(
+            author_scope(instance.pk), *get_user_page_scopes(instance.pk)
+        )
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    search.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_from_index(sender, instance, **kwargs):
+    search.remove_post(instance.pk)
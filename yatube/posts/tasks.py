@@ -0,0 +1,20 @@
+"""Фоновые задачи приложения posts."""
+from core.tasks import task
+
+from . import timeline
+from .models import Follow, Post
+
+
+@task()
+def fan_out_post(post_id):
+    """Раскладывает пост в ленты подписчиков, если он еще существует."""
+    post = Post.objects.filter(pk=post_id).only('author', 'pub_date').first()
+    if post is not None:
+        timeline.fan_out(post)
+
+
+@task()
+def backfill_timeline(user_id, author_id):
+    """Заполняет ленту постами автора, если подписка еще действует."""
+    if Follow.objects.filter(user_id=user_id, author_id=author_id).exists():
+        timeline.backfill(user_id, author_id)
@@ -0,0 +1,116 @@
+import json
+from http import HTTPStatus
+
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Follow, Group, Post, User
+
+
+class ApiTests(TestCase):
+    """Тесты JSON API лент."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='api_author')
+        cls.reader = User.objects.create_user(username='api_reader')
+        cls.group = Group.objects.create(title='Группа', slug='api-group')
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост {number}',
+                author=cls.author,
+                group=cls.group if number % 2 else None,
+            ) for number in range(15)
+        ]
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def get_json(self, url, client=None, **params):
+        response = (client or self.client).get(url, params)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+        return response.status_code, json.loads(response.content)
+
+    def test_feeds_are_paginated_by_cursor(self):
+        """Ленты отдаются страницами с курсором следующей страницы."""
+        grouped = [post for post in self.posts if post.group]
+        feeds = {
+            reverse('posts:api_index'): self.posts,
+            reverse('posts:api_profile', args=(self.author.username,)):
+                self.posts,
+            reverse('posts:api_group_list', args=(self.group.slug,)): grouped,
+        }
+        for url, posts in feeds.items():
+            with self.subTest(url=url):
+                status, first = self.get_json(url, limit=10)
+                self.assertEqual(status, HTTPStatus.OK)
+                self.assertEqual(first['results'][0]['id'], posts[-1].pk)
+                self.assertIsNone(first['previous'])
+                if len(posts) > 10:
+                    _, second = self.get_json(
+                        url, limit=10, after=first['next']
+                    )
+                    self.assertEqual(
+                        len(first['results']) + len(second['results']),
+                        len(posts),
+                    )
+                    self.assertIsNone(second['next'])
+
+    def test_fields_projection(self):
+        """fields оставляет только нужные поля и колонки."""
+        url = reverse('posts:api_index')
+        with CaptureQueriesContext(connection) as queries:
+            _, data = self.get_json(url, fields='id,author')
+        self.assertEqual(
+            data['results'][0],
+            {'id': self.posts[-1].pk, 'author': self.author.username},
+        )
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('"posts_post"."text"', sql)
+        self.assertNotIn('posts_group', sql)
+
+    def test_bad_parameters(self):
+        """Неизвестное поле и неверный limit дают 400."""
+        url = reverse('posts:api_index')
+        for params in ({'fields': 'id,password'}, {'limit': 1000}):
+            with self.subTest(params=params):
+                status, data = self.get_json(url, **params)
+                self.assertEqual(status, HTTPStatus.BAD_REQUEST)
+                self.assertIn('detail', data)
+        status, _ = self.get_json(
+            reverse('posts:api_group_list', args=('missing',))
+        )
+        self.assertEqual(status, HTTPStatus.NOT_FOUND)
+
+    def test_follow_feed(self):
+        """Лента подписок доступна только после входа."""
+        url = reverse('posts:api_follow_index')
+        status, _ = self.get_json(url)
+        self.assertEqual(status, HTTPStatus.UNAUTHORIZED)
+        status, data = self.get_json(
+            url, self.reader_client, fields='id,text'
+        )
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertEqual(
+            data['results'][0],
+            {'id': self.posts[-1].pk, 'text': self.posts[-1].text},
+        )
+        self.assertIsNotNone(data['next'])
+
+    def test_export_streams_all_posts(self):
+        """Выгрузка отдает все посты автора потоком."""
+        response = self.client.get(
+            reverse('posts:api_profile_export', args=(self.author.username,)),
+            {'fields': 'id'},
+        )
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(
+            data, [{'id': post.pk} for post in reversed(self.posts)]
+        )
@@ -1,13 +1,26 @@
+import hashlib
+import os
 import shutil
+import struct
 import tempfile
+import zlib
+from io import BytesIO, StringIO
 
 from django.db.models.fields.files import FileField, ImageFieldFile
 from django.conf import settings
+from django.core.cache import cache
 from django.test import TestCase, Client, override_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
 from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import default as thumbnail_default
 
+from core.models import Task
+from core.uploads import BoundedUploadHandler
 from ..models import Group, Post, User, Comment
+from ..thumbnails import generate_thumbnail
 
 COUNT_OF_NEW_ELEMENT = 1
 ZERO_INDEX = 0
@@ -79,8 +92,9 @@ class PostFormTest(TestCase):
         self.assertEqual(Post.objects.count(), expected_count)
 
         new_post = posts_upd[ZERO_INDEX]
+        digest = hashlib.sha256(small_gif).hexdigest()
         image = ImageFieldFile(
-            name='posts/small.gif',
+            name=f'posts/{digest[:2]}/{digest}.gif',
             instance=new_post,
             field=FileField(),
         )
@@ -127,3 +141,289 @@ class PostFormTest(TestCase):
         self.assertEqual(self.post.comments.count(), expected_count)
         self.assertEqual(new_comment.text, form_data['text'])
         self.assertEqual(new_comment.author, self.user)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostThumbnailTest(TestCase):
+    """Проверка фоновой генерации миниатюр."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='thumb_user')
+        cls.small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Одинаковые картинки разных тестов получают одно имя, а sorl
+        # помнит их миниатюры в кэше и в памяти процесса.
+        cache.clear()
+        thumbnail_default.kvstore.memo.clear()
+
+    def create_post(self):
+        return Post.objects.create(
+            text='Пост с картинкой',
+            author=self.user,
+            image=SimpleUploadedFile(
+                name='thumb.gif',
+                content=self.small_gif,
+                content_type='image/gif'
+            ),
+        )
+
+    def test_generate_thumbnail(self):
+        """Миниатюра создается и сохраняется в посте."""
+        post = self.create_post()
+        name = generate_thumbnail(post.pk)
+        post.refresh_from_db()
+        self.assertEqual(post.thumbnail.name, name)
+        self.assertEqual(
+            (post.thumbnail.width, post.thumbnail.height), (960, 339)
+        )
+
+    def test_feed_offers_image_variants(self):
+        """Лента и страница поста предлагают варианты через srcset."""
+        post = self.create_post()
+        generate_thumbnail(post.pk)
+        for url in (
+            reverse('posts:index'),
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(response, 'srcset=')
+                self.assertContains(response, ' 2w"')
+
+    def test_edit_image_resets_thumbnail(self):
+        """Новое изображение сбрасывает прежнюю миниатюру."""
+        post = self.create_post()
+        generate_thumbnail(post.pk)
+        client = Client()
+        client.force_login(self.user)
+        # Без немедленного выполнения задач новая миниатюра только в очереди.
+        with self.settings(TASKS_EAGER=False):
+            client.post(
+                reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+                data={
+                    'text': post.text,
+                    'image': SimpleUploadedFile(
+                        name='other.gif',
+                        content=self.small_gif,
+                        content_type='image/gif'
+                    ),
+                },
+            )
+        post.refresh_from_db()
+        self.assertEqual(post.thumbnail, '')
+        self.assertTrue(Task.objects.filter(
+            name=generate_thumbnail.task_name, status=Task.QUEUED
+        ).exists())
+
+    def test_returning_to_previous_image_regenerates_thumbnail(self):
+        """После правок A → B → A у поста снова есть миниатюра."""
+        client = Client()
+        client.force_login(self.user)
+        client.post(reverse('posts:post_create'), data={
+            'text': 'Меняет картинки',
+            'image': SimpleUploadedFile(
+                name='a.gif', content=self.small_gif, content_type='image/gif'
+            ),
+        })
+        post = Post.objects.get(text='Меняет картинки')
+        other = BytesIO()
+        Image.new('RGB', (4, 2), 'red').save(other, format='PNG')
+        for name, content in (
+            ('b.png', other.getvalue()), ('a.gif', self.small_gif)
+        ):
+            client.post(
+                reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+                data={
+                    'text': post.text,
+                    'image': SimpleUploadedFile(name=name, content=content),
+                },
+            )
+            post.refresh_from_db()
+            with self.subTest(name=name):
+                self.assertTrue(post.image.name.endswith(name[-4:]))
+                self.assertTrue(post.thumbnail)
+
+    def test_same_image_shares_thumbnail(self):
+        """Пост с уже загруженным изображением получает готовую миниатюру
+        без новой задачи."""
+        first = self.create_post()
+        name = generate_thumbnail(first.pk)
+        client = Client()
+        client.force_login(self.user)
+        with self.settings(TASKS_EAGER=False):
+            client.post(reverse('posts:post_create'), data={
+                'text': 'Та же картинка',
+                'image': SimpleUploadedFile(
+                    name='copy.gif',
+                    content=self.small_gif,
+                    content_type='image/gif'
+                ),
+            })
+        second = Post.objects.get(text='Та же картинка')
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertEqual(second.thumbnail.name, name)
+        self.assertFalse(Task.objects.filter(
+            name=generate_thumbnail.task_name
+        ).exists())
+
+    def test_generate_thumbnails_command(self):
+        """Команда создает миниатюры для существующих постов."""
+        post = self.create_post()
+        call_command('generate_thumbnails', workers=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertTrue(post.thumbnail)
+
+    def test_generate_thumbnails_command_force(self):
+        """С --force миниатюры строятся заново, а не берутся из sorl."""
+        post = self.create_post()
+        generate_thumbnail(post.pk)
+        post.refresh_from_db()
+        old = post.thumbnail.name
+        default_storage.delete(old)
+        output = StringIO()
+        call_command(
+            'generate_thumbnails', workers=1, force=True, stdout=output
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.thumbnail.name, old)
+        self.assertTrue(default_storage.exists(old))
+        self.assertIn('Миниатюр создано: 1', output.getvalue())
+
+    def test_command_shares_ready_thumbnails(self):
+        """Команда раздает готовые миниатюры, не строя их заново."""
+        ready = self.create_post()
+        generate_thumbnail(ready.pk)
+        ready.refresh_from_db()
+        # Пост с тем же файлом, созданный в обход views, без миниатюры.
+        copy = Post.objects.create(
+            text='Копия', author=self.user, image=ready.image.name
+        )
+        output = StringIO()
+        call_command('generate_thumbnails', workers=1, stdout=output)
+        copy.refresh_from_db()
+        self.assertEqual(copy.thumbnail, ready.thumbnail)
+        self.assertIn('Миниатюр создано: 0', output.getvalue())
+
+
+def png_header(width, height):
+    """PNG с заданными размерами и пустыми данными пикселей."""
+    def chunk(kind, data):
+        return (
+            struct.pack('>I', len(data)) + kind + data
+            + struct.pack('>I', zlib.crc32(kind + data))
+        )
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+
+    return b''.join((
+        b'\x89PNG\r\n\x1a\n',
+        chunk(b'IHDR', header),
+        chunk(b'IDAT', zlib.compress(b'')),
+        chunk(b'IEND', b''),
+    ))
+
+
+def sun_raster(width, height):
+    """Серое изображение Sun Raster, которое Pillow не умеет записывать."""
+    row = bytes(range(256)) * (width // 256) + bytes(width % 256)
+    padding = bytes(width % 2)
+    data = (row + padding) * height
+    header = struct.pack(
+        '>8I', 0x59A66A95, width, height, 8, len(data), 1, 0, 0
+    )
+
+    return header + data
+
+
+def jpeg_image(size):
+    output = BytesIO()
+    Image.new('RGB', size, 'red').save(output, format='JPEG')
+
+    return output.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageUploadTest(TestCase):
+    """Проверка загрузки изображений без полного декодирования."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='upload_user')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def upload(self, content, name='photo.jpg'):
+        return self.client.post(reverse('posts:post_create'), data={
+            'text': 'Пост с фото',
+            'image': SimpleUploadedFile(name, content, 'image/jpeg'),
+        })
+
+    def test_large_image_is_downsampled(self):
+        """Большое изображение уменьшается до IMAGE_MAX_SIDE."""
+        with self.settings(IMAGE_MAX_SIDE=100):
+            response = self.upload(jpeg_image((800, 400)))
+        self.assertRedirects(
+            response, reverse('posts:profile', args=(self.user.username,))
+        )
+        post = Post.objects.get(author=self.user)
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (100, 50))
+
+    def test_unwritable_format_is_downsampled_to_png(self):
+        """Формат, который Pillow не записывает, уменьшается в PNG."""
+        with self.settings(IMAGE_MAX_SIDE=100):
+            response = self.upload(sun_raster(2400, 100), name='photo.ras')
+        self.assertRedirects(
+            response, reverse('posts:profile', args=(self.user.username,))
+        )
+        post = Post.objects.get(author=self.user)
+        self.assertTrue(post.image.name.endswith('.png'))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'PNG')
+            self.assertLessEqual(max(image.size), 100)
+
+    def test_decompression_bomb_is_rejected(self):
+        """Огромное число пикселей отклоняется до декодирования."""
+        response = self.upload(png_header(8_000, 8_000), name='bomb.png')
+        self.assertFormError(
+            response, 'form', 'image', 'Изображение больше 50 Мп.'
+        )
+        self.assertFalse(Post.objects.filter(author=self.user).exists())
+
+    def test_oversized_upload_is_not_stored(self):
+        """Загрузка больше FILE_UPLOAD_MAX_SIZE не пишется на диск целиком."""
+        with self.settings(FILE_UPLOAD_MAX_SIZE=1024):
+            handler = BoundedUploadHandler()
+            handler.new_file('image', 'big.jpg', 'image/jpeg', 4096)
+            for start in range(0, 4096, 512):
+                handler.receive_data_chunk(b'x' * 512, start)
+            uploaded = handler.file_complete(4096)
+            self.assertEqual(uploaded.size, 4096)
+            self.assertEqual(
+                os.path.getsize(uploaded.temporary_file_path()), 1024
+            )
+            response = self.upload(jpeg_image((10, 10)) + b'x' * 2048)
+        self.assertFormError(response, 'form', 'image', 'Файл больше 0 МБ.')
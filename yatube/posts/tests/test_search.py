@@ -0,0 +1,114 @@
+from unittest import mock
+
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from ..models import Group, Post, User
+from ..search import (
+    DatabaseBackend, has_fts5, rebuild_index, search_post_ids, search_posts
+)
+
+
+class SearchTests(TestCase):
+    """Тесты полнотекстового поиска."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='search_author')
+        cls.other = User.objects.create_user(username='search_other')
+        cls.group = Group.objects.create(title='Котики', slug='cats')
+        cls.cat_post = Post.objects.create(
+            text='Кот спит. Кот ест. Кот мурчит.',
+            author=cls.author,
+            group=cls.group,
+        )
+        cls.mixed_post = Post.objects.create(
+            text='Кот и собака гуляют вместе по длинной зеленой улице',
+            author=cls.other,
+        )
+        cls.dog_post = Post.objects.create(
+            text='Собака лает', author=cls.author
+        )
+
+    def check_backend(self):
+        self.assertEqual(
+            list(search_posts('кот')), [self.cat_post, self.mixed_post]
+        )
+        self.assertEqual(list(search_posts('КОТ собака')), [self.mixed_post])
+        self.assertEqual(
+            list(search_posts('кот', group_id=self.group.pk)),
+            [self.cat_post],
+        )
+        self.assertEqual(
+            list(search_posts('собака', author_id=self.author.pk)),
+            [self.dog_post],
+        )
+        self.assertEqual(search_posts('кот').count(), 2)
+        self.assertEqual(list(search_posts('?!')), [])
+
+    def test_fts5_backend(self):
+        """Поиск через FTS5 ранжирует и фильтрует посты."""
+        self.assertTrue(has_fts5())
+        self.check_backend()
+
+    def test_database_backend(self):
+        """Поиск запросами к таблице постов дает ту же выдачу и сразу
+        видит изменения из других процессов."""
+        with mock.patch('posts.search.get_backend', return_value=(
+            DatabaseBackend()
+        )):
+            self.check_backend()
+            Post.objects.filter(pk=self.dog_post.pk).update(
+                text='Кот лает'
+            )
+            self.assertIn(self.dog_post.pk, search_post_ids('кот'))
+
+    def test_index_follows_edits_and_deletes(self):
+        """Индекс обновляется при изменении и удалении поста."""
+        post = Post.objects.get(pk=self.dog_post.pk)
+        post.text = 'Попугай говорит'
+        post.save()
+        self.assertEqual(search_post_ids('попугай'), [self.dog_post.pk])
+        self.assertEqual(search_post_ids('лает'), [])
+        post.delete()
+        self.assertEqual(search_post_ids('попугай'), [])
+
+    def test_search_view(self):
+        """Страница поиска показывает найденные посты."""
+        response = Client().get(
+            reverse('posts:search'), {'q': 'кот', 'group': self.group.slug}
+        )
+        self.assertTemplateUsed(response, 'posts/search.html')
+        self.assertEqual(list(response.context['page_obj']), [self.cat_post])
+
+    def test_search_view_unknown_author(self):
+        """Несуществующий автор дает ошибку формы, а не пустую выдачу."""
+        response = Client().get(
+            reverse('posts:search'), {'q': 'кот', 'author': 'nobody'}
+        )
+        self.assertIn('author', response.context['form'].errors)
+        self.assertNotIn('page_obj', response.context)
+
+    def test_admin_search_with_many_matches(self):
+        """Частое слово в админке не упирается в лимит параметров SQLite."""
+        Post.objects.bulk_create(
+            Post(text=f'Частое слово {number}', author=self.other)
+            for number in range(1500)
+        )
+        rebuild_index()
+        admin = User.objects.create_superuser(
+            username='search_admin', email='admin@example.com',
+            password='password',
+        )
+        client = Client()
+        client.force_login(admin)
+        url = reverse('admin:posts_post_changelist')
+        response = client.get(url, {'q': 'частое'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 1500)
+        with mock.patch('posts.search.get_backend', return_value=(
+            DatabaseBackend()
+        )):
+            response = client.get(url, {'q': 'частое'})
+        self.assertEqual(response.context['cl'].result_count, 1500)
@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from ..models import AuthorStats, Comment, Follow, Group, Post, User
+from ..transfer import (
+    PART_SUFFIX, PROGRESS_SUFFIX, DUMPS, _write_progress, export_data,
+    import_data
+)
+
+
+class TransferTests(TestCase):
+    """Тесты выгрузки и загрузки данных."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.author = User.objects.create_user(username='transfer_author')
+        self.reader = User.objects.create_user(username='transfer_reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='transfer', description='Описание'
+        )
+        self.posts = [
+            Post.objects.create(
+                text=f'Пост {number}',
+                author=self.author,
+                group=self.group if number % 2 else None,
+            ) for number in range(5)
+        ]
+        Comment.objects.create(
+            post=self.posts[0], author=self.reader, text='Комментарий'
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def snapshot(self):
+        return {
+            'posts': list(Post.objects.order_by('pk').values_list(
+                'pk', 'text', 'pub_date', 'author__username', 'group__slug'
+            )),
+            'comments': list(Comment.objects.values_list(
+                'pk', 'post_id', 'author__username', 'text', 'created'
+            )),
+            'follows': list(Follow.objects.values_list(
+                'user__username', 'author__username'
+            )),
+        }
+
+    def wipe(self):
+        """Очищает базу, оставляя читателя с новым id."""
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        User.objects.create_user(username='transfer_reader')
+
+    def test_round_trip(self):
+        """Загрузка восстанавливает данные с новыми id пользователей."""
+        expected = self.snapshot()
+        self.assertEqual(export_data(self.directory), 10)
+        self.wipe()
+        self.assertEqual(import_data(self.directory), 10)
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual(
+            AuthorStats.objects.get(
+                user__username='transfer_author'
+            ).followers_count,
+            1,
+        )
+        post = Post.objects.create(
+            text='Новый', author=User.objects.get(username='transfer_reader')
+        )
+        self.assertGreater(post.pk, self.posts[-1].pk)
+
+    def test_import_resumes_after_interruption(self):
+        """Прерванная загрузка продолжается без дублей."""
+        expected = self.snapshot()
+        export_data(self.directory)
+        self.wipe()
+        calls = []
+
+        def interrupt(path, offset):
+            if path.endswith(f'posts.jsonl{PROGRESS_SUFFIX}'):
+                if calls:
+                    raise KeyboardInterrupt
+                calls.append(offset)
+            _write_progress(path, offset)
+
+        with mock.patch('posts.transfer._write_progress', interrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                import_data(self.directory, batch_size=2)
+        # Вторая пачка постов сохранена, но ее смещение не записано.
+        self.assertEqual(Post.objects.count(), 4)
+        import_data(self.directory, batch_size=2)
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_export_resumes_after_interruption(self):
+        """Выгрузка продолжается после последней целой строки."""
+        export_data(self.directory, names=['posts'])
+        path = DUMPS['posts'].path(self.directory)
+        with open(path, encoding='utf-8') as dump:
+            lines = dump.readlines()
+        with open(path + PART_SUFFIX, 'w', encoding='utf-8') as part:
+            part.write(''.join(lines[:3]) + lines[3][:10])
+        os.remove(path)
+        self.assertEqual(export_data(self.directory, names=['posts']), 3)
+        with open(path, encoding='utf-8') as dump:
+            self.assertEqual(dump.readlines(), lines)
+
+    def test_commands_report_throughput(self):
+        """Команды сообщают скорость в строках в секунду."""
+        output = StringIO()
+        call_command(
+            'export_data', self.directory, workers=0, stdout=output
+        )
+        self.wipe()
+        call_command(
+            'import_data', self.directory, workers=0, stdout=output
+        )
+        self.assertIn('posts: 5 строк', output.getvalue())
+        self.assertIn('строк/с', output.getvalue())
+        self.assertEqual(Post.objects.count(), 5)
+
+    def test_import_refuses_taken_ids(self):
+        """Загрузка в базу с занятыми id останавливается с отчетом."""
+        export_data(self.directory)
+        Post.objects.filter(pk=self.posts[0].pk).delete()
+        with self.assertRaisesRegex(ValueError, r'posts — 4 \(\d+, '):
+            import_data(self.directory)
+        self.assertEqual(Post.objects.count(), 4)
+        with self.assertRaisesMessage(CommandError, 'posts — 4'):
+            call_command('import_data', self.directory, stdout=StringIO())
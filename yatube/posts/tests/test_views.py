@@ -1,21 +1,36 @@
+import math
 import shutil
 import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
 from django import forms
 from django.conf import settings
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.core.paginator import Page
+from django.db import connection
 from django.db.models import FileField
 from django.db.models.fields.files import ImageFieldFile
 from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
-from ..models import Group, User, Post, Follow
+from core.testing import QueryPlanMixin
+from .. import views
+from ..models import (
+    AuthorStats, Comment, Follow, Group, Post, TimelineEntry, User
+)
 from ..constants import (
-    POSTS_ON_PAGE, POSTS_ON_SECOND_PAGE, FIRST_POST_ON_PAGE
+    COMMENTS_ON_PAGE, HOT_HALF_LIFE, POSTS_ON_PAGE, POSTS_ON_SECOND_PAGE,
+    FIRST_POST_ON_PAGE
 )
-from ..utils import posts_bulk_create
+from ..ranking import event_score, rebuild_hot_scores
+from ..utils import make_cursor, posts_bulk_create
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -76,6 +91,9 @@ class PostViewsTests(TestCase):
         super().tearDownClass()
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
+    def setUp(self):
+        cache.clear()
+
     def get_first_post_on_page(self, page_obj):
         return page_obj[FIRST_POST_ON_PAGE]
 
@@ -165,17 +183,43 @@ class PostViewsTests(TestCase):
         ]
         for url in urls_to_check:
             response = self.client.get(url)
-            context = response.context
+            first_page = response.context.get('page_obj')
             with self.subTest(url=url):
-                page_obj = context.get('page_obj')
-                self.assertEqual(len(page_obj), POSTS_ON_PAGE)
+                self.assertEqual(len(first_page), POSTS_ON_PAGE)
 
-        for url in urls_to_check:
-            response = self.client.get(url + '?page=2')
-            context = response.context
+            next_cursor = first_page.paginator.next_cursor
+            response = self.client.get(url, {'after': next_cursor})
+            with self.subTest(url=url):
+                page_obj = response.context.get('page_obj')
+                self.assertEqual(len(page_obj), POSTS_ON_SECOND_PAGE)
+                self.assertTrue(page_obj.has_previous())
+                self.assertFalse(page_obj.has_next())
+
+            previous_cursor = page_obj.paginator.previous_cursor
+            response = self.client.get(url, {'before': previous_cursor})
             with self.subTest(url=url):
-                page_obj = context.get('page_obj')
-                self.assertIsNotNone(len(page_obj), POSTS_ON_SECOND_PAGE)
+                page_obj = response.context.get('page_obj')
+                self.assertEqual(list(page_obj), list(first_page))
+                self.assertFalse(page_obj.has_previous())
+
+    def test_paginator_ignores_broken_cursor(self):
+        """Некорректный курсор отдает первую страницу."""
+        response = self.client.get(
+            reverse('posts:index'), {'after': 'not-a-cursor'}
+        )
+        page_obj = response.context.get('page_obj')
+        self.check_post(self.get_first_post_on_page(page_obj))
+        self.assertFalse(page_obj.has_previous())
+
+    def test_paginator_ignores_out_of_range_cursor(self):
+        """Курсор с pk вне диапазона базы отдает первую страницу."""
+        post = Post.objects.latest('pub_date')
+        for pk in (2 ** 70, 0, -1):
+            cursor = make_cursor(post.pub_date, pk)
+            for url in (reverse('posts:index'), reverse('posts:api_index')):
+                with self.subTest(pk=pk, url=url):
+                    response = self.client.get(url, {'after': cursor})
+                    self.assertEqual(response.status_code, 200)
 
     def test_post_not_in_alien_group(self):
         """Тест на отсутствие поста в неправильной группе."""
@@ -247,19 +291,19 @@ class CacheTest(TestCase):
         cls.user = User.objects.create_user(username='testuser')
         cls.authorized_client = Client()
         cls.authorized_client.force_login(cls.user)
-        Post.objects.create(
+        cls.post = Post.objects.create(
             text='Тестовый пост',
             author=cls.user,
         )
         cls.INDEX = reverse('posts:index')
 
+    def setUp(self):
+        cache.clear()
+
     def test_cache(self):
         """Проверяет работоспособность кэша."""
         response_1 = self.authorized_client.get(self.INDEX)
-        Post.objects.create(
-            text='Новый тестовый текст',
-            author=self.user,
-        )
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
         response_2 = self.authorized_client.get(self.INDEX)
         self.assertEqual(
             response_1.content,
@@ -272,6 +316,92 @@ class CacheTest(TestCase):
             response_3.content
         )
 
+    def test_new_post_invalidates_cache(self):
+        """Новый пост сразу появляется на главной странице."""
+        response_1 = self.authorized_client.get(self.INDEX)
+        Post.objects.create(
+            text='Новый тестовый текст',
+            author=self.user,
+        )
+        response_2 = self.authorized_client.get(self.INDEX)
+        self.assertNotEqual(
+            response_1.content,
+            response_2.content
+        )
+
+    def test_anonymous_pages_are_cached(self):
+        """Анонимные страницы кэшируются и сбрасываются по сигналам."""
+        urls = (
+            self.INDEX,
+            reverse('posts:profile', args=(self.user.username,)),
+            reverse('posts:post_detail', args=(self.post.pk,)),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.client.get(url)
+                with self.assertNumQueries(0):
+                    response = self.client.get(url)
+                self.assertIsNone(response.context)
+
+        Comment.objects.create(post=self.post, author=self.user, text='Да')
+        for url in urls[:-1]:
+            with self.subTest(url=url):
+                self.assertIsNone(self.client.get(url).context)
+        response = self.client.get(urls[-1])
+        self.assertIsNotNone(response.context)
+        self.assertContains(response, 'Комментариев: 1')
+
+    def test_post_created_during_render_is_not_lost(self):
+        """Запись во время отрисовки не прячется под новой версией."""
+        get_pagination = views.get_pagination
+
+        def write_after_read(*args, **kwargs):
+            page_obj = get_pagination(*args, **kwargs)
+            Post.objects.create(
+                text='Пост во время отрисовки', author=self.user
+            )
+
+            return page_obj
+
+        with mock.patch.object(views, 'get_pagination', write_after_read):
+            response = self.client.get(self.INDEX)
+        self.assertNotContains(response, 'Пост во время отрисовки')
+        self.assertContains(
+            self.client.get(self.INDEX), 'Пост во время отрисовки'
+        )
+
+    def test_editing_post_group_invalidates_old_group(self):
+        """Перенос поста в другую группу сбрасывает страницу старой."""
+        group = Group.objects.create(title='Группа', slug='cached-group')
+        Post.objects.filter(pk=self.post.pk).update(group=group)
+        url = reverse('posts:group_list', args=(group.slug,))
+        self.client.get(url)
+        self.post.group = None
+        self.post.save()
+        response = self.client.get(url)
+        self.assertEqual(len(response.context.get('page_obj')), 0)
+
+    def test_group_rename_invalidates_profiles(self):
+        """Новое название группы сразу видно в профилях ее авторов."""
+        group = Group.objects.create(title='Старое название', slug='renamed')
+        Post.objects.filter(pk=self.post.pk).update(group=group)
+        url = reverse('posts:profile', args=(self.user.username,))
+        self.assertContains(self.client.get(url), 'Старое название')
+        group.title = 'Новое название'
+        group.save()
+        self.assertContains(self.client.get(url), 'Новое название')
+
+    def test_author_rename_invalidates_group_pages(self):
+        """Новое имя автора сразу видно на страницах групп его постов."""
+        group = Group.objects.create(title='Группа', slug='author-renamed')
+        Post.objects.filter(pk=self.post.pk).update(group=group)
+        url = reverse('posts:group_list', args=(group.slug,))
+        self.assertNotContains(self.client.get(url), 'Новое Имя')
+        author = User.objects.get(pk=self.user.pk)
+        author.first_name, author.last_name = 'Новое', 'Имя'
+        author.save()
+        self.assertContains(self.client.get(url), 'Новое Имя')
+
 
 class FollowTestCase(TestCase):
     """Тест на проверку работы подписок."""
@@ -335,3 +465,464 @@ class FollowTestCase(TestCase):
         """В список избранных не попадают посты незнакомых авторов."""
         response = self.authorized_client.get(reverse('posts:follow_index'))
         self.assertNotIn(self.post_2, response.context.get('page_obj'))
+
+
+class TimelineTestCase(TestCase):
+    """Тест материализованной ленты подписок."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='timeline_author')
+        cls.star = User.objects.create_user(username='timeline_star')
+        cls.user = User.objects.create_user(username='timeline_reader')
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.user)
+        cls.old_post = Post.objects.create(text='Старый', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_feed(self, **params):
+        response = self.authorized_client.get(
+            reverse('posts:follow_index'), params
+        )
+
+        return response.context.get('page_obj')
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        """Подписка заполняет ленту, отписка ее очищает."""
+        self.authorized_client.get(
+            reverse('posts:profile_follow', args=(self.author.username,))
+        )
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.user, post=self.old_post
+            ).exists()
+        )
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow', args=(self.author.username,))
+        )
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user).exists())
+
+    def test_follow_backfills_all_posts(self):
+        """В ленту попадают все посты автора, а не только последние."""
+        posts_bulk_create('Пост', self.author, None, '', quantity=5)
+        with mock.patch('posts.timeline.TIMELINE_BACKFILL_BATCH', 2):
+            Follow.objects.create(user=self.user, author=self.author)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user).count(), 6
+        )
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новый пост попадает в ленты подписчиков."""
+        Follow.objects.create(user=self.user, author=self.author)
+        new_post = Post.objects.create(text='Новый', author=self.author)
+        self.assertEqual(
+            list(self.get_feed()), [new_post, self.old_post]
+        )
+
+    @mock.patch('posts.timeline.TIMELINE_FANOUT_LIMIT', 1)
+    def test_popular_author_is_read_on_request(self):
+        """Посты популярного автора не раскладываются, но видны в ленте."""
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=self.user, author=self.star)
+        star_posts = [
+            Post.objects.create(text=f'star {i}', author=self.star)
+            for i in range(POSTS_ON_PAGE)
+        ]
+        self.assertFalse(
+            TimelineEntry.objects.filter(author=self.star).exists()
+        )
+        page_obj = self.get_feed()
+        self.assertEqual(len(page_obj), POSTS_ON_PAGE)
+        self.assertTrue(page_obj.has_next())
+        self.assertNotIn(self.old_post, page_obj)
+
+        next_page = self.get_feed(after=page_obj.paginator.next_cursor)
+        self.assertEqual(list(next_page), [self.old_post])
+        self.assertCountEqual(star_posts, list(page_obj))
+
+    @mock.patch('posts.timeline.TIMELINE_FANOUT_LIMIT', 1)
+    def test_popularity_is_stored_in_database(self):
+        """Признак популярности не теряется с кэшем процесса."""
+        Follow.objects.create(user=self.user, author=self.star)
+        cache.clear()
+        self.assertTrue(AuthorStats.objects.get(user=self.star).popular)
+        post = Post.objects.create(text='После сброса кэша', author=self.star)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        self.assertIn(post, self.get_feed())
+
+
+class CountersTestCase(TestCase):
+    """Тест денормализованных счетчиков."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='counted_author')
+        cls.user = User.objects.create_user(username='counted_reader')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+
+    def get_stats(self, user):
+        return AuthorStats.objects.get(user=user)
+
+    def test_counters_follow_writes(self):
+        """Счетчики меняются при создании и удалении объектов."""
+        follow = Follow.objects.create(user=self.user, author=self.author)
+        Comment.objects.create(post=self.post, author=self.user, text='Да')
+        extra_post = Post.objects.create(text='Еще', author=self.author)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        self.assertEqual(self.get_stats(self.author).posts_count, 2)
+        self.assertEqual(self.get_stats(self.author).followers_count, 1)
+        self.assertEqual(self.get_stats(self.user).following_count, 1)
+
+        follow.delete()
+        extra_post.delete()
+        self.post.comments.all().delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+        self.assertEqual(self.get_stats(self.author).posts_count, 1)
+        self.assertEqual(self.get_stats(self.author).followers_count, 0)
+        self.assertEqual(self.get_stats(self.user).following_count, 0)
+
+    def test_counters_follow_reassignment(self):
+        """Смена автора, поста или участников подписки переносит счет."""
+        other = User.objects.create_user(username='counted_other')
+        other_post = Post.objects.create(text='Другой', author=other)
+        follow = Follow.objects.create(user=self.user, author=self.author)
+        comment = Comment.objects.create(
+            post=self.post, author=self.user, text='Да'
+        )
+
+        post = Post.objects.get(pk=self.post.pk)
+        post.author = other
+        post.save()
+        comment.post = other_post
+        comment.save()
+        follow.author, follow.user = self.user, other
+        follow.save()
+
+        self.assertEqual(self.get_stats(self.author).posts_count, 0)
+        self.assertEqual(self.get_stats(other).posts_count, 2)
+        self.assertEqual(
+            Post.objects.get(pk=self.post.pk).comments_count, 0
+        )
+        self.assertEqual(Post.objects.get(pk=other_post.pk).comments_count, 1)
+        self.assertEqual(self.get_stats(self.author).followers_count, 0)
+        self.assertEqual(self.get_stats(self.user).followers_count, 1)
+        self.assertEqual(self.get_stats(self.user).following_count, 0)
+        self.assertEqual(self.get_stats(other).following_count, 1)
+
+    def test_rebuild_counters_command(self):
+        """Команда rebuild_counters исправляет разошедшиеся счетчики."""
+        Comment.objects.create(post=self.post, author=self.user, text='Да')
+        AuthorStats.objects.all().delete()
+        Post.objects.update(comments_count=0)
+        call_command('rebuild_counters', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        self.assertEqual(self.get_stats(self.author).posts_count, 1)
+        self.assertEqual(self.get_stats(self.user).posts_count, 0)
+
+    def test_pages_run_no_count_queries(self):
+        """Профиль и страница поста не выполняют COUNT(*)."""
+        urls = (
+            reverse('posts:profile', args=(self.author.username,)),
+            reverse('posts:post_detail', args=(self.post.pk,)),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    self.client.get(url)
+                self.assertFalse(
+                    [q for q in queries if 'COUNT(' in q['sql'].upper()]
+                )
+
+
+class FeedQueriesTestCase(QueryPlanMixin, TestCase):
+    """Тест числа запросов на страницах лент."""
+
+    # Без общего кэша сессия и пользователь читаются из базы на каждый
+    # запрос (см. core/auth.py), остальное — запросы самой страницы.
+    AUTH_QUERIES = 2
+    QUERIES = {
+        'posts:index': 1,
+        'posts:group_list': 2,
+        'posts:profile': 3,
+        # Лента, популярные авторы из подписок и посты окна.
+        'posts:follow_index': 3,
+        'posts:post_detail': 2,
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='feed_reader')
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.user)
+        cls.authors = [
+            User.objects.create_user(username=f'feed_author_{i}')
+            for i in range(3)
+        ]
+        cls.groups = [
+            Group.objects.create(title=f'Группа {i}', slug=f'feed-{i}')
+            for i in range(2)
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.user, author=author)
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост {i}',
+                author=cls.authors[i % len(cls.authors)],
+                group=cls.groups[i % len(cls.groups)],
+            ) for i in range(POSTS_ON_PAGE * 2)
+        ]
+        for author in cls.authors:
+            Comment.objects.create(
+                post=cls.posts[-1], author=author, text='Комментарий'
+            )
+
+    def get_urls(self):
+        return {
+            'posts:index': reverse('posts:index'),
+            'posts:group_list': reverse(
+                'posts:group_list', args=(self.groups[0].slug,)
+            ),
+            'posts:profile': reverse(
+                'posts:profile', args=(self.authors[0].username,)
+            ),
+            'posts:follow_index': reverse('posts:follow_index'),
+            'posts:post_detail': reverse(
+                'posts:post_detail', args=(self.posts[-1].pk,)
+            ),
+        }
+
+    def test_feed_pages_run_fixed_number_of_queries(self):
+        """Количество запросов не зависит от числа постов на странице."""
+        for name, url in self.get_urls().items():
+            cache.clear()
+            self.authorized_client.get(url)
+            with self.subTest(url=url):
+                with self.assertNumQueries(
+                    self.AUTH_QUERIES + self.QUERIES[name]
+                ):
+                    self.authorized_client.get(url)
+
+    def test_feed_queries_use_indexes(self):
+        """Запросы лент не читают таблицы целиком и не сортируют их."""
+        for name, url in self.get_urls().items():
+            response = self.authorized_client.get(url)
+            urls = [url]
+            if 'page_obj' in response.context:
+                paginator = response.context['page_obj'].paginator
+                urls.append(f'{url}?after={paginator.next_cursor}')
+                urls.append(f'{url}?before={paginator.next_cursor}')
+            for page_url in urls:
+                with self.subTest(url=page_url):
+                    with self.assertQueriesUseIndexes():
+                        self.authorized_client.get(page_url)
+
+
+class ConditionalGetTestCase(TestCase):
+    """Тесты ответов 304 на условные запросы."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='etag_author')
+        cls.group = Group.objects.create(title='Группа', slug='etag-group')
+        cls.post = Post.objects.create(
+            text='Текст', author=cls.user, group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.urls = (
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.user.username,)),
+            reverse('posts:post_detail', args=(self.post.pk,)),
+        )
+
+    def test_unchanged_pages_return_304_without_queries(self):
+        """Неизменная страница отдает 304 без запросов к базе."""
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertTrue(response.has_header('Last-Modified'))
+            for headers in (
+                {'HTTP_IF_NONE_MATCH': response['ETag']},
+                {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']},
+            ):
+                with self.subTest(url=url, headers=headers):
+                    with self.assertNumQueries(0):
+                        cached = self.client.get(url, **headers)
+                    self.assertEqual(cached.status_code, 304)
+                    self.assertEqual(cached.content, b'')
+
+    def test_changes_update_validators(self):
+        """Новый комментарий и правка поста меняют валидаторы."""
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        response = self.client.get(url)
+        Comment.objects.create(post=self.post, author=self.user, text='Да')
+        fresh = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertNotEqual(fresh['ETag'], response['ETag'])
+
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Новый текст'
+        later = time.time() + 60
+        with mock.patch('posts.cache.time.time', return_value=later):
+            post.save()
+        edited = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=fresh['Last-Modified']
+        )
+        self.assertEqual(edited.status_code, 200)
+        self.assertContains(edited, 'Новый текст')
+
+    def test_validators_depend_on_user(self):
+        """ETag гостя не подходит вошедшему пользователю."""
+        url = self.urls[-1]
+        response = self.client.get(url)
+        self.client.force_login(self.user)
+        own = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(own.status_code, 200)
+
+    def test_missing_objects_have_no_validators(self):
+        """Для несуществующего объекта отдается 404 без ETag."""
+        response = self.client.get(reverse('posts:profile', args=('nobody',)))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class CommentPaginationTestCase(TestCase):
+    """Тесты постраничной выдачи комментариев."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='commentator')
+        cls.post = Post.objects.create(text='Текст', author=cls.user)
+        cls.comments = [
+            Comment.objects.create(
+                post=cls.post, author=cls.user, text=f'Комментарий {i}'
+            ) for i in range(COMMENTS_ON_PAGE + 5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_post_detail_shows_first_comments(self):
+        """Страница поста показывает только первую порцию комментариев."""
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,))
+        )
+        comments = response.context['comments']
+        self.assertEqual(
+            list(comments), self.comments[::-1][:COMMENTS_ON_PAGE]
+        )
+        self.assertContains(
+            response, reverse('posts:comments', args=(self.post.pk,))
+        )
+
+    def test_load_more_fragment(self):
+        """Фрагмент отдает следующую порцию без кнопки в конце."""
+        first = self.client.get(
+            reverse('posts:comments', args=(self.post.pk,))
+        )
+        self.assertNotContains(first, '<html')
+        cursor = first.context['comments'].paginator.next_cursor
+        with self.assertNumQueries(2):
+            rest = self.client.get(
+                reverse('posts:comments', args=(self.post.pk,)),
+                {'after': cursor},
+            )
+        self.assertEqual(
+            list(rest.context['comments']), self.comments[::-1][-5:]
+        )
+        self.assertNotContains(rest, 'js-load-comments')
+
+    def test_missing_post(self):
+        response = self.client.get(reverse('posts:comments', args=(0,)))
+        self.assertEqual(response.status_code, 404)
+
+
+class HotRankingTestCase(QueryPlanMixin, TestCase):
+    """Тесты рейтинга активных постов и групп."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='hot_author')
+        cls.groups = [
+            Group.objects.create(title=f'Группа {i}', slug=f'hot-{i}')
+            for i in range(2)
+        ]
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост {i}', author=cls.user, group=cls.groups[i % 2]
+            ) for i in range(POSTS_ON_PAGE + 2)
+        ]
+        for _ in range(3):
+            Comment.objects.create(
+                post=cls.posts[0], author=cls.user, text='Обсуждаем'
+            )
+
+    def get_texts(self, url, **params):
+        response = self.client.get(url, params)
+
+        return response, [post.text for post in response.context['page_obj']]
+
+    def test_comments_raise_post(self):
+        """Обсуждаемый пост поднимается выше более новых."""
+        response, texts = self.get_texts(reverse('posts:popular'))
+        self.assertEqual(texts[0], self.posts[0].text)
+        self.assertEqual(texts[1], self.posts[-1].text)
+        self.assertEqual(
+            list(response.context['hot_groups']), self.groups
+        )
+        cursor = response.context['page_obj'].paginator.next_cursor
+        _, rest = self.get_texts(reverse('posts:popular'), after=cursor)
+        self.assertEqual(len(texts + rest), len(self.posts))
+        self.assertEqual(len(set(texts + rest)), len(self.posts))
+
+    def test_group_popular(self):
+        """Популярное группы содержит только ее посты."""
+        group = self.groups[1]
+        _, texts = self.get_texts(
+            reverse('posts:group_popular', args=(group.slug,))
+        )
+        self.assertEqual(
+            set(texts),
+            {post.text for post in self.posts if post.group == group},
+        )
+
+    def test_score_decays_and_matches_rebuild(self):
+        """Вклад события вдвое меньше через период полураспада, а
+        пересчет с нуля дает те же рейтинги."""
+        moment = timezone.now()
+        self.assertAlmostEqual(
+            event_score(1, moment + timedelta(seconds=HOT_HALF_LIFE))
+            - event_score(1, moment),
+            math.log(2),
+        )
+        before = dict(Post.objects.values_list('pk', 'hot_score'))
+        groups_before = dict(Group.objects.values_list('pk', 'hot_score'))
+        rebuild_hot_scores()
+        for pk, score in Post.objects.values_list('pk', 'hot_score'):
+            self.assertAlmostEqual(score, before[pk], places=6)
+        for pk, score in Group.objects.values_list('pk', 'hot_score'):
+            self.assertAlmostEqual(score, groups_before[pk], places=6)
+
+    def test_popular_queries_use_indexes(self):
+        """Популярное читается по индексу без сортировки таблицы."""
+        for url in (
+            reverse('posts:popular'),
+            reverse('posts:group_popular', args=(self.groups[0].slug,)),
+        ):
+            response = self.client.get(url)
+            cursor = response.context['page_obj'].paginator.next_cursor
+            for page_url in (url, f'{url}?after={cursor}'):
+                with self.subTest(url=page_url):
+                    with self.assertQueriesUseIndexes():
+                        self.client.get(page_url)
@@ -0,0 +1,158 @@
+"""Фоновая генерация миниатюр изображений постов.
+
+Миниатюра строится фоновой задачей в пуле процессов воркера и
+сохраняется в `Post.thumbnail`, поэтому отрисовка ленты не обращается к
+Pillow. Та же задача строит варианты изображения разной ширины в AVIF,
+WebP и JPEG (из тех форматов, что умеет сохранять Pillow) для `srcset`:
+перед отрисовкой страницы `attach_image_variants` находит готовые
+варианты всех ее постов одним чтением хранилища ключей.
+
+Одинаковые изображения хранятся одним файлом (`core.storage`), поэтому
+миниатюра строится один раз и достается всем постам с этим файлом.
+Команда `generate_thumbnails` сначала раздает постам уже готовые
+миниатюры, находя их для целой пачки одним чтением хранилища ключей.
+"""
+from django.db import close_old_connections
+from sorl.thumbnail import get_thumbnail
+
+from core.models import Task
+from core.tasks import PROCESS_POOL, enqueue, task
+from core.thumbnails import (
+    get_ready_thumbnails, get_ready_variants, saveable_formats
+)
+from .cache import get_post_scopes, invalidate
+from .constants import (
+    IMAGE_VARIANT_FORMATS, IMAGE_VARIANT_QUALITY, IMAGE_VARIANT_WIDTHS,
+    THUMBNAIL_GEOMETRY
+)
+from .models import Post
+
+THUMBNAIL_OPTIONS = {'crop': 'center', 'upscale': True}
+
+
+def variant_geometry(width):
+    """Геометрия варианта с пропорциями миниатюры."""
+    thumbnail_width, thumbnail_height = map(
+        int, THUMBNAIL_GEOMETRY.split('x')
+    )
+
+    return f'{width}x{round(width * thumbnail_height / thumbnail_width)}'
+
+
+# Варианты не увеличивают маленькие изображения: лишние байты не
+# добавляют четкости.
+VARIANT_SPECS = [
+    (variant_geometry(width), {
+        'crop': 'center',
+        'upscale': False,
+        'format': image_format,
+        'quality': IMAGE_VARIANT_QUALITY,
+    })
+    for image_format in saveable_formats(IMAGE_VARIANT_FORMATS)
+    for width in IMAGE_VARIANT_WIDTHS
+]
+
+
+@task(pool=PROCESS_POOL)
+def generate_thumbnail(post_id):
+    """Строит миниатюру и варианты изображения поста и сохраняет имя
+    миниатюры в посте."""
+    post = Post.objects.filter(pk=post_id).only(
+        'image', 'author', 'group'
+    ).first()
+    if post is None or not post.image:
+        return None
+    thumbnail = get_thumbnail(
+        post.image, THUMBNAIL_GEOMETRY, **THUMBNAIL_OPTIONS
+    )
+    for geometry, options in VARIANT_SPECS:
+        get_thumbnail(post.image, geometry, **options)
+    share_thumbnail(post.image.name, thumbnail.name)
+
+    return thumbnail.name
+
+
+def share_thumbnail(image, thumbnail):
+    """Сохраняет миниатюру во всех постах с этим изображением без нее."""
+    posts = Post.objects.filter(image=image, thumbnail='')
+    scopes = [
+        scope
+        for post_id, author_id, group_id in posts.values_list(
+            'pk', 'author_id', 'group_id'
+        )
+        for scope in get_post_scopes(post_id, author_id, group_id)
+    ]
+    if posts.update(thumbnail=thumbnail):
+        invalidate(*scopes)
+
+
+def share_ready_thumbnails(posts):
+    """Раздает постам уже готовые миниатюры их изображений.
+
+    Возвращает по одному посту на изображение, для которого миниатюры
+    еще нет: построенную миниатюру `generate_thumbnail` раздаст и
+    остальным постам с этим изображением.
+    """
+    ready = get_ready_thumbnails(
+        [post.image for post in posts], THUMBNAIL_GEOMETRY,
+        **THUMBNAIL_OPTIONS
+    )
+    for image, thumbnail in ready.items():
+        share_thumbnail(image, thumbnail.name)
+
+    missing = {}
+    for post in posts:
+        if post.image.name not in ready:
+            missing.setdefault(post.image.name, post)
+
+    return list(missing.values())
+
+
+def attach_image_variants(posts):
+    """Кладет в `post.image_variants` готовые варианты изображений.
+
+    Варианты всех постов ищутся одним чтением хранилища ключей, так что
+    шаблон только форматирует готовые адреса.
+    """
+    posts = [post for post in posts if post.image]
+    variants = get_ready_variants(
+        {post.image.name: post.image for post in posts}.values(),
+        VARIANT_SPECS,
+    )
+    for post in posts:
+        post.image_variants = [
+            variant for variant in variants[post.image.name] if variant
+        ]
+
+
+def run_in_worker(post_id):
+    try:
+        return generate_thumbnail(post_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_thumbnail(post):
+    """Сбрасывает старую миниатюру и ставит пост в очередь генерации.
+
+    Если у другого поста с тем же файлом миниатюра уже есть, пост
+    получает ее сразу.
+    """
+    if post.thumbnail:
+        Post.objects.filter(pk=post.pk).update(thumbnail='')
+        post.thumbnail = ''
+    if not post.image:
+        return
+    ready = Post.objects.filter(image=post.image.name).exclude(
+        thumbnail=''
+    ).values_list('thumbnail', flat=True).first()
+    if ready:
+        share_thumbnail(post.image.name, ready)
+    else:
+        key = f'thumbnail:{post.pk}:{post.image.name}'
+        # Имя файла — хэш содержимого, и после правок A → B → A ключ
+        # повторяется: задача прошлой загрузки уже не должна его занимать.
+        Task.objects.filter(key=key, status__in=(
+            Task.DONE, Task.FAILED
+        )).delete()
+        enqueue(generate_thumbnail, post.pk, key=key)
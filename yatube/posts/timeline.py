@@ -0,0 +1,106 @@
+"""Материализованные ленты подписок (fan-out on write).
+
+Новый пост раскладывается в ленты подписчиков автора, поэтому страница
+`follow_index` читается одним диапазонным запросом по индексу
+`timeline_user_feed_idx`. Посты популярных авторов в ленты не попадают и
+дочитываются при запросе ленты (fan-out on read). Признак популярности
+хранится в `AuthorStats.popular`, так что воркер и веб-процессы видят
+одно и то же. Авторы, однажды ставшие популярными, остаются такими: так
+их посты не теряются, даже если подписчиков стало меньше порога.
+"""
+from itertools import islice
+
+from .constants import TIMELINE_BACKFILL_BATCH, TIMELINE_FANOUT_LIMIT
+from .models import AuthorStats, Follow, Post, TimelineEntry
+
+
+def get_popular_author_ids():
+    """Возвращает множество id авторов, посты которых не раскладываются."""
+    return set(
+        AuthorStats.objects.filter(popular=True).values_list(
+            'user_id', flat=True
+        )
+    )
+
+
+def is_popular(author_id):
+    return AuthorStats.objects.filter(
+        user_id=author_id, popular=True
+    ).exists()
+
+
+def update_popularity(author_id=None):
+    """Помечает популярным автора (по умолчанию всех авторов), набравшего
+    порог подписчиков по счетчику `followers_count`."""
+    stats = AuthorStats.objects.filter(
+        popular=False, followers_count__gte=TIMELINE_FANOUT_LIMIT
+    )
+    if author_id is not None:
+        stats = stats.filter(user_id=author_id)
+    stats.update(popular=True)
+
+
+def get_followed_popular_ids(user):
+    """Возвращает id популярных авторов из подписок пользователя."""
+    return list(
+        Follow.objects.filter(
+            user=user,
+            author_id__in=AuthorStats.objects.filter(popular=True).values(
+                'user_id'
+            ),
+        ).values_list('author_id', flat=True)
+    )
+
+
+def fan_out(post):
+    """Раскладывает новый пост в ленты подписчиков автора."""
+    if is_popular(post.author_id):
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id,
+                post_id=post.pk,
+                author_id=post.author_id,
+                pub_date=post.pub_date,
+            ) for user_id in follower_ids.iterator()
+        ),
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту все посты автора после подписки.
+
+    Как и миграция 0012 для прежних подписок, в ленту попадают все посты,
+    а не только последние. Посты вставляются пачками по
+    `TIMELINE_BACKFILL_BATCH`, не собираясь в памяти целиком.
+    """
+    if is_popular(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).order_by().values_list(
+        'pk', 'pub_date'
+    )
+    entries = (
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        ) for post_id, pub_date in posts.iterator(
+            chunk_size=TIMELINE_BACKFILL_BATCH
+        )
+    )
+    while True:
+        batch = list(islice(entries, TIMELINE_BACKFILL_BATCH))
+        if not batch:
+            return
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def prune(user_id, author_id):
+    """Удаляет из ленты посты автора после отписки."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
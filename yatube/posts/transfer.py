@@ -0,0 +1,365 @@
+"""Потоковые выгрузка и загрузка постов, комментариев и подписок.
+
+Каждая модель пишется в свой файл `<модель>.jsonl`: первая строка —
+заголовок с колонками, дальше по одной строке-массиву JSON на объект.
+Авторы и группы выгружаются рядом и в строках постов, комментариев и
+подписок указываются по username и slug: при загрузке по ним строятся
+таблицы соответствия с id в новой базе. Посты и комментарии сохраняют
+свои id. Файлы читаются и пишутся построчно, так что память не зависит
+от объема данных, а разные модели обрабатываются в отдельных процессах.
+
+Выгрузка пишет в `<модель>.jsonl.part` и переименовывает файл в конце;
+прерванная выгрузка продолжается после последней целой строки. Загрузка
+вставляет объекты пачками через `bulk_create` в обход сигналов и после
+каждой пачки записывает смещение в `<модель>.jsonl.progress`. Пачку,
+сохраненную до записи смещения, повторная вставка пропускает
+(`ignore_conflicts`), как и уже существующих пользователей и группы.
+Поэтому перед загрузкой с начала id постов и комментариев выгрузки
+сверяются с базой: если какие-то из них заняты, загрузка не начинается.
+Ленты, счетчики, рейтинги и поисковый индекс строятся в конце загрузки.
+"""
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from multiprocessing import get_context
+
+import django
+from django.core.cache import cache
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from django.utils.dateparse import parse_datetime
+
+from .constants import TRANSFER_BATCH_SIZE
+from .models import Comment, Follow, Group, Post, User
+from .seeding import explicit_dates, rebuild_derived_data
+
+FORMAT_VERSION = 1
+PART_SUFFIX = '.part'
+PROGRESS_SUFFIX = '.progress'
+# Колонка выгрузки, поле модели и выгрузка, по ключу которой ищется id.
+REFERENCES = {
+    'author__username': ('author_id', 'users'),
+    'user__username': ('user_id', 'users'),
+    'group__slug': ('group_id', 'groups'),
+}
+
+
+class Dump:
+    """Файл выгрузки одной модели.
+
+    Первая колонка всегда `pk`: по ней продолжается прерванная выгрузка.
+    """
+
+    def __init__(self, name, model, columns, natural_key=None,
+                 keep_pk=False):
+        self.name = name
+        self.model = model
+        self.columns = ('pk', *columns)
+        self.natural_key = natural_key
+        self.keep_pk = keep_pk
+
+    def path(self, directory):
+        return os.path.join(directory, f'{self.name}.jsonl')
+
+    def date_fields(self):
+        return [
+            field for field in self.model._meta.concrete_fields
+            if isinstance(field, models.DateTimeField)
+        ]
+
+
+DUMPS = {dump.name: dump for dump in (
+    Dump(
+        'users', User,
+        ('username', 'first_name', 'last_name', 'email', 'password',
+         'is_active', 'date_joined'),
+        natural_key='username',
+    ),
+    Dump('groups', Group, ('slug', 'title', 'description'), 'slug'),
+    Dump(
+        'posts', Post,
+        ('text', 'pub_date', 'author__username', 'group__slug', 'image'),
+        keep_pk=True,
+    ),
+    Dump(
+        'comments', Comment,
+        ('post_id', 'author__username', 'text', 'created'),
+        keep_pk=True,
+    ),
+    Dump('follows', Follow, ('user__username', 'author__username')),
+)}
+# Модели одного этапа загружаются параллельно, этапы — по очереди:
+# посты и подписки ссылаются на пользователей и группы, комментарии — на
+# посты.
+IMPORT_STAGES = (('users', 'groups'), ('posts', 'follows'), ('comments',))
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'Не сериализуется: {value!r}')
+
+
+def _dumps(data):
+    return json.dumps(
+        data, ensure_ascii=False, separators=(',', ':'), default=_encode
+    ) + '\n'
+
+
+def _resume_point(part):
+    """Отрезает недописанную строку и возвращает pk последней целой или
+    None, если выгружать нужно сначала."""
+    if not os.path.exists(part):
+        return None
+    size = count = 0
+    last = None
+    with open(part, 'rb+') as file:
+        for line in file:
+            if not line.endswith(b'\n'):
+                break
+            size += len(line)
+            count += 1
+            last = line
+        file.truncate(size)
+    # Первая строка — заголовок.
+    return json.loads(last)[0] if count > 1 else None
+
+
+def export_model(name, directory, batch_size=TRANSFER_BATCH_SIZE,
+                 restart=False):
+    """Выгружает модель в файл и возвращает (строк, секунд)."""
+    dump = DUMPS[name]
+    path = dump.path(directory)
+    if os.path.exists(path) and not restart:
+        return 0, 0.0
+    part = path + PART_SUFFIX
+    started = time.perf_counter()
+    last_pk = None if restart else _resume_point(part)
+    rows = dump.model.objects.order_by('pk').values_list(*dump.columns)
+    if last_pk is not None:
+        rows = rows.filter(pk__gt=last_pk)
+    total = 0
+    with open(part, 'w' if last_pk is None else 'a',
+              encoding='utf-8') as output:
+        if last_pk is None:
+            output.write(_dumps({
+                'model': name,
+                'version': FORMAT_VERSION,
+                'columns': dump.columns,
+            }))
+        for row in rows.iterator(chunk_size=batch_size):
+            output.write(_dumps(row))
+            total += 1
+    os.replace(part, path)
+
+    return total, time.perf_counter() - started
+
+
+def load_keys(name):
+    """Таблица соответствия естественного ключа и id в текущей базе."""
+    dump = DUMPS[name]
+
+    return dict(dump.model.objects.values_list(
+        dump.natural_key, 'pk'
+    ).iterator())
+
+
+def _lookup(keys, name):
+    def convert(value):
+        if value is None:
+            return None
+        try:
+            return keys[value]
+        except KeyError:
+            raise ValueError(f'В выгрузке {name} нет «{value}»')
+
+    return convert
+
+
+def make_builder(dump, columns):
+    """Функция, собирающая объект модели из строки выгрузки."""
+    keys = {}
+    dates = {field.attname for field in dump.date_fields()}
+    fields = []
+    for column in columns:
+        if column == 'pk':
+            fields.append(('pk', None) if dump.keep_pk else (None, None))
+        elif column in REFERENCES:
+            field, target = REFERENCES[column]
+            if target not in keys:
+                keys[target] = load_keys(target)
+            fields.append((field, _lookup(keys[target], target)))
+        elif column in dates:
+            fields.append((column, parse_datetime))
+        else:
+            fields.append((column, None))
+
+    def build(row):
+        values = {}
+        for (field, convert), value in zip(fields, row):
+            if field is not None:
+                values[field] = convert(value) if convert else value
+
+        return dump.model(**values)
+
+    return build
+
+
+def _read_progress(path):
+    try:
+        with open(path, encoding='utf-8') as progress:
+            return int(progress.read())
+    except FileNotFoundError:
+        return 0
+
+
+def _write_progress(path, offset):
+    with open(path + PART_SUFFIX, 'w', encoding='utf-8') as progress:
+        progress.write(str(offset))
+    os.replace(path + PART_SUFFIX, path)
+
+
+def find_pk_conflicts(name, directory, batch_size=TRANSFER_BATCH_SIZE):
+    """id из выгрузки модели, которые в базе уже заняты."""
+    dump = DUMPS[name]
+    path = dump.path(directory)
+    batch_size = min(
+        batch_size, connection.features.max_query_params or batch_size
+    )
+    conflicts = []
+    with open(path, 'rb') as source:
+        index = json.loads(source.readline())['columns'].index('pk')
+        while True:
+            lines = list(islice(source, batch_size))
+            if not lines:
+                break
+            conflicts.extend(dump.model.objects.filter(
+                pk__in=[json.loads(line)[index] for line in lines]
+            ).values_list('pk', flat=True))
+
+    return conflicts
+
+
+def check_pk_conflicts(directory, names, batch_size=TRANSFER_BATCH_SIZE,
+                       restart=False):
+    """Не дает загрузить с начала объекты, чьи id в базе уже заняты.
+
+    Иначе `ignore_conflicts` молча пропустил бы такие посты, а их
+    комментарии достались бы чужим постам с теми же id. Модели с
+    сохраненным прогрессом не проверяются: занятые id там — пачка этой
+    же загрузки, прерванной до записи смещения.
+    """
+    errors = []
+    for name in names:
+        dump = DUMPS[name]
+        progress = dump.path(directory) + PROGRESS_SUFFIX
+        if not dump.keep_pk or not restart and _read_progress(progress):
+            continue
+        conflicts = find_pk_conflicts(name, directory, batch_size)
+        if conflicts:
+            sample = ', '.join(map(str, sorted(conflicts)[:10]))
+            errors.append(f'{name} — {len(conflicts)} ({sample})')
+    if errors:
+        raise ValueError(f'id из выгрузки уже заняты: {"; ".join(errors)}')
+
+
+def import_model(name, directory, batch_size=TRANSFER_BATCH_SIZE,
+                 restart=False):
+    """Загружает модель из файла и возвращает (строк, секунд)."""
+    dump = DUMPS[name]
+    path = dump.path(directory)
+    progress = path + PROGRESS_SUFFIX
+    offset = 0 if restart else _read_progress(progress)
+    started = time.perf_counter()
+    total = 0
+    auto_dates = [field for field in dump.date_fields() if field.auto_now_add]
+    with open(path, 'rb') as source, explicit_dates(*auto_dates):
+        header = json.loads(source.readline())
+        if header['model'] != name or header['version'] != FORMAT_VERSION:
+            raise ValueError(f'{path}: неизвестный формат выгрузки')
+        build = make_builder(dump, header['columns'])
+        if offset:
+            source.seek(offset)
+        while True:
+            lines = list(islice(source, batch_size))
+            if not lines:
+                break
+            dump.model.objects.bulk_create(
+                [build(json.loads(line)) for line in lines],
+                ignore_conflicts=True,
+            )
+            _write_progress(progress, source.tell())
+            total += len(lines)
+
+    return total, time.perf_counter() - started
+
+
+def run_models(func, names, directory, workers, log, **kwargs):
+    """Выполняет `func` для каждой модели, по процессу на модель.
+
+    Без `workers` модели обрабатываются по очереди в текущем процессе.
+    """
+    if workers and len(names) > 1:
+        # Новые процессы не наследуют соединения с базой родителя.
+        with ProcessPoolExecutor(
+            min(workers, len(names)),
+            mp_context=get_context('spawn'),
+            initializer=django.setup,
+        ) as pool:
+            futures = [
+                (name, pool.submit(func, name, directory, **kwargs))
+                for name in names
+            ]
+            results = [(name, future.result()) for name, future in futures]
+    else:
+        results = [
+            (name, func(name, directory, **kwargs)) for name in names
+        ]
+    for name, (rows, seconds) in results:
+        speed = rows / seconds if seconds else 0
+        log(f'{name}: {rows} строк за {seconds:.1f} с, {speed:.0f} строк/с')
+
+    return sum(rows for _, (rows, _) in results)
+
+
+def export_data(directory, names=tuple(DUMPS), workers=0,
+                batch_size=TRANSFER_BATCH_SIZE, restart=False, log=None):
+    """Выгружает модели в каталог и возвращает число строк."""
+    log = log or (lambda message: None)
+    os.makedirs(directory, exist_ok=True)
+
+    return run_models(
+        export_model, list(names), directory, workers, log,
+        batch_size=batch_size, restart=restart,
+    )
+
+
+def import_data(directory, names=tuple(DUMPS), workers=0,
+                batch_size=TRANSFER_BATCH_SIZE, restart=False, log=None):
+    """Загружает модели из каталога и возвращает число строк."""
+    log = log or (lambda message: None)
+    check_pk_conflicts(directory, names, batch_size, restart)
+    total = 0
+    for stage in IMPORT_STAGES:
+        stage = [name for name in stage if name in names]
+        if stage:
+            total += run_models(
+                import_model, stage, directory, workers, log,
+                batch_size=batch_size, restart=restart,
+            )
+    log('Ленты, счетчики, рейтинги и поисковый индекс')
+    with transaction.atomic():
+        # Посты и комментарии вставлены со своими id: счетчики id в базе
+        # нужно сдвинуть за них.
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                no_style(), [Post, Comment]
+            ):
+                cursor.execute(sql)
+        rebuild_derived_data()
+    cache.clear()
+
+    return total
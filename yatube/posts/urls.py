@@ -1,12 +1,18 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
+    path(
+        'group/<slug:slug>/popular/',
+        views.group_popular,
+        name='group_popular',
+    ),
+    path('popular/', views.popular, name='popular'),
     path('profile/<str:username>/', views.profile, name='profile'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
@@ -14,7 +20,11 @@ urlpatterns = [
     path(
         'posts/<int:post_id>/comment/', views.add_comment, name='add_comment'
     ),
+    path(
+        'posts/<int:post_id>/comments/', views.comments, name='comments'
+    ),
     path('follow/', views.follow_index, name='follow_index'),
+    path('search/', views.search, name='search'),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
@@ -25,4 +35,18 @@ urlpatterns = [
         views.profile_unfollow,
         name='profile_unfollow'
     ),
+    path('api/posts/', api.index, name='api_index'),
+    path('api/group/<slug:slug>/', api.group_posts, name='api_group_list'),
+    path(
+        'api/group/<slug:slug>/export/',
+        api.group_export,
+        name='api_group_export'
+    ),
+    path('api/profile/<str:username>/', api.profile, name='api_profile'),
+    path(
+        'api/profile/<str:username>/export/',
+        api.profile_export,
+        name='api_profile_export'
+    ),
+    path('api/follow/', api.follow_index, name='api_follow_index'),
 ]
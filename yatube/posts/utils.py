@@ -1,15 +1,247 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
 
-from .constants import POSTS_ON_PAGE, POSTS_FOR_PAGINATOR
-from .models import Post
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
 
+from .constants import COMMENTS_ON_PAGE, POSTS_ON_PAGE, POSTS_FOR_PAGINATOR
+from .models import Comment, Post, TimelineEntry
+from .thumbnails import attach_image_variants
+from .timeline import get_followed_popular_ids
 
-def get_pagination(request, posts):
-    """Формирует пагинацию для постов."""
-    paginator = Paginator(posts, POSTS_ON_PAGE)
-    page_number = request.GET.get('page')
+CURSOR_SEPARATOR = '|'
+# Больше целого со знаком в 64 бита не передать в запрос SQLite.
+MAX_PK = 2 ** 63 - 1
 
-    return paginator.get_page(page_number)
+
+def make_cursor(key, pk):
+    """Кодирует позицию (ключ сортировки, pk) в ленте в непрозрачный токен.
+
+    Ключ — дата публикации или другое значение, по которому идет лента.
+    """
+    key = key.isoformat() if hasattr(key, 'isoformat') else repr(key)
+    raw = f'{key}{CURSOR_SEPARATOR}{pk}'
+
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, parse_key=parse_datetime):
+    """Декодирует токен в пару (ключ, pk) или возвращает None."""
+    if not token:
+        return None
+    try:
+        padding = '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(token + padding).decode()
+        key, pk = raw.rsplit(CURSOR_SEPARATOR, 1)
+        key = parse_key(key)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if key is None or not 0 < pk <= MAX_PK:
+        return None
+
+    return key, pk
+
+
+class KeysetPaginator(Paginator):
+    """Пагинатор по ключу (pub_date, id) вместо OFFSET.
+
+    Поле ключа и его разбор из курсора задаются атрибутами `order_field`
+    и `parse_key`. Страница выбирается одним
+    запросом с LIMIT, поэтому ее стоимость не зависит от глубины. Счетчик
+    `count` вычисляется лениво и только при явном обращении к нему.
+    """
+
+    id_field = 'pk'
+    order_field = 'pub_date'
+    parse_key = staticmethod(parse_datetime)
+
+    def __init__(self, object_list, per_page, after=None, before=None):
+        super().__init__(object_list, per_page)
+        self.after = decode_cursor(after, self.parse_key)
+        self.before = (
+            None if self.after else decode_cursor(before, self.parse_key)
+        )
+        self.cursor = (self.after and after) or (self.before and before) or ''
+        self.next_cursor = None
+        self.previous_cursor = None
+
+    @property
+    def number(self):
+        """Условный номер страницы: 1 для первой, 2 для остальных."""
+        return 2 if self.previous_cursor else 1
+
+    @property
+    def num_pages(self):
+        return self.number + 1 if self.next_cursor else self.number
+
+    @property
+    def page_range(self):
+        return range(1, self.num_pages + 1)
+
+    def validate_number(self, number):
+        return number
+
+    def slice(self, queryset, id_field=None):
+        """Выбирает per_page + 1 объектов за курсором, от новых к старым.
+
+        Лишний объект лежит со стороны, в которую листает читатель, и
+        говорит о том, что дальше есть еще страница.
+        """
+        id_field = id_field or self.id_field
+        order_field = self.order_field
+        if self.before:
+            key, pk = self.before
+            queryset = queryset.filter(
+                Q(**{f'{order_field}__gt': key})
+                | Q(**{order_field: key, f'{id_field}__gt': pk})
+            ).order_by(order_field, id_field)
+
+            return list(queryset[:self.per_page + 1])[::-1]
+        if self.after:
+            key, pk = self.after
+            queryset = queryset.filter(
+                Q(**{f'{order_field}__lt': key})
+                | Q(**{order_field: key, f'{id_field}__lt': pk})
+            )
+        queryset = queryset.order_by(f'-{order_field}', f'-{id_field}')
+
+        return list(queryset[:self.per_page + 1])
+
+    def get_window(self):
+        return self.slice(self.object_list)
+
+    def cursor_for(self, item):
+        return make_cursor(getattr(item, self.order_field), item.pk)
+
+    def get_page(self, number=None):
+        posts = self.get_window()
+        has_more = len(posts) > self.per_page
+        if self.before:
+            posts = posts[-self.per_page:]
+            has_previous, has_next = has_more, True
+        else:
+            posts = posts[:self.per_page]
+            has_previous, has_next = bool(self.after), has_more
+        if posts:
+            if has_previous:
+                self.previous_cursor = self.cursor_for(posts[0])
+            if has_next:
+                self.next_cursor = self.cursor_for(posts[-1])
+
+        return Page(posts, self.number, self)
+
+    page = get_page
+
+
+class TimelinePaginator(KeysetPaginator):
+    """Пагинатор ленты подписок поверх материализованной ленты.
+
+    Читает диапазон записей ленты пользователя, добирает тем же курсором
+    посты популярных авторов и загружает посты по первичному ключу.
+    """
+
+    id_field = 'post_id'
+
+    def __init__(self, user, per_page, after=None, before=None):
+        super().__init__(
+            TimelineEntry.objects.filter(user=user),
+            per_page,
+            after=after,
+            before=before,
+        )
+        self.user = user
+
+    def get_window(self):
+        keys = {
+            (entry.pub_date, entry.post_id)
+            for entry in self.slice(self.object_list.only('pub_date', 'post'))
+        }
+        popular_ids = get_followed_popular_ids(self.user)
+        if popular_ids:
+            popular = Post.objects.filter(author_id__in=popular_ids)
+            keys.update(
+                (post.pub_date, post.pk)
+                for post in self.slice(popular.only('pub_date'), 'pk')
+            )
+        keys = sorted(keys, reverse=True)
+        if self.before:
+            keys = keys[-self.per_page - 1:]
+        else:
+            keys = keys[:self.per_page + 1]
+        posts = self.load_posts([post_id for _, post_id in keys])
+
+        return [posts[post_id] for _, post_id in keys if post_id in posts]
+
+    def load_posts(self, post_ids):
+        """Загружает посты окна в словарь по id."""
+        return Post.objects.for_feed().in_bulk(post_ids)
+
+
+class HotPaginator(KeysetPaginator):
+    """Посты по убыванию рейтинга активности по ключу (hot_score, id)."""
+
+    order_field = 'hot_score'
+    parse_key = staticmethod(float)
+
+
+class CommentPaginator(KeysetPaginator):
+    """Комментарии поста от новых к старым по ключу (created, id)."""
+
+    order_field = 'created'
+
+    def __init__(self, post_id, per_page, after=None, before=None):
+        super().__init__(
+            Comment.objects.filter(post_id=post_id).select_related('author'),
+            per_page,
+            after=after,
+            before=before,
+        )
+        self.post_id = post_id
+
+
+def get_pagination(request, posts, paginator_class=KeysetPaginator):
+    """Формирует пагинацию для постов по курсорам ?after= и ?before=.
+
+    Варианты изображений постов страницы находятся сразу для всех.
+    """
+    paginator = paginator_class(
+        posts,
+        POSTS_ON_PAGE,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+    page = paginator.get_page()
+    attach_image_variants(page)
+
+    return page
+
+
+def get_timeline_pagination(request):
+    """Формирует страницу ленты подписок текущего пользователя."""
+    paginator = TimelinePaginator(
+        request.user,
+        POSTS_ON_PAGE,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+    page = paginator.get_page()
+    attach_image_variants(page)
+
+    return page
+
+
+def get_comment_pagination(request, post_id):
+    """Формирует страницу комментариев поста по курсору ?after=."""
+    paginator = CommentPaginator(
+        post_id,
+        COMMENTS_ON_PAGE,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+
+    return paginator.get_page()
 
 
 def posts_bulk_create(
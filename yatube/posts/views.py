@@ -1,26 +1,56 @@
+from django.core.paginator import Paginator
 from django.shortcuts import redirect, render, get_object_or_404
 from django.contrib.auth.decorators import login_required
-
-from .forms import CommentForm, PostForm
+from django.http import Http404
+from django.views.decorators.http import require_GET
+
+from core.cache_control import NO_STORE, PRIVATE, PUBLIC, cache_policy
+from core.db import read_from_replica, write_to_primary
+from .cache import (
+    INDEX_SCOPE, add_scopes, author_scope, cache_anonymous_page, get_version,
+    group_info_scope, group_scope, post_scope
+)
+from .conditional import (
+    conditional_page, group_state, post_state, profile_state
+)
+from .constants import HOT_GROUPS, POSTS_ON_PAGE
+from .forms import CommentForm, PostForm, SearchForm
 from .models import Follow, Group, Post, User
-from .utils import get_pagination
+from .search import search_posts
+from .thumbnails import attach_image_variants, schedule_thumbnail
+from .utils import (
+    HotPaginator, get_comment_pagination, get_pagination,
+    get_timeline_pagination
+)
 
 
+@cache_policy(PUBLIC)
+@read_from_replica
+@cache_anonymous_page
 def index(request):
     """Отображает главную страницу с 10 последними созданными постами."""
-    posts = Post.objects.select_related('group',).all()
+    # Версия для кэша фрагмента тоже берется до чтения ленты.
+    index_version = get_version(INDEX_SCOPE)
+    add_scopes(request, INDEX_SCOPE)
+    posts = Post.objects.for_feed()
     page_obj = get_pagination(request, posts)
     context = {
         "page_obj": page_obj,
+        "index_version": index_version,
     }
 
     return render(request, 'posts/index.html', context)
 
 
+@cache_policy(PUBLIC)
+@read_from_replica
+@conditional_page(group_state)
+@cache_anonymous_page
 def group_posts(request, slug):
     """Отображает все посты выбранной категории в порядке убывания по дате."""
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
+    add_scopes(request, group_scope(group.pk))
+    posts = group.posts.for_feed()
     page_obj = get_pagination(request, posts)
     context = {
         'group': group,
@@ -30,10 +60,17 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@cache_policy(PUBLIC)
+@read_from_replica
+@conditional_page(profile_state)
+@cache_anonymous_page
 def profile(request, username):
     """Отображает профиль зарегистрированного пользователя."""
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    add_scopes(request, author_scope(author.pk))
+    posts = author.posts.for_feed()
     page_obj = get_pagination(request, posts)
     context = {
         'author': author,
@@ -48,10 +85,21 @@ def profile(request, username):
     return render(request, 'posts/profile.html', context)
 
 
+@cache_policy(PUBLIC)
+@read_from_replica
+@conditional_page(post_state)
+@cache_anonymous_page
 def post_detail(request, post_id):
     """Отображает выбранный пост."""
-    post = get_object_or_404(Post, pk=post_id)
-    comments = post.comments.all()
+    add_scopes(request, post_scope(post_id))
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id
+    )
+    comments = get_comment_pagination(request, post.pk)
+    attach_image_variants([post])
+    add_scopes(request, author_scope(post.author_id))
+    if post.group_id:
+        add_scopes(request, group_info_scope(post.group_id))
     form = CommentForm()
     context = {
         'post': post,
@@ -62,7 +110,52 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+@cache_policy(PUBLIC)
+@read_from_replica
+@conditional_page(post_state)
+@cache_anonymous_page
+@require_GET
+def comments(request, post_id):
+    """Отдает фрагмент со следующей порцией комментариев поста."""
+    add_scopes(request, post_scope(post_id))
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404
+    context = {'comments': get_comment_pagination(request, post_id)}
+
+    return render(request, 'posts/includes/comment_list.html', context)
+
+
+@cache_policy(PUBLIC)
+@read_from_replica
+def popular(request):
+    """Отображает самые активные посты и группы."""
+    posts = Post.objects.for_feed()
+    hot_groups = Group.objects.order_by('-hot_score', '-pk')[:HOT_GROUPS]
+    context = {
+        'page_obj': get_pagination(request, posts, HotPaginator),
+        'hot_groups': hot_groups,
+    }
+
+    return render(request, 'posts/popular.html', context)
+
+
+@cache_policy(PUBLIC)
+@read_from_replica
+def group_popular(request, slug):
+    """Отображает самые активные посты группы."""
+    group = get_object_or_404(Group, slug=slug)
+    posts = group.posts.for_feed()
+    context = {
+        'group': group,
+        'page_obj': get_pagination(request, posts, HotPaginator),
+    }
+
+    return render(request, 'posts/popular.html', context)
+
+
+@cache_policy(NO_STORE)
 @login_required
+@write_to_primary
 def post_create(request):
     """Отображает форму для создания новой записи."""
     form = PostForm(request.POST or None, files=request.FILES or None)
@@ -70,13 +163,16 @@ def post_create(request):
         new_post = form.save(commit=False)
         new_post.author = request.user
         new_post.save()
+        schedule_thumbnail(new_post)
 
         return redirect('posts:profile', request.user.username)
 
     return render(request, 'posts/create_post.html', {'form': form})
 
 
+@cache_policy(NO_STORE)
 @login_required
+@write_to_primary
 def post_edit(request, post_id):
     """Редактирование выбранного поста."""
     post = get_object_or_404(Post, pk=post_id)
@@ -91,6 +187,8 @@ def post_edit(request, post_id):
     )
     if request.method == 'POST' and form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            schedule_thumbnail(post)
 
         return redirect('posts:post_detail', post.pk)
 
@@ -101,7 +199,9 @@ def post_edit(request, post_id):
     return render(request, 'posts/create_post.html', context)
 
 
+@cache_policy(NO_STORE)
 @login_required
+@write_to_primary
 def add_comment(request, post_id):
     """Написание комметариев к постам."""
     post = get_object_or_404(Post, pk=post_id)
@@ -115,11 +215,12 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@cache_policy(PRIVATE)
+@read_from_replica
 @login_required
 def follow_index(request):
     """Отображает посты авторов из подписок пользователя."""
-    posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = get_pagination(request, posts)
+    page_obj = get_timeline_pagination(request)
     context = {
         'page_obj': page_obj
     }
@@ -127,7 +228,32 @@ def follow_index(request):
     return render(request, 'posts/follow.html', context)
 
 
+@cache_policy(PUBLIC)
+def search(request):
+    """Ищет посты по тексту с фильтрами по группе и автору."""
+    form = SearchForm(request.GET or None)
+    context = {'form': form}
+    if form.is_valid():
+        group = form.cleaned_data['group']
+        author = form.cleaned_data['author']
+        results = search_posts(
+            form.cleaned_data['q'],
+            group_id=group.pk if group else None,
+            author_id=author.pk if author else None,
+        )
+        paginator = Paginator(results, POSTS_ON_PAGE)
+        params = request.GET.copy()
+        params.pop('page', None)
+        context['page_obj'] = paginator.get_page(request.GET.get('page'))
+        attach_image_variants(context['page_obj'])
+        context['query_string'] = params.urlencode()
+
+    return render(request, 'posts/search.html', context)
+
+
+@cache_policy(NO_STORE)
 @login_required
+@write_to_primary
 def profile_follow(request, username):
     """Подписка на интересного и забавного автора."""
     author = get_object_or_404(User, username=username)
@@ -139,7 +265,9 @@ def profile_follow(request, username):
     return redirect('posts:profile', author.username)
 
 
+@cache_policy(NO_STORE)
 @login_required
+@write_to_primary
 def profile_unfollow(request, username):
     """Отписка от надоеливого или скучного автора."""
     author = get_object_or_404(User, username=username)
@@ -5,62 +5,73 @@ from django.contrib.auth.views import (
 )
 from django.urls import path
 
+from core.cache_control import NO_STORE, cache_policy
+from core.db import write_to_primary
 from . import views
 
 app_name = 'users'
 
+# Формы с CSRF-токеном и страницы сессии не кэшируются нигде.
+no_store = cache_policy(NO_STORE)
+
 urlpatterns = [
-    path('signup/', views.SignUp.as_view(), name='signup'),
+    path(
+        'signup/',
+        no_store(write_to_primary(views.SignUp.as_view())),
+        name='signup'
+    ),
     path(
         'logout/',
-        LogoutView.as_view(template_name='users/logged_out.html'),
+        no_store(LogoutView.as_view(template_name='users/logged_out.html')),
         name='logout'
     ),
     path(
         'login/',
-        LoginView.as_view(template_name='users/login.html'),
+        no_store(write_to_primary(
+            LoginView.as_view(template_name='users/login.html')
+        )),
         name='login'
     ),
     path(
         'password_change/',
-        PasswordChangeView.as_view(
+        no_store(write_to_primary(PasswordChangeView.as_view(
             template_name='users/password_change_form.html'
-        ),
+        ))),
         name='password_change_form'
     ),
     path(
         'password_change/done/',
-        PasswordChangeDoneView.as_view(
+        no_store(PasswordChangeDoneView.as_view(
             template_name='users/password_change_done.html'
-        ),
+        )),
         name='password_change_done'
     ),
     path(
         'password_reset/',
-        PasswordResetView.as_view(
+        no_store(PasswordResetView.as_view(
             template_name='users/password_reset_form.html'
-        ),
+        )),
         name='password_reset_form'
     ),
     path(
         'password_reset/done',
-        PasswordResetDoneView.as_view(
+        no_store(PasswordResetDoneView.as_view(
             template_name='users/password_reset_done.html'
-        ),
+        )),
         name='password_reset_done'
     ),
     path(
         'reset/<uidb64>/<token>/',
-        PasswordResetConfirmView.as_view(
+        no_store(write_to_primary(PasswordResetConfirmView.as_view(
             template_name='users/password_reset_confirm.html'
-        ),
+        ))),
         name='password_reset_confirm'
     ),
     path(
         'reset/done/',
-        PasswordResetCompleteView.as_view(
+        no_store(PasswordResetCompleteView.as_view(
             template_name='users/password_reset_complete.html'
-        ),
+        )),
         name='password_reset_complete'
     ),
 ]
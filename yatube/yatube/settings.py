@@ -26,23 +26,37 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.auth.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
 
+# Без DEBUG шаблоны компилируются один раз на процесс и прогреваются при
+# старте (см. yatube/wsgi.py). TEMPLATE_CACHE=1 включает это и при DEBUG.
+TEMPLATE_CACHE = os.getenv('TEMPLATE_CACHE', '0' if DEBUG else '1') == '1'
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if TEMPLATE_CACHE:
+    TEMPLATE_LOADERS = [
+        ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+    ]
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backends.TimedDjangoTemplates',
+        'NAME': 'django',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -63,12 +77,63 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения лент: пути к копиям базы через запятую.
+DATABASE_REPLICAS = []
+for number, name in enumerate(
+    filter(None, os.getenv('DATABASE_REPLICAS', '').split(','))
+):
+    DATABASES[f'replica_{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{number}')
+DATABASE_ROUTERS = ['core.db.ReplicaRouter']
+# Сколько секунд после записи сессия читает только из основной базы.
+REPLICA_STICKY_SECONDS = 10
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.LocMemCache',
     }
 }
 
+# Общий кэш для нескольких процессов: redis://host:port/db
+REDIS_LOCATION = os.getenv('REDIS_LOCATION')
+if REDIS_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.TwoTierCache',
+            'OPTIONS': {
+                'SHARED': 'shared',
+                'LOCAL_MAX_ENTRIES': 1000,
+                'LOCAL_TIMEOUT': 5,
+                'GENERATION_CHECK_INTERVAL': 1,
+            },
+        },
+        'shared': {
+            'BACKEND': 'core.cache.RedisCache',
+            'LOCATION': REDIS_LOCATION,
+        },
+    }
+
+# cached_db читает сессию из кэша и пишет ее и в базу; signed_cookies
+# хранит сессию в подписанной cookie и не обращается ни к базе, ни к кэшу,
+# но выход не отзывает скопированную cookie. Без REDIS_LOCATION кэш у
+# каждого процесса свой: выход в одном процессе не дошел бы до остальных,
+# поэтому сессии тогда хранятся только в базе.
+SESSION_BACKEND = os.getenv(
+    'SESSION_BACKEND', 'cached_db' if REDIS_LOCATION else 'db'
+)
+SESSION_ENGINE = f'django.contrib.sessions.backends.{SESSION_BACKEND}'
+# Локальный уровень TwoTierCache помнил бы удаленную сессию еще секунды.
+SESSION_CACHE_ALIAS = 'shared' if REDIS_LOCATION else 'default'
+# Пользователи сессий в памяти процесса (см. core/auth.py); версии
+# пользователей хранятся в общем кэше USER_CACHE, без него кэш выключен.
+USER_CACHE = 'shared' if REDIS_LOCATION else None
+USER_CACHE_SIZE = 1000
+USER_CACHE_TIMEOUT = 300
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -107,5 +172,28 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
+# Загрузки больше FILE_UPLOAD_MAX_MEMORY_SIZE пишутся на диск кусками и
+# обрезаются на FILE_UPLOAD_MAX_SIZE (см. core/uploads.py).
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'core.uploads.BoundedUploadHandler',
+]
+FILE_UPLOAD_MAX_SIZE = 25 * 1024 * 1024
+IMAGE_MAX_PIXELS = 50_000_000
+# Фото с телефона (4032x3024) декодируется в режиме draft вдвое меньшим.
+IMAGE_MAX_SIDE = 1920
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Записи миниатюр в памяти процесса и пакетное чтение (см.
+# core/thumbnails.py).
+THUMBNAIL_BACKEND = 'core.thumbnails.ThumbnailBackend'
+THUMBNAIL_KVSTORE = 'core.thumbnails.KVStore'
+THUMBNAIL_MEMO_SIZE = 10000
+THUMBNAIL_MEMO_TIMEOUT = 60
+THUMBNAIL_MISS_TIMEOUT = 30
+
+# Без воркера (manage.py run_tasks) фоновые задачи выполняются сразу
+# в потоке запроса.
+TASKS_EAGER = os.getenv('TASKS_EAGER', '1' if DEBUG else '0') == '1'
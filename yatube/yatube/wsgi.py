@@ -5,3 +5,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
 application = get_wsgi_application()
+
+# Импорт после настройки Django: шаблоны компилируются до первого запроса.
+from core.template_backends import warm_up_templates  # noqa: E402
+
+warm_up_templates()